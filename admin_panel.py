@@ -5,11 +5,14 @@ import json
 import logging
 import csv
 import io
+import time
 import asyncio
+import functools
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
-from telegram.error import TelegramError
+from telegram.error import TelegramError, BadRequest
+from telegram.helpers import escape_markdown
 
 # --- کتابخانه‌های جدید برای ویژگی‌های اضافه شده ---
 import matplotlib
@@ -22,9 +25,28 @@ import platform
 
 # --- تنظیمات ---
 ADMIN_IDS = list(map(int, os.environ.get("ADMIN_IDS", "").split(','))) if os.environ.get("ADMIN_IDS") else []
+# فاصله بررسی سازگاری شاخص‌های حافظه با داده‌ها (ثانیه)
+INDEX_CHECK_INTERVAL = int(os.environ.get("INDEX_CHECK_INTERVAL", 3600))
+# ارسال برنامه‌ریزی شده‌ای که این مدت (ثانیه) بدون پیشرفت در وضعیت sending بماند دوباره pending می‌شود
+BROADCAST_CLAIM_TIMEOUT = int(os.environ.get("BROADCAST_CLAIM_TIMEOUT", 600))
+# پیشرفت ارسال پس از هر این تعداد گیرنده ذخیره و زمان برداشتن آن تمدید می‌شود
+BROADCAST_CHECKPOINT_EVERY = 50
+# صفحه‌بندی لیست کاربران: تعداد در هر صفحه، مدت اعتبار و تعداد نسخه‌های ثابت هر ادمین
+USERS_PER_PAGE = 20
+USERS_LIST_SESSION_TTL = 1800
+USERS_LIST_MAX_SESSIONS = 3
+# جستجوی کاربران: حداکثر نتایج و تعداد در هر صفحه (محدودیت طول پیام تلگرام)
+SEARCH_MAX_RESULTS = 1000
+SEARCH_RESULTS_PER_PAGE = 10
 
 # وارد کردن مدیر داده‌ها
 import data_manager
+import log_utils
+import profiler
+import memory_stats
+import monitoring
+import overload
+import ban_filter
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +54,7 @@ logger = logging.getLogger(__name__)
 
 def admin_only(func):
     """این دکوراتور تضمین می‌کند که فقط ادمین‌ها بتوانند دستور را اجرا کنند."""
+    @functools.wraps(func)
     async def wrapped(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         if update.effective_user.id not in ADMIN_IDS:
             await update.message.reply_text("⛔️ شما دسترسی لازم برای اجرای این دستور را ندارید.")
@@ -46,18 +69,20 @@ async def admin_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش تمام دستورات موجود ادمین."""
     commands_text = (
         "📋 **دستورات ادمین ربات:**\n\n"
-        "📊 `/stats` - نمایش آمار ربات\n"
+        "📊 `/stats [5m/1h/all]` - نمایش آمار ربات و زمان پاسخ هندلرها\n"
         "📢 `/broadcast [پیام]` - ارسال پیام به تمام کاربران\n"
         "🎯 `/targeted_broadcast [معیار] [مقدار] [پیام]` - ارسال پیام هدفمند\n"
         "📅 `/schedule_broadcast [YYYY-MM-DD] [HH:MM] [پیام]` - ارسال برنامه‌ریزی شده\n"
         "📋 `/list_scheduled` - نمایش لیست ارسال‌های برنامه‌ریزی شده\n"
         "🗑️ `/remove_scheduled [شماره]` - حذف ارسال برنامه‌ریزی شده\n"
-        "🚫 `/ban [آیدی]` - مسدود کردن کاربر\n"
-        "✅ `/unban [آیدی]` - رفع مسدودیت کاربر\n"
+        "🚫 `/ban [آیدی]` - مسدود کردن سراسری کاربر (در چت خصوصی)\n"
+        "✅ `/unban [آیدی]` - رفع مسدودیت سراسری کاربر (در چت خصوصی)\n"
+        "📶 `/ban_status [آیدی]` - پیشرفت اعمال بن در گروه‌های کاربر\n"
         "💌 `/direct_message [آیدی] [پیام]` - ارسال پیام مستقیم به کاربر\n"
         "ℹ️ `/user_info [آیدی]` - نمایش اطلاعات کاربر\n"
-        "📝 `/logs` - نمایش آخرین لاگ‌ها\n"
-        "📂 `/logs_file` - دانلود فایل کامل لاگ‌ها\n"
+        "📝 `/logs [تعداد] [سطح] [عبارت]` - نمایش آخرین لاگ‌ها با فیلتر\n"
+        "📂 `/logs_file` - دانلود فایل فشرده لاگ‌ها\n"
+        "🕒 `/logs_range [از] [تا] [سطح]` - جستجوی لاگ‌ها در بازه زمانی\n"
         "👥 `/users_list [صفحه]` - نمایش لیست کاربران\n"
         "🔍 `/user_search [نام]` - جستجوی کاربر بر اساس نام\n"
         "💾 `/backup` - ایجاد نسخه پشتیبان از داده‌ها\n"
@@ -69,9 +94,11 @@ async def admin_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🚫 `/add_blocked_word [کلمه]` - افزودن کلمه مسدود\n"
         "✅ `/remove_blocked_word [کلمه]` - حذف کلمه مسدود\n"
         "📜 `/list_blocked_words` - نمایش لیست کلمات مسدود\n"
-        "💻 `/system_info` - نمایش اطلاعات سیستم\n"
-        "🔄 `/reset_stats [messages/all]` - ریست کردن آمار\n"
-        "🏆 `/leaderboard` - نمایش جدول امتیازات کاربران\n"
+        "💻 `/system_info [chart]` - نمایش اطلاعات سیستم و تاریخچه منابع\n"
+        "🔬 `/profile [ثانیه]` - پروفایل نمونه‌برداری از ربات\n"
+        "🧠 `/memory [trace start|diff|stop]` - مصرف حافظه هر بخش داده و رشد تخصیص‌ها\n"
+        "🔄 `/reset_stats [messages/latency/all]` - ریست کردن آمار\n"
+        "🏆 `/leaderboard [تعداد] [آیدی گروه]` - نمایش جدول امتیازات کاربران (کل یا یک گروه)\n"
         "🎯 `/add_command [دستور] [پاسخ]` - افزودن دستور سفارشی\n"
         "🗑️ `/remove_command [دستور]` - حذف دستور سفارشی\n"
         "📋 `/list_commands` - نمایش لیست دستورات سفارشی\n"
@@ -98,26 +125,30 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     total_messages = data_manager.DATA['stats']['total_messages']
     banned_count = len(data_manager.DATA['banned_users'])
     
-    now = datetime.now()
-    active_24h = sum(1 for user in data_manager.DATA['users'].values() 
-                    if 'last_seen' in user and 
-                    datetime.strptime(user['last_seen'], '%Y-%m-%d %H:%M:%S') > now - timedelta(hours=24))
-    
-    active_7d = sum(1 for user in data_manager.DATA['users'].values() 
-                   if 'last_seen' in user and 
-                   datetime.strptime(user['last_seen'], '%Y-%m-%d %H:%M:%S') > now - timedelta(days=7))
+    active_24h = data_manager.count_active_users(1)
+    active_7d = data_manager.count_active_users(7)
 
-    active_users = sorted(
-        data_manager.DATA['users'].items(),
-        key=lambda item: item[1].get('last_seen', ''),
-        reverse=True
-    )[:5]
+    active_users = data_manager.get_recent_users(0, 5)
 
     active_users_text = "\n".join(
         [f"• {user_id}: {info.get('first_name', 'N/A')} (آخرین فعالیت: {info.get('last_seen', 'N/A')})"
          for user_id, info in active_users]
     )
 
+    # آمار زمان پاسخ هندلرها در پنجره انتخاب شده (5m، 1h یا all)
+    window = context.args[0].lower() if context.args and context.args[0].lower() in ('5m', '1h', 'all') else '5m'
+    response_stats = data_manager.get_response_stats(window)
+    busiest = sorted(
+        ((handler, sketch) for handler, sketch in response_stats.items() if sketch.count),
+        key=lambda item: item[1].count,
+        reverse=True
+    )[:8]
+    latency_text = "\n".join(
+        [f"• `{handler}`: n={sketch.count} | p50 `{sketch.quantile(0.5)*1000:.0f}ms` | "
+         f"p95 `{sketch.quantile(0.95)*1000:.0f}ms` | p99 `{sketch.quantile(0.99)*1000:.0f}ms`"
+         for handler, sketch in busiest]
+    ) or "داده‌ای ثبت نشده است."
+
     text = (
         f"📊 **آمار ربات**\n\n"
         f"👥 **تعداد کل کاربران:** `{total_users}`\n"
@@ -125,7 +156,8 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"🚫 **کاربران مسدود شده:** `{banned_count}`\n"
         f"🟢 **کاربران فعال 24 ساعت گذشته:** `{active_24h}`\n"
         f"🟢 **کاربران فعال 7 روز گذشته:** `{active_7d}`\n\n"
-        f"**۵ کاربر اخیر فعال:**\n{active_users_text}"
+        f"**۵ کاربر اخیر فعال:**\n{active_users_text}\n\n"
+        f"⏱️ **زمان پاسخ هندلرها ({window}):**\n{latency_text}"
     )
     await update.message.reply_text(text, parse_mode='Markdown')
 
@@ -260,11 +292,12 @@ async def admin_schedule_broadcast(update: Update, context: ContextTypes.DEFAULT
             await update.message.reply_text("⚠️ زمان برنامه‌ریزی شده باید در آینده باشد.")
             return
         
-        data_manager.DATA['scheduled_broadcasts'].append({
+        new_broadcast = {
             'time': scheduled_time.strftime('%Y-%m-%d %H:%M:%S'),
             'message': message_text,
             'status': 'pending'
-        })
+        }
+        data_manager.update_in('scheduled_broadcasts', lambda broadcasts: broadcasts + [new_broadcast], default=[])
         data_manager.save_data()
         
         await update.message.reply_text(f"✅ پیام برای زمان `{scheduled_time.strftime('%Y-%m-%d %H:%M')}` برنامه‌ریزی شد.")
@@ -299,7 +332,7 @@ async def admin_remove_scheduled_broadcast(update: Update, context: ContextTypes
         await update.message.reply_text("⚠️ شماره ارسال برنامه‌ریزی شده نامعتبر است.")
         return
     
-    removed_broadcast = data_manager.DATA['scheduled_broadcasts'].pop(index)
+    removed_broadcast = data_manager.delete_in(('scheduled_broadcasts', index))
     data_manager.save_data()
     
     await update.message.reply_text(f"✅ ارسال برنامه‌ریزی شده برای زمان `{removed_broadcast['time']}` حذف شد.")
@@ -323,6 +356,9 @@ async def admin_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     data_manager.ban_user(user_id_to_ban)
     
+    # اعمال بن در تمام گروه‌هایی که کاربر در آن‌ها دیده شده (در پس‌زمینه با محدودیت نرخ)
+    ban_filter.schedule_propagation(context.application, user_id_to_ban, update.effective_chat.id)
+    
     # ارسال پیام به کاربر مسدود شده
     try:
         await context.bot.send_message(
@@ -332,7 +368,26 @@ async def admin_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except TelegramError as e:
         logger.warning(f"Could not send ban notification to user {user_id_to_ban}: {e}")
 
-    await update.message.reply_text(f"✅ کاربر `{user_id_to_ban}` با موفقیت مسدود شد.", parse_mode='Markdown')
+    await update.message.reply_text(
+        f"✅ کاربر `{user_id_to_ban}` با موفقیت مسدود شد.\n"
+        f"👥 اعمال بن در `{len(data_manager.get_user_chats(user_id_to_ban))}` گروه آغاز شد؛ "
+        f"پیشرفت: `/ban_status {user_id_to_ban}`",
+        parse_mode='Markdown'
+    )
+
+@admin_only
+async def admin_ban_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """پیشرفت آخرین اعمال بن سراسری یک کاربر (یا تمام کاربران) در گروه‌ها."""
+    if context.args and context.args[0].isdigit():
+        user_ids = [int(context.args[0])]
+    else:
+        user_ids = list(ban_filter.PROPAGATIONS)[-5:]
+    reports = [ban_filter.format_progress(user_id, ban_filter.PROPAGATIONS[user_id])
+               for user_id in user_ids if user_id in ban_filter.PROPAGATIONS]
+    if not reports:
+        await update.message.reply_text("ℹ️ اعمال بنی برای این کاربر ثبت نشده است.")
+        return
+    await update.message.reply_text("\n\n".join(reports), parse_mode='Markdown')
 
 @admin_only
 async def admin_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -348,6 +403,7 @@ async def admin_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     data_manager.unban_user(user_id_to_unban)
+    await ban_filter.lift_restrictions(context.bot, user_id_to_unban)
 
     # ارسال پیام به کاربر برای رفع مسدودیت
     try:
@@ -424,21 +480,34 @@ async def admin_userinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 @admin_only
 async def admin_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """آخرین خطوط لاگ ربات را ارسال می‌کند."""
+    """آخرین خطوط لاگ ربات را با امکان فیلتر سطح و متن ارسال می‌کند."""
+    # فرمت: /logs [تعداد] [سطح] [عبارت]
+    count = 30
+    min_level = None
+    filter_words = []
+    for arg in context.args or []:
+        if arg.isdigit() and count == 30 and not filter_words:
+            count = max(1, min(int(arg), 500))
+        elif arg.upper() in log_utils.LOG_LEVELS and min_level is None and not filter_words:
+            min_level = arg.upper()
+        else:
+            filter_words.append(arg)
+    contains = " ".join(filter_words) or None
+
     try:
-        with open(data_manager.LOG_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            last_lines = lines[-30:]
-            log_text = "".join(last_lines)
-            if not log_text:
-                await update.message.reply_text("فایل لاگ خالی است.")
-                return
-            
-            if len(log_text) > 4096:
-                for i in range(0, len(log_text), 4096):
-                    await update.message.reply_text(f"```{log_text[i:i+4096]}```", parse_mode='Markdown')
+        lines = await asyncio.to_thread(log_utils.tail_log, data_manager.LOG_FILE, count, min_level, contains)
+        log_text = "\n".join(lines)
+        if not log_text:
+            if min_level or contains:
+                await update.message.reply_text("هیچ لاگی با فیلتر مشخص شده یافت نشد.")
             else:
-                await update.message.reply_text(f"```{log_text}```", parse_mode='Markdown')
+                await update.message.reply_text("فایل لاگ خالی است.")
+            return
+
+        # جا گذاشتن فضا برای ``` در محدودیت 4096 کاراکتری تلگرام
+        chunk_size = 4000
+        for i in range(0, len(log_text), chunk_size):
+            await update.message.reply_text(f"```{log_text[i:i+chunk_size]}```", parse_mode='Markdown')
 
     except FileNotFoundError:
         await update.message.reply_text("فایل لاگ یافت نشد.")
@@ -447,97 +516,180 @@ async def admin_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 @admin_only
 async def admin_logs_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """فایل کامل لاگ ربات را ارسال می‌کند."""
+    """فایل کامل لاگ ربات را به صورت فشرده (gzip) ارسال می‌کند."""
     try:
+        compressed = await asyncio.to_thread(log_utils.gzip_file, data_manager.LOG_FILE)
         await update.message.reply_document(
-            document=open(data_manager.LOG_FILE, 'rb'),
-            caption="📂 فایل کامل لاگ‌های ربات"
+            document=compressed,
+            filename=f"{os.path.basename(data_manager.LOG_FILE)}.gz",
+            caption="📂 فایل کامل لاگ‌های ربات (فشرده)"
         )
     except FileNotFoundError:
         await update.message.reply_text("فایل لاگ یافت نشد.")
     except Exception as e:
         await update.message.reply_text(f"خطایی در ارسال فایل لاگ رخ داد: {e}")
 
+def _parse_log_time(value: str) -> datetime:
+    """زمان ورودی دستور logs_range را تبدیل می‌کند (YYYY-MM-DDTHH:MM[:SS] یا HH:MM[:SS] برای امروز)."""
+    value = value.replace('_', 'T')
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    for fmt in ('%H:%M:%S', '%H:%M'):
+        try:
+            parsed = datetime.strptime(value, fmt)
+            return datetime.combine(datetime.now().date(), parsed.time())
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+@admin_only
+async def admin_logs_range(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """لاگ‌های یک بازه زمانی مشخص را (شامل فایل‌های چرخیده شده) ارسال می‌کند."""
+    if len(context.args) < 2:
+        await update.message.reply_text("⚠️ فرمت صحیح: `/logs_range [از] [تا] [سطح]`\n"
+                                       "مثال: `/logs_range 2024-01-01T10:00 2024-01-01T10:30 ERROR` یا `/logs_range 10:00 10:30`")
+        return
+
+    try:
+        start = _parse_log_time(context.args[0])
+        end = _parse_log_time(context.args[1])
+    except ValueError:
+        await update.message.reply_text("⚠️ فرمت زمان نامعتبر است. از YYYY-MM-DDTHH:MM یا HH:MM استفاده کنید.")
+        return
+
+    if end < start:
+        await update.message.reply_text("⚠️ زمان پایان باید بعد از زمان شروع باشد.")
+        return
+
+    min_level = None
+    if len(context.args) > 2:
+        min_level = context.args[2].upper()
+        if min_level not in log_utils.LOG_LEVELS:
+            await update.message.reply_text(f"⚠️ سطح نامعتبر است. سطوح موجود: {', '.join(log_utils.LOG_LEVELS)}")
+            return
+
+    try:
+        preview, compressed, count = await asyncio.to_thread(
+            log_utils.export_log_range, data_manager.LOG_FILE, start, end, min_level
+        )
+    except Exception as e:
+        await update.message.reply_text(f"خطایی در جستجوی لاگ رخ داد: {e}")
+        return
+
+    if count == 0:
+        await update.message.reply_text("هیچ لاگی در بازه زمانی مشخص شده یافت نشد.")
+    elif preview is not None:
+        await update.message.reply_text(f"```{preview}```", parse_mode='Markdown')
+    else:
+        await update.message.reply_document(
+            document=compressed,
+            filename=f"logs_{start.strftime('%Y%m%d_%H%M%S')}_{end.strftime('%Y%m%d_%H%M%S')}.log.gz",
+            caption=f"📂 {count} رکورد لاگ از {start} تا {end}"
+        )
+
 @admin_only
 async def admin_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """نمایش لیست کامل کاربران با صفحه‌بندی."""
-    users = data_manager.DATA['users']
-    
     page = 1
     if context.args and context.args[0].isdigit():
         page = int(context.args[0])
-        if page < 1: page = 1
-    
-    users_per_page = 20
-    total_users = len(users)
-    total_pages = (total_users + users_per_page - 1) // users_per_page
-    
-    if page > total_pages: page = total_pages
-    
-    start_idx = (page - 1) * users_per_page
-    end_idx = min(start_idx + users_per_page, total_users)
     
-    sorted_users = sorted(users.items(), key=lambda item: item[1].get('last_seen', ''), reverse=True)
+    session_id, snapshot = _new_list_session(context, 'users_list', data_manager.get_recent_user_ids())
+    text, reply_markup = _render_users_page(snapshot, session_id, page)
+    await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+
+def _new_list_session(context: ContextTypes.DEFAULT_TYPE, kind: str, items):
+    """نتیجه یک لیست (ترتیب کاربران یا نتایج جستجو) را برای صفحه‌بندی این ادمین ثابت می‌کند تا ورق زدن
+    پایدار و بدون محاسبه مجدد باشد."""
+    sessions = context.user_data.setdefault(f'{kind}_sessions', {})
+    session_id = context.user_data.get(f'{kind}_next_session', 1)
+    context.user_data[f'{kind}_next_session'] = session_id + 1
+    sessions[session_id] = (time.time(), items)
+    # فقط چند نسخه اخیر و نسخه‌های منقضی نشده نگهداری می‌شوند
+    now = time.time()
+    for old_id in [sid for sid, (created, _) in sessions.items() if now - created > USERS_LIST_SESSION_TTL]:
+        del sessions[old_id]
+    for old_id in sorted(sessions)[:-USERS_LIST_MAX_SESSIONS]:
+        del sessions[old_id]
+    return session_id, items
+
+def _get_list_session(context: ContextTypes.DEFAULT_TYPE, kind: str, session_id):
+    session = context.user_data.get(f'{kind}_sessions', {}).get(session_id)
+    return session[1] if session is not None else None
+
+def _parse_page_callback(data: str):
+    """(شناسه نسخه، صفحه) از callback_data؛ دکمه‌های قدیمی (پیشوند:صفحه) نسخه ثابت ندارند."""
+    parts = data.split(":")
+    return (int(parts[1]), int(parts[2])) if len(parts) == 3 else (None, int(parts[1]))
+
+def _page_keyboard(kind: str, session_id: int, page: int, total_pages: int) -> InlineKeyboardMarkup:
+    def button(label: str, target: int):
+        return InlineKeyboardButton(label, callback_data=f"{kind}:{session_id}:{target}")
+    
+    navigation = []
+    if page > 1:
+        navigation += [button("⏮", 1), button("⬅️", page - 1)]
+    navigation.append(button(f"{page}/{total_pages}", page))
+    if page < total_pages:
+        navigation += [button("➡️", page + 1), button("⏭", total_pages)]
+    jumps = [button(f"{step:+d}", page + step) for step in (-100, -10, 10, 100) if 1 <= page + step <= total_pages]
+    return InlineKeyboardMarkup([navigation] + ([jumps] if jumps else []))
+
+def _user_row(user_id: str, prefix: str = "") -> str:
+    user_info = data_manager.DATA['users'].get(user_id, {})
+    is_banned = "🚫" if int(user_id) in data_manager.DATA['banned_users'] else "✅"
+    # نام‌ها می‌توانند نویسه‌های Markdown (مثل _ در نام کاربری) داشته باشند
+    username = escape_markdown(str(user_info.get('username', 'N/A')))
+    first_name = escape_markdown(str(user_info.get('first_name', 'N/A')))
+    last_seen = user_info.get('last_seen', 'N/A')
+    message_count = user_info.get('message_count', 0)
+    points = data_manager.get_in(('user_points', user_id, 'points'), 0)
+    return (f"{prefix}{is_banned} `{user_id}` - {first_name} (@{username})\n"
+            f"   پیام‌ها: `{message_count}` | امتیاز: `{points}` | آخرین فعالیت: `{last_seen}`\n\n")
+
+def _render_users_page(snapshot: list, session_id: int, page: int):
+    """متن و دکمه‌های یک صفحه؛ فقط کاربران همان صفحه خوانده می‌شوند."""
+    total_pages = max(1, (len(snapshot) + USERS_PER_PAGE - 1) // USERS_PER_PAGE)
+    page = min(max(page, 1), total_pages)
+    start_idx = (page - 1) * USERS_PER_PAGE
     
     users_text = f"👥 **لیست کاربران (صفحه {page}/{total_pages})**\n\n"
-    
-    for i, (user_id, user_info) in enumerate(sorted_users[start_idx:end_idx], start=start_idx + 1):
-        is_banned = "🚫" if int(user_id) in data_manager.DATA['banned_users'] else "✅"
-        username = user_info.get('username', 'N/A')
-        first_name = user_info.get('first_name', 'N/A')
-        last_seen = user_info.get('last_seen', 'N/A')
-        message_count = user_info.get('message_count', 0)
-        user_points = data_manager.get_user_points(int(user_id))
-        
-        users_text += f"{i}. {is_banned} `{user_id}` - {first_name} (@{username})\n"
-        users_text += f"   پیام‌ها: `{message_count}` | امتیاز: `{user_points['points']}` | آخرین فعالیت: `{last_seen}`\n\n"
-    
-    keyboard = []
-    if page > 1: keyboard.append([InlineKeyboardButton("⬅️ صفحه قبل", callback_data=f"users_list:{page-1}")])
-    if page < total_pages: keyboard.append([InlineKeyboardButton("➡️ صفحه بعد", callback_data=f"users_list:{page+1}")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
-    await update.message.reply_text(users_text, parse_mode='Markdown', reply_markup=reply_markup)
+    for i, user_id in enumerate(snapshot[start_idx:start_idx + USERS_PER_PAGE], start=start_idx + 1):
+        users_text += _user_row(user_id, f"{i}. ")
+    return users_text, _page_keyboard('users_list', session_id, page, total_pages)
+
+def _render_search_page(search: tuple, session_id: int, page: int):
+    search_term, user_ids = search
+    total_pages = max(1, (len(user_ids) + SEARCH_RESULTS_PER_PAGE - 1) // SEARCH_RESULTS_PER_PAGE)
+    page = min(max(page, 1), total_pages)
+    start_idx = (page - 1) * SEARCH_RESULTS_PER_PAGE
+    
+    count = f"{len(user_ids)}+" if len(user_ids) >= SEARCH_MAX_RESULTS else str(len(user_ids))
+    results_text = f"🔍 **نتایج جستجو برای «{escape_markdown(search_term)}»** ({count} نتیجه، صفحه {page}/{total_pages})\n\n"
+    for user_id in user_ids[start_idx:start_idx + SEARCH_RESULTS_PER_PAGE]:
+        results_text += _user_row(user_id)
+    return results_text, _page_keyboard('user_search', session_id, page, total_pages)
 
 @admin_only
 async def admin_user_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """جستجوی کاربر بر اساس نام یا نام کاربری."""
+    """جستجوی کاربر بر اساس نام، نام کاربری یا آیدی عددی."""
     if not context.args:
         await update.message.reply_text("⚠️ لطفاً نام یا نام کاربری برای جستجو وارد کنید.\nمثال: `/user_search علی`")
         return
     
-    search_term = " ".join(context.args).lower()
-    users = data_manager.DATA['users']
-    
-    matching_users = []
-    for user_id, user_info in users.items():
-        # --- کد اصلاح شده ---
-        # استفاده از (value or '') برای جلوگیری از خطا در صورت وجود None
-        first_name = (user_info.get('first_name') or '').lower()
-        username = (user_info.get('username') or '').lower()
-        # --- پایان کد اصلاح شده ---
-        
-        if search_term in first_name or search_term in username:
-            is_banned = "🚫" if int(user_id) in data_manager.DATA['banned_users'] else "✅"
-            matching_users.append((user_id, user_info, is_banned))
+    search_term = " ".join(context.args)
+    matching_users = data_manager.search_users(search_term, SEARCH_MAX_RESULTS)
     
     if not matching_users:
         await update.message.reply_text(f"هیچ کاربری با نام «{search_term}» یافت نشد.")
         return
     
-    results_text = f"🔍 **نتایج جستجو برای «{search_term}»**\n\n"
-    
-    for user_id, user_info, is_banned in matching_users:
-        username_display = user_info.get('username', 'N/A') # برای نمایش نیازی به lower نیست
-        first_name_display = user_info.get('first_name', 'N/A') # برای نمایش نیازی به lower نیست
-        last_seen = user_info.get('last_seen', 'N/A')
-        message_count = user_info.get('message_count', 0)
-        user_points = data_manager.get_user_points(int(user_id))
-        
-        results_text += f"{is_banned} `{user_id}` - {first_name_display} (@{username_display})\n"
-        results_text += f"   پیام‌ها: `{message_count}` | امتیاز: `{user_points['points']}` | آخرین فعالیت: `{last_seen}`\n\n"
-    
-    await update.message.reply_text(results_text, parse_mode='Markdown')
+    session_id, search = _new_list_session(context, 'user_search', (search_term, matching_users))
+    text, reply_markup = _render_search_page(search, session_id, 1)
+    await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
 
 @admin_only
 async def admin_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -546,8 +698,7 @@ async def admin_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         backup_file = f"bot_backup_{timestamp}.json"
         
-        data_to_backup = data_manager.DATA.copy()
-        data_to_backup['banned_users'] = list(data_manager.DATA['banned_users'])
+        data_to_backup = data_manager.export_data()
         
         with open(backup_file, 'w', encoding='utf-8') as f:
             json.dump(data_to_backup, f, indent=4, ensure_ascii=False)
@@ -608,12 +759,17 @@ async def admin_maintenance(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     status = context.args[0].lower()
     
-    if status == 'on':
-        if data_manager.DATA.get('maintenance_mode', False):
+    # اطلاع‌رسانی‌های روشن و خاموش شدن به ترتیب و بدون تداخل انجام می‌شوند
+    async with data_manager.locked('maintenance_mode'):
+        await _set_maintenance_mode(update, context, status == 'on')
+
+async def _set_maintenance_mode(update: Update, context: ContextTypes.DEFAULT_TYPE, enabled: bool):
+    """حالت نگهداری را تغییر داده و به کاربران اطلاع می‌دهد (با قفل maintenance_mode فراخوانی می‌شود)."""
+    if enabled:
+        if not data_manager.compare_and_set('maintenance_mode', False, True):
             await update.message.reply_text("🔧 ربات از قبل در حالت نگهداری قرار دارد.")
             return
             
-        data_manager.DATA['maintenance_mode'] = True
         data_manager.save_data()
         
         await update.message.reply_text("✅ حالت نگهداری ربات فعال شد. در حال اطلاع‌رسانی به کاربران...")
@@ -631,12 +787,11 @@ async def admin_maintenance(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except TelegramError:
                 continue # نادیده گرفتن کاربرانی که ربات را مسدود کرده‌اند
 
-    elif status == 'off':
-        if not data_manager.DATA.get('maintenance_mode', False):
+    else:
+        if not data_manager.compare_and_set('maintenance_mode', True, False):
             await update.message.reply_text("✅ ربات از قبل در حالت عادی قرار دارد.")
             return
 
-        data_manager.DATA['maintenance_mode'] = False
         data_manager.save_data()
 
         await update.message.reply_text("✅ حالت نگهداری ربات غیرفعال شد. در حال اطلاع‌رسانی به کاربران...")
@@ -662,7 +817,7 @@ async def admin_set_welcome_message(update: Update, context: ContextTypes.DEFAUL
         return
     
     new_message = " ".join(context.args)
-    data_manager.DATA['welcome_message'] = new_message
+    data_manager.set_in('welcome_message', new_message)
     data_manager.save_data()
     
     await update.message.reply_text("✅ پیام خوشامدگویی با موفقیت به‌روزرسانی شد.")
@@ -676,7 +831,7 @@ async def admin_set_goodbye_message(update: Update, context: ContextTypes.DEFAUL
         return
     
     new_message = " ".join(context.args)
-    data_manager.DATA['goodbye_message'] = new_message
+    data_manager.set_in('goodbye_message', new_message)
     data_manager.save_data()
     
     await update.message.reply_text("✅ پیام خداحافظی با موفقیت به‌روزرسانی شد.")
@@ -726,11 +881,10 @@ async def admin_add_blocked_word(update: Update, context: ContextTypes.DEFAULT_T
     
     word = " ".join(context.args).lower()
     
-    if word in data_manager.DATA['blocked_words']:
+    if not data_manager.add_item('blocked_words', word):
         await update.message.reply_text(f"⚠️ کلمه «{word}» از قبل در لیست کلمات مسدود شده وجود دارد.")
         return
     
-    data_manager.DATA['blocked_words'].append(word)
     data_manager.save_data()
     
     await update.message.reply_text(f"✅ کلمه «{word}» به لیست کلمات مسدود شده اضافه شد.")
@@ -745,11 +899,10 @@ async def admin_remove_blocked_word(update: Update, context: ContextTypes.DEFAUL
     
     word = " ".join(context.args).lower()
     
-    if word not in data_manager.DATA['blocked_words']:
+    if not data_manager.remove_item('blocked_words', word):
         await update.message.reply_text(f"⚠️ کلمه «{word}» در لیست کلمات مسدود شده وجود ندارد.")
         return
     
-    data_manager.DATA['blocked_words'].remove(word)
     data_manager.save_data()
     
     await update.message.reply_text(f"✅ کلمه «{word}» از لیست کلمات مسدود شده حذف شد.")
@@ -766,75 +919,211 @@ async def admin_list_blocked_words(update: Update, context: ContextTypes.DEFAULT
 
 @admin_only
 async def admin_system_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش اطلاعات سیستم و منابع."""
+    """نمایش اطلاعات سیستم و منابع به همراه تاریخچه یک ساعت اخیر."""
     bot_start_time_str = data_manager.DATA.get('bot_start_time', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     bot_start_time = datetime.strptime(bot_start_time_str, '%Y-%m-%d %H:%M:%S')
     uptime = datetime.now() - bot_start_time
+    virtual_memory = psutil.virtual_memory()
+    disk_usage = psutil.disk_usage('/')
     
     system_info = (
         f"💻 **اطلاعات سیستم:**\n\n"
         f"🖥️ سیستم‌عامل: {platform.system()} {platform.release()}\n"
         f"🐍 نسخه پایتون: {platform.python_version()}\n"
-        f"💾 حافظه RAM استفاده شده: {psutil.virtual_memory().percent}%\n"
-        f"💾 حافظه RAM آزاد: {psutil.virtual_memory().available / (1024**3):.2f} GB\n"
-        f"💾 فضای دیسک استفاده شده: {psutil.disk_usage('/').percent}%\n"
-        f"💾 فضای دیسک آزاد: {psutil.disk_usage('/').free / (1024**3):.2f} GB\n"
-        f"⏱️ زمان اجرای ربات: {uptime}"
+        f"💾 حافظه RAM استفاده شده: {virtual_memory.percent}%\n"
+        f"💾 حافظه RAM آزاد: {virtual_memory.available / (1024**3):.2f} GB\n"
+        f"💾 فضای دیسک استفاده شده: {disk_usage.percent}%\n"
+        f"💾 فضای دیسک آزاد: {disk_usage.free / (1024**3):.2f} GB\n"
+        f"⏱️ زمان اجرای ربات: {uptime}\n"
+        f"🔁 تأخیر حلقه رویداد: {monitoring.current_loop_lag()*1000:.1f}ms"
     )
+
+    load = overload.status()
+    mode_label = "🔴 اضافه‌بار (کارهای غیرضروری متوقف)" if load['mode'] == overload.OVERLOADED else "🟢 عادی"
+    system_info += (
+        f"\n🚦 حالت بار: {mode_label} - از {timedelta(seconds=int(load['duration']))} پیش\n"
+        f"📥 صف ورودی: {load['queue_depth']} (آستانه {overload.CONTROLLER.queue_high}/{overload.CONTROLLER.queue_low})"
+    )
+    if load['reason']:
+        system_info += f"\n📝 آخرین تغییر حالت: `{load['reason']}`"
+
+    # منابع فرآیند: مقدار فعلی، کمینه/بیشینه و روند یک ساعت اخیر
+    resource_lines = []
+    for name, label in (('rss_mb', 'RSS (MB)'), ('cpu_percent', 'CPU %'), ('open_fds', 'FDs'),
+                        ('asyncio_tasks', 'asyncio tasks'), ('outbound_in_flight', 'outbound queue'),
+                        ('data_users', 'users'), ('data_user_message_counts', 'user_message_counts'),
+                        ('data_group_stats', 'group_stats')):
+        summary = monitoring.RESOURCE_HISTORY.summary(name)
+        if summary is None:
+            continue
+        arrow = "↗" if summary['trend'] > 0 else ("↘" if summary['trend'] < 0 else "→")
+        resource_lines.append(
+            f"• `{label}`: `{summary['current']:.1f}` (min `{summary['min']:.1f}` / max `{summary['max']:.1f}`, "
+            f"{arrow} `{summary['trend']:+.1f}`/h)"
+        )
+    if resource_lines:
+        system_info += "\n\n📈 **منابع فرآیند (یک ساعت اخیر):**\n" + "\n".join(resource_lines)
+
+    incidents = monitoring.recent_incidents(5)
+    if incidents:
+        system_info += "\n\n🐢 **آخرین موارد مسدود شدن حلقه رویداد:**\n"
+        for incident in reversed(incidents):
+            location = incident['stack'][-1].strip().splitlines()[0] if incident['stack'] else "-"
+            system_info += f"• `{incident['time']}` - {incident['duration']*1000:.0f}ms - `{incident['handler']}`\n  `{location}`\n"
+
+    if context.args and context.args[0].lower() == 'chart' and monitoring.RESOURCE_HISTORY.timestamps:
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+            temp_file_path = f.name
+        await asyncio.to_thread(monitoring.render_resource_chart, temp_file_path)
+        try:
+            with open(temp_file_path, 'rb') as chart:
+                await update.message.reply_photo(photo=chart, caption="📈 منابع فرآیند در یک ساعت اخیر")
+        finally:
+            os.unlink(temp_file_path)
     
     await update.message.reply_text(system_info, parse_mode='Markdown')
 
+@admin_only
+async def admin_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """پروفایل نمونه‌برداری از فرآیند ربات به مدت مشخص و ارسال پرمصرف‌ترین توابع."""
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text(f"⚠️ لطفاً مدت پروفایل را به ثانیه وارد کنید (حداکثر {profiler.MAX_PROFILE_SECONDS}).\n"
+                                       "مثال: `/profile 30`")
+        return
+
+    if not profiler.try_start():
+        await update.message.reply_text("⏳ یک پروفایل دیگر در حال اجراست. لطفاً صبر کنید.")
+        return
+
+    seconds = min(int(context.args[0]), profiler.MAX_PROFILE_SECONDS)
+    try:
+        await update.message.reply_text(f"🔬 در حال پروفایل کردن ربات به مدت {seconds} ثانیه...")
+        report = await profiler.profile(seconds)
+    except Exception as e:
+        logger.error(f"Profiling failed: {e}")
+        await update.message.reply_text(f"❌ خطا در اجرای پروفایل: {e}")
+        return
+    finally:
+        profiler.finish()
+
+    def format_top(rows):
+        return "\n".join(f"{percent:5.1f}% {label}" for label, _, percent in rows) or "-"
+
+    text = (
+        f"🔬 پروفایل ({report.mode}) - {report.samples} نمونه در {report.duration:.0f} ثانیه\n\n"
+        f"بیشترین زمان کل (cumulative):\n{format_top(report.top(report.cumulative_counts))}\n\n"
+        f"بیشترین زمان خود تابع (self):\n{format_top(report.top(report.self_counts))}"
+    )
+    await update.message.reply_text(text[:4096])
+
+    suffix = "folded" if report.text_dump is None else "txt"
+    await update.message.reply_document(
+        document=io.BytesIO(report.collapsed()),
+        filename=f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{suffix}",
+        caption="📂 پشته‌های نمونه‌برداری شده (قالب collapsed برای flame graph)"
+    )
+
+@admin_only
+async def admin_memory(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """گزارش حافظه هر بخش DATA یا مقایسه snapshotهای tracemalloc."""
+    if context.args and context.args[0].lower() == 'trace':
+        action = context.args[1].lower() if len(context.args) > 1 else 'diff'
+        if action == 'start':
+            await asyncio.to_thread(memory_stats.start_tracing)
+            await update.message.reply_text("🧠 ردیابی tracemalloc فعال شد و snapshot پایه گرفته شد.\n"
+                                           "پس از مدتی با `/memory trace diff` رشد تخصیص‌ها را ببینید.")
+        elif action == 'stop':
+            memory_stats.stop_tracing()
+            await update.message.reply_text("🧠 ردیابی tracemalloc غیرفعال شد.")
+        elif action == 'diff':
+            if not memory_stats.is_tracing():
+                await update.message.reply_text("⚠️ ردیابی فعال نیست. ابتدا `/memory trace start` را اجرا کنید.")
+                return
+            elapsed, rows, traced = await asyncio.to_thread(memory_stats.diff_since_baseline)
+            text = (f"🧠 رشد تخصیص‌ها در {elapsed:.0f} ثانیه اخیر "
+                    f"(کل حافظه ردیابی شده: {memory_stats.format_bytes(traced)}):\n\n")
+            if not rows:
+                text += "هیچ رشدی مشاهده نشد."
+            for location, source, size_diff, count_diff, size in rows:
+                text += (f"+{memory_stats.format_bytes(size_diff)} ({count_diff:+d} بلوک) - {location}\n"
+                         f"   {source[:80]}\n")
+            await update.message.reply_text(text[:4096])
+        else:
+            await update.message.reply_text("⚠️ عملیات نامعتبر. از `start`، `diff` یا `stop` استفاده کنید.")
+        return
+
+    rows = await asyncio.to_thread(memory_stats.section_sizes)
+    total = sum(size for _, _, size in rows)
+    text = f"🧠 **مصرف حافظه بخش‌های داده** (کل: {memory_stats.format_bytes(total)}):\n\n"
+    for name, entries, size in rows:
+        count_text = f" - {entries} ورودی" if entries is not None else ""
+        text += f"• `{name}`: {memory_stats.format_bytes(size)}{count_text}\n"
+    shared_rows = await asyncio.to_thread(memory_stats.shared_section_sizes)
+    if shared_rows:
+        text += "\n🗄 **بخش‌های مشترک بین workerها** (در SQLite، خارج از حافظه فرآیند):\n"
+        for name, entries, size in shared_rows:
+            text += f"• `{name}`: {memory_stats.format_bytes(size)} - {entries} ورودی\n"
+    if memory_stats.is_tracing():
+        text += "\n🔎 ردیابی tracemalloc فعال است (`/memory trace diff`)."
+    await update.message.reply_text(text, parse_mode='Markdown')
+
 @admin_only
 async def admin_reset_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ریست کردن آمار ربات."""
     if not context.args:
         await update.message.reply_text("⚠️ لطفاً نوع آماری که می‌خواهید ریست کنید را مشخص کنید.\n"
-                                       "مثال: `/reset_stats messages` یا `/reset_stats all`")
+                                       "مثال: `/reset_stats messages`، `/reset_stats latency` یا `/reset_stats all`")
         return
     
     stat_type = context.args[0].lower()
     
     if stat_type == "messages":
-        data_manager.DATA['stats']['total_messages'] = 0
-        for user_id in data_manager.DATA['users']:
-            data_manager.DATA['users'][user_id]['message_count'] = 0
+        data_manager.set_in(('stats', 'total_messages'), 0)
+        for user_id in list(data_manager.DATA['users']):
+            data_manager.set_in(('users', user_id, 'message_count'), 0)
         await update.message.reply_text("✅ آمار پیام‌ها با موفقیت ریست شد.")
     
+    elif stat_type == "latency":
+        data_manager.reset_response_stats()
+        await update.message.reply_text("✅ آمار زمان پاسخ با موفقیت ریست شد.")
+        return
+    
     elif stat_type == "all":
-        data_manager.DATA['stats'] = {
-            'total_messages': 0,
-            'total_users': len(data_manager.DATA['users']),
-            'avg_response_time': 0,
-            'max_response_time': 0,
-            'min_response_time': 0,
-            'total_responses': 0
-        }
-        for user_id in data_manager.DATA['users']:
-            data_manager.DATA['users'][user_id]['message_count'] = 0
+        data_manager.set_in(('stats', 'total_messages'), 0)
+        data_manager.set_in(('stats', 'total_users'), len(data_manager.DATA['users']))
+        for user_id in list(data_manager.DATA['users']):
+            data_manager.set_in(('users', user_id, 'message_count'), 0)
+        data_manager.reset_response_stats()
         await update.message.reply_text("✅ تمام آمارها با موفقیت ریست شد.")
     
     else:
-        await update.message.reply_text("⚠️ نوع آمار نامعتبر است. گزینه‌های موجود: messages, all")
+        await update.message.reply_text("⚠️ نوع آمار نامعتبر است. گزینه‌های موجود: messages, latency, all")
         return
     
     data_manager.save_data()
 
 @admin_only
 async def admin_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """نمایش جدول امتیازات کاربران."""
+    """نمایش جدول امتیازات کاربران (کل ربات یا یک گروه)."""
     limit = 10
     if context.args and context.args[0].isdigit():
         limit = int(context.args[0])
         if limit < 1:
             limit = 10
+    chat_id = None
+    if len(context.args) > 1 and context.args[1].lstrip('-').isdigit():
+        chat_id = int(context.args[1])
     
-    top_users = data_manager.get_top_users_by_points(limit)
+    top_users = data_manager.get_top_users_by_points(limit, chat_id)
     
     if not top_users:
         await update.message.reply_text("هیچ کاربری با امتیاز یافت نشد.")
         return
     
-    leaderboard_text = f"🏆 **جدول امتیازات کاربران (برترین {limit} کاربر):**\n\n"
+    if chat_id is None:
+        leaderboard_text = f"🏆 **جدول امتیازات کاربران (برترین {limit} کاربر):**\n\n"
+    else:
+        leaderboard_text = f"🏆 **جدول امتیازات گروه `{chat_id}` (برترین {limit} کاربر):**\n\n"
     
     for i, user in enumerate(top_users, 1):
         medal = ""
@@ -913,14 +1202,10 @@ async def admin_add_allowed_domain(update: Update, context: ContextTypes.DEFAULT
     
     domain = context.args[0].lower()
     
-    if domain in data_manager.DATA.get('allowed_domains', []):
+    if not data_manager.add_item('allowed_domains', domain):
         await update.message.reply_text(f"⚠️ دامنه «{domain}» از قبل در لیست دامنه‌های مجاز وجود دارد.")
         return
     
-    if 'allowed_domains' not in data_manager.DATA:
-        data_manager.DATA['allowed_domains'] = []
-    
-    data_manager.DATA['allowed_domains'].append(domain)
     data_manager.save_data()
     
     await update.message.reply_text(f"✅ دامنه «{domain}» به لیست دامنه‌های مجاز اضافه شد.")
@@ -935,11 +1220,10 @@ async def admin_remove_allowed_domain(update: Update, context: ContextTypes.DEFA
     
     domain = context.args[0].lower()
     
-    if domain not in data_manager.DATA.get('allowed_domains', []):
+    if not data_manager.remove_item('allowed_domains', domain):
         await update.message.reply_text(f"⚠️ دامنه «{domain}» در لیست دامنه‌های مجاز وجود ندارد.")
         return
     
-    data_manager.DATA['allowed_domains'].remove(domain)
     data_manager.save_data()
     
     await update.message.reply_text(f"✅ دامنه «{domain}» از لیست دامنه‌های مجاز حذف شد.")
@@ -961,10 +1245,7 @@ async def admin_list_allowed_domains(update: Update, context: ContextTypes.DEFAU
 @admin_only
 async def admin_toggle_link_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """فعال یا غیرفعال کردن بررسی لینک."""
-    current_status = data_manager.DATA.get('link_check_enabled', False)
-    new_status = not current_status
-    
-    data_manager.DATA['link_check_enabled'] = new_status
+    new_status = data_manager.update_in('link_check_enabled', lambda enabled: not enabled, default=False)
     data_manager.save_data()
     
     status_text = "فعال" if new_status else "غیرفعال"
@@ -973,10 +1254,7 @@ async def admin_toggle_link_check(update: Update, context: ContextTypes.DEFAULT_
 @admin_only
 async def admin_toggle_anti_spam(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """فعال یا غیرفعال کردن ضد اسپم."""
-    current_status = data_manager.DATA.get('anti_spam_enabled', False)
-    new_status = not current_status
-    
-    data_manager.DATA['anti_spam_enabled'] = new_status
+    new_status = data_manager.update_in('anti_spam_enabled', lambda enabled: not enabled, default=False)
     data_manager.save_data()
     
     status_text = "فعال" if new_status else "غیرفعال"
@@ -996,7 +1274,7 @@ async def admin_set_spam_threshold(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("⚠️ آستانه اسپم باید حداقل 1 باشد.")
         return
     
-    data_manager.DATA['spam_threshold'] = threshold
+    data_manager.set_in('spam_threshold', threshold)
     data_manager.save_data()
     
     await update.message.reply_text(f"✅ آستانه اسپم به {threshold} پیام در بازه زمانی مشخص تغییر یافت.")
@@ -1015,7 +1293,7 @@ async def admin_set_spam_timeframe(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("⚠️ بازه زمانی اسپم باید حداقل 10 ثانیه باشد.")
         return
     
-    data_manager.DATA['spam_timeframe'] = timeframe
+    data_manager.set_in('spam_timeframe', timeframe)
     data_manager.save_data()
     
     await update.message.reply_text(f"✅ بازه زمانی اسپم به {timeframe} ثانیه تغییر یافت.")
@@ -1063,10 +1341,7 @@ async def admin_list_admins(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @admin_only
 async def admin_toggle_auto_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """فعال یا غیرفعال کردن خوشامدگویی خودکار."""
-    current_status = data_manager.DATA.get('auto_welcome', True)
-    new_status = not current_status
-    
-    data_manager.DATA['auto_welcome'] = new_status
+    new_status = data_manager.update_in('auto_welcome', lambda enabled: not enabled, default=True)
     data_manager.save_data()
     
     status_text = "فعال" if new_status else "غیرفعال"
@@ -1075,10 +1350,7 @@ async def admin_toggle_auto_welcome(update: Update, context: ContextTypes.DEFAUL
 @admin_only
 async def admin_toggle_auto_goodbye(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """فعال یا غیرفعال کردن خداحافظی خودکار."""
-    current_status = data_manager.DATA.get('auto_goodbye', True)
-    new_status = not current_status
-    
-    data_manager.DATA['auto_goodbye'] = new_status
+    new_status = data_manager.update_in('auto_goodbye', lambda enabled: not enabled, default=True)
     data_manager.save_data()
     
     status_text = "فعال" if new_status else "غیرفعال"
@@ -1146,38 +1418,93 @@ async def admin_group_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 # --- هندلر برای دکمه‌های صفحه‌بندی ---
 async def users_list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """پردازش دکمه‌های صفحه‌بندی لیست کاربران."""
+    """پردازش دکمه‌های صفحه‌بندی لیست کاربران و نتایج جستجو؛ همان پیام ویرایش می‌شود."""
     query = update.callback_query
+    if update.effective_user.id not in ADMIN_IDS:
+        await query.answer("⛔️ شما دسترسی لازم برای اجرای این دستور را ندارید.")
+        return
+    
+    kind = query.data.split(":", 1)[0]
+    session_id, page = _parse_page_callback(query.data)
+    items = _get_list_session(context, kind, session_id)
+    if kind == 'user_search':
+        if items is None:
+            await query.answer("⌛️ این جستجو منقضی شده است؛ لطفاً دوباره جستجو کنید.")
+            return
+        text, reply_markup = _render_search_page(items, session_id, page)
+    else:
+        if items is None:
+            # نسخه منقضی شده (یا پس از راه‌اندازی مجدد): ترتیب فعلی کاربران با نسخه جدید
+            session_id, items = _new_list_session(context, kind, data_manager.get_recent_user_ids())
+        text, reply_markup = _render_users_page(items, session_id, page)
     await query.answer()
     
-    if query.data.startswith("users_list:"):
-        page = int(query.data.split(":")[1])
-        context.args = [str(page)]
-        await admin_users_list(update, context)
+    try:
+        await query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+    except BadRequest as e:
+        # انتخاب صفحه فعلی: پیام تغییری نکرده است؛ بقیه خطاها به error_handler می‌رسند
+        if "message is not modified" not in str(e).lower():
+            raise
 
 # --- تابع برای پردازش ارسال‌های برنامه‌ریزی شده ---
+# شناسه این فرآیند؛ ارسال‌هایی که فرآیند قبلی (پیش از crash یا راه‌اندازی مجدد) برداشته آزاد می‌شوند
+_BROADCAST_OWNER = f"{os.getpid()}-{time.time_ns()}"
+
+def _claim_due_broadcasts(now: datetime, claimed: list, broadcasts: list) -> list:
+    """ارسال‌های سررسیده را با ثبت مالک و زمان به sending می‌برد و ارسال‌های رها شده را آزاد می‌کند."""
+    now_str = now.strftime('%Y-%m-%d %H:%M:%S')
+    stale_before = (now - timedelta(seconds=BROADCAST_CLAIM_TIMEOUT)).strftime('%Y-%m-%d %H:%M:%S')
+    result = []
+    for item in broadcasts:
+        if item['status'] == 'sending' and (item.get('claimed_by') != _BROADCAST_OWNER
+                                            or item.get('claimed_at', '') < stale_before):
+            logger.warning(f"Releasing stale scheduled broadcast claim from {item.get('claimed_by')} "
+                           f"at {item.get('claimed_at')} (progress {item.get('progress', 0)}).")
+            item = {**item, 'status': 'pending'}
+        if item['status'] == 'pending' and datetime.strptime(item['time'], '%Y-%m-%d %H:%M:%S') <= now:
+            item = {**item, 'status': 'sending', 'claimed_by': _BROADCAST_OWNER, 'claimed_at': now_str}
+            claimed.append(item)
+        result.append(item)
+    return result
+
+def _mark_broadcast_sent(sent: dict, result: dict, broadcasts: list) -> list:
+    # اگر ارسال در این فاصله آزاد و توسط فرآیند دیگری برداشته شده باشد تغییری داده نمی‌شود
+    key = (sent['time'], sent['message'], 'sending', sent.get('claimed_by'))
+    return [{**item, **result} if (item['time'], item['message'], item['status'], item.get('claimed_by')) == key else item
+            for item in broadcasts]
+
 async def process_scheduled_broadcasts(context: ContextTypes.DEFAULT_TYPE):
     """پردازش ارسال‌های برنامه‌ریزی شده و ارسال پیام‌ها در زمان مقرر."""
     now = datetime.now()
-    broadcasts_to_send_indices = []
+    broadcasts_to_send = []
+    
+    # در حالت اضافه‌بار ارسال‌های جدید شروع نمی‌شوند و در اجرای بعدی بررسی می‌شوند
+    if overload.shed('broadcast'):
+        return
     
-    for i, broadcast in enumerate(data_manager.DATA['scheduled_broadcasts']):
-        if broadcast['status'] == 'pending':
-            broadcast_time = datetime.strptime(broadcast['time'], '%Y-%m-%d %H:%M:%S')
-            if broadcast_time <= now:
-                broadcasts_to_send_indices.append(i)
+    # ارسال‌ها با تغییر اتمیک وضعیت به sending برداشته می‌شوند تا اجرای بعدی این job
+    # (اگر ارسال بیش از یک دقیقه طول بکشد) آن‌ها را دوباره ارسال نکند؛ ارسالی که فرآیند دیگری
+    # برداشته یا مدتی پیشرفت نکرده رها شده است و از progress ذخیره شده ادامه می‌یابد
+    data_manager.update_in('scheduled_broadcasts', functools.partial(
+        _claim_due_broadcasts, now, broadcasts_to_send), default=[])
 
-    if not broadcasts_to_send_indices:
+    if not broadcasts_to_send:
         return
     
     user_ids = list(data_manager.DATA['users'].keys())
     
-    for index in broadcasts_to_send_indices:
-        broadcast = data_manager.DATA['scheduled_broadcasts'][index]
+    for broadcast in broadcasts_to_send:
         message_text = broadcast['message']
-        total_sent, total_failed = 0, 0
+        # ارسالی که در اجرای قبلی با اضافه‌بار متوقف شده از همان گیرنده ادامه می‌یابد
+        position = broadcast.get('progress', 0)
+        total_sent, total_failed = broadcast.get('sent_count', 0), broadcast.get('failed_count', 0)
         
-        for user_id_str in user_ids:
+        while position < len(user_ids):
+            # در حالت اضافه‌بار ارسال متوقف شده و به اجرای بعدی job سپرده می‌شود
+            if overload.shed('broadcast'):
+                break
+            user_id_str = user_ids[position]
+            position += 1
             try:
                 await context.bot.send_message(chat_id=int(user_id_str), text=message_text)
                 total_sent += 1
@@ -1185,17 +1512,44 @@ async def process_scheduled_broadcasts(context: ContextTypes.DEFAULT_TYPE):
             except TelegramError as e:
                 logger.warning(f"Failed to send scheduled broadcast to {user_id_str}: {e}")
                 total_failed += 1
+            if position % BROADCAST_CHECKPOINT_EVERY == 0:
+                data_manager.update_in('scheduled_broadcasts', functools.partial(
+                    _mark_broadcast_sent, broadcast, {
+                        'progress': position,
+                        'sent_count': total_sent,
+                        'failed_count': total_failed,
+                        'claimed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    }), default=[])
         
-        # به‌روزرسانی وضعیت ارسال
-        data_manager.DATA['scheduled_broadcasts'][index]['status'] = 'sent'
-        data_manager.DATA['scheduled_broadcasts'][index]['sent_time'] = now.strftime('%Y-%m-%d %H:%M:%S')
-        data_manager.DATA['scheduled_broadcasts'][index]['sent_count'] = total_sent
-        data_manager.DATA['scheduled_broadcasts'][index]['failed_count'] = total_failed
+        if position < len(user_ids):
+            data_manager.update_in('scheduled_broadcasts', functools.partial(
+                _mark_broadcast_sent, broadcast, {
+                    'status': 'pending',
+                    'progress': position,
+                    'sent_count': total_sent,
+                    'failed_count': total_failed
+                }), default=[])
+            logger.info(f"Scheduled broadcast paused by overload mode after {position} of {len(user_ids)} recipients.")
+            continue
+        
+        # به‌روزرسانی وضعیت ارسال (ممکن است در این فاصله ارسال‌های دیگری حذف شده و جایگاه آن تغییر کرده باشد)
+        data_manager.update_in('scheduled_broadcasts', functools.partial(
+            _mark_broadcast_sent, broadcast, {
+                'status': 'sent',
+                'progress': position,
+                'sent_time': now.strftime('%Y-%m-%d %H:%M:%S'),
+                'sent_count': total_sent,
+                'failed_count': total_failed
+            }), default=[])
         
         logger.info(f"Scheduled broadcast sent: {total_sent} successful, {total_failed} failed")
     
     data_manager.save_data()
 
+async def check_indexes(context: ContextTypes.DEFAULT_TYPE):
+    """بررسی دوره‌ای شاخص‌های حافظه (در صورت ناسازگاری بازسازی می‌شوند)."""
+    data_manager.check_last_seen_index()
+
 # --- تابع راه‌اندازی هندلرها ---
 def setup_admin_handlers(application):
     """هندلرهای پنل ادمین را به اپلیکیشن اضافه می‌کند."""
@@ -1203,11 +1557,12 @@ def setup_admin_handlers(application):
     application.add_handler(CommandHandler("commands", admin_commands))
     application.add_handler(CommandHandler("stats", admin_stats))
     application.add_handler(CommandHandler("broadcast", admin_broadcast))
-    application.add_handler(CommandHandler("ban", admin_ban))
-    application.add_handler(CommandHandler("unban", admin_unban))
+    # /ban و /unban در main.py ثبت شده‌اند و در چت خصوصی به admin_ban و admin_unban می‌رسند
+    application.add_handler(CommandHandler("ban_status", admin_ban_status))
     application.add_handler(CommandHandler("user_info", admin_userinfo))
     application.add_handler(CommandHandler("logs", admin_logs))
     application.add_handler(CommandHandler("logs_file", admin_logs_file))
+    application.add_handler(CommandHandler("logs_range", admin_logs_range))
     application.add_handler(CommandHandler("users_list", admin_users_list))
     application.add_handler(CommandHandler("user_search", admin_user_search))
     application.add_handler(CommandHandler("backup", admin_backup))
@@ -1227,6 +1582,8 @@ def setup_admin_handlers(application):
     application.add_handler(CommandHandler("remove_blocked_word", admin_remove_blocked_word))
     application.add_handler(CommandHandler("list_blocked_words", admin_list_blocked_words))
     application.add_handler(CommandHandler("system_info", admin_system_info))
+    application.add_handler(CommandHandler("profile", admin_profile))
+    application.add_handler(CommandHandler("memory", admin_memory))
     application.add_handler(CommandHandler("reset_stats", admin_reset_stats))
     
     # هندلرهای ویژگی‌های جدید
@@ -1248,9 +1605,18 @@ def setup_admin_handlers(application):
     application.add_handler(CommandHandler("group_report", admin_group_report))
     
     # هندلر برای دکمه‌های صفحه‌بندی
-    application.add_handler(CallbackQueryHandler(users_list_callback, pattern="^users_list:"))
+    application.add_handler(CallbackQueryHandler(users_list_callback, pattern="^(users_list|user_search):"))
     
     # شروع وظیفه دوره‌ای برای بررسی ارسال‌های برنامه‌ریزی شده
     application.job_queue.run_repeating(process_scheduled_broadcasts, interval=60, first=0)
     
+    # نمونه‌برداری دوره‌ای منابع فرآیند برای /system_info
+    application.job_queue.run_repeating(monitoring.sample_resources, interval=monitoring.RESOURCE_SAMPLE_INTERVAL, first=0)
+    
+    # بررسی دوره‌ای سازگاری شاخص آخرین فعالیت با داده کاربران
+    application.job_queue.run_repeating(check_indexes, interval=INDEX_CHECK_INTERVAL, first=INDEX_CHECK_INTERVAL)
+    
+    # ارزیابی دوره‌ای بار برای حذف خودکار کارهای غیرضروری
+    overload.install(application)
+    
     logger.info("Admin panel handlers have been set up.")
@@ -0,0 +1,230 @@
+# ban_filter.py
+
+import os
+import time
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler, ApplicationHandlerStop
+from telegram.error import TelegramError, RetryAfter
+
+import data_manager
+import metrics
+
+# --- تنظیمات ---
+# محدود کردن کاربر مسدود شده در هر گروه (یک بار) تا تلگرام دیگر پیام‌های او را تحویل ندهد
+BANNED_USER_RESTRICT = os.environ.get("BANNED_USER_RESTRICT", "1") == "1"
+# اقدام در گروه‌ها: restrict (بستن ارسال پیام) یا ban (اخراج و مسدودیت در گروه)
+BAN_CHAT_ACTION = os.environ.get("BAN_CHAT_ACTION", "restrict")
+# اعمال بن سراسری در تمام گروه‌های کاربر: تعداد درخواست همزمان و حداکثر درخواست در ثانیه
+BAN_PROPAGATION_CONCURRENCY = int(os.environ.get("BAN_PROPAGATION_CONCURRENCY", 5))
+BAN_PROPAGATION_RATE = float(os.environ.get("BAN_PROPAGATION_RATE", 20))
+MAX_PROPAGATION_ERRORS = 20
+# تعداد گزارش‌های اعمال بن پایان یافته که برای /ban_status نگهداری می‌شوند
+MAX_PROPAGATION_REPORTS = 100
+
+logger = logging.getLogger(__name__)
+
+BANNED_UPDATES = metrics.Counter("bot_banned_updates_dropped_total", "Updates from globally banned users dropped",
+                                 ("kind",))
+BANNED_RESTRICTIONS = metrics.Counter("bot_banned_restrictions_total", "Chat restrictions applied to banned users",
+                                      ("result",))
+
+BAN_PROPAGATION = metrics.Counter("bot_ban_propagation_total", "Chats processed while propagating global bans",
+                                  ("result",))
+
+# ادمین‌های ربات هیچ‌گاه فیلتر نمی‌شوند (از install مقداردهی می‌شود)
+_admin_ids = set()
+
+# وضعیت آخرین اعمال بن سراسری هر کاربر برای /ban_status
+PROPAGATIONS = {}
+
+def _update_kind(update: Update) -> str:
+    if update.callback_query:
+        return "callback_query"
+    message = update.effective_message
+    if message is None:
+        return "other"
+    if message.text and message.text.startswith('/'):
+        return "command"
+    return "message"
+
+async def _apply_chat_ban(bot, chat_id: int, user_id: int):
+    if BAN_CHAT_ACTION == "ban":
+        await bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
+    else:
+        await bot.restrict_chat_member(
+            chat_id=chat_id,
+            user_id=user_id,
+            permissions={'can_send_messages': False}
+        )
+
+async def _restrict_in_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int):
+    """کاربر را یک بار در این گروه محدود می‌کند؛ تلاش ناموفق هم ثبت می‌شود تا تکرار نشود."""
+    if not data_manager.record_ban_restriction(user_id, chat_id):
+        return
+    try:
+        await _apply_chat_ban(context.bot, chat_id, user_id)
+        BANNED_RESTRICTIONS.inc(1, "restricted")
+        logger.info(f"Restricted globally banned user {user_id} in group {chat_id}.")
+    except TelegramError as e:
+        BANNED_RESTRICTIONS.inc(1, "failed")
+        logger.warning(f"Could not restrict globally banned user {user_id} in group {chat_id}: {e}")
+
+async def drop_banned(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """آپدیت‌های کاربران مسدود شده (پیام از هر نوع، دستور و دکمه) را قبل از تمام هندلرها متوقف می‌کند."""
+    user = update.effective_user
+    if user is None or user.id in _admin_ids or not data_manager.is_user_banned(user.id):
+        return
+
+    BANNED_UPDATES.inc(1, _update_kind(update))
+    chat = update.effective_chat
+    if update.callback_query:
+        try:
+            await update.callback_query.answer()
+        except TelegramError as e:
+            logger.debug(f"Could not answer callback query of banned user {user.id}: {e}")
+    elif chat is not None and chat.type in ('group', 'supergroup'):
+        if update.effective_message is not None and not update.effective_message.new_chat_members:
+            try:
+                await update.effective_message.delete()
+            except TelegramError as e:
+                logger.error(f"Failed to delete message from globally banned user: {e}")
+        if BANNED_USER_RESTRICT:
+            await _restrict_in_chat(context, chat.id, user.id)
+    raise ApplicationHandlerStop
+
+async def track_user_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """فهرست گروه‌های هر کاربر را از پیام‌ها و ورود و خروج اعضا به‌روز نگه می‌دارد."""
+    message = update.message
+    chat = update.effective_chat
+    if message is None or chat is None or chat.type not in ('group', 'supergroup'):
+        return
+    if message.left_chat_member:
+        data_manager.remove_user_chat(message.left_chat_member.id, chat.id)
+        return
+    for member in message.new_chat_members:
+        if not member.is_bot:
+            data_manager.add_user_chat(member.id, chat.id)
+    if message.from_user and not message.from_user.is_bot:
+        data_manager.add_user_chat(message.from_user.id, chat.id)
+
+class _RateLimiter:
+    """فاصله زمانی یکنواخت بین درخواست‌ها (حداکثر rate درخواست در ثانیه)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def _prune_propagations():
+    """قدیمی‌ترین گزارش‌های پایان یافته را تا رسیدن به MAX_PROPAGATION_REPORTS حذف می‌کند."""
+    for user_id in list(PROPAGATIONS):
+        if len(PROPAGATIONS) <= MAX_PROPAGATION_REPORTS:
+            break
+        if PROPAGATIONS[user_id]['finished']:
+            del PROPAGATIONS[user_id]
+
+async def propagate_ban(bot, user_id: int) -> dict:
+    """بن سراسری را در تمام گروه‌هایی که کاربر در آن‌ها دیده شده اعمال و وضعیت را ثبت می‌کند."""
+    restricted = set(data_manager.get_ban_restrictions(user_id))
+    chat_ids = [chat_id for chat_id in data_manager.get_user_chats(user_id) if chat_id not in restricted]
+    # گزارش جدید به انتهای ترتیب منتقل می‌شود
+    PROPAGATIONS.pop(user_id, None)
+    progress = PROPAGATIONS[user_id] = {
+        'total': len(chat_ids), 'done': 0, 'failed': 0, 'errors': [],
+        'started': time.time(), 'finished': None,
+    }
+    _prune_propagations()
+    semaphore = asyncio.Semaphore(BAN_PROPAGATION_CONCURRENCY)
+    limiter = _RateLimiter(BAN_PROPAGATION_RATE)
+
+    async def _ban_in_chat(chat_id: int):
+        async with semaphore:
+            for _ in range(2):
+                await limiter.wait()
+                try:
+                    await _apply_chat_ban(bot, chat_id, user_id)
+                    data_manager.record_ban_restriction(user_id, chat_id)
+                    progress['done'] += 1
+                    BAN_PROPAGATION.inc(1, "applied")
+                    return
+                except RetryAfter as e:
+                    # فقط یک بار پس از زمان اعلام شده توسط تلگرام تلاش مجدد می‌شود
+                    await asyncio.sleep(e.retry_after if isinstance(e.retry_after, (int, float))
+                                        else e.retry_after.total_seconds())
+                    error = e
+                except TelegramError as e:
+                    error = e
+                    break
+            progress['failed'] += 1
+            BAN_PROPAGATION.inc(1, "failed")
+            if len(progress['errors']) < MAX_PROPAGATION_ERRORS:
+                progress['errors'].append((chat_id, str(error)))
+            logger.warning(f"Could not apply global ban of user {user_id} in group {chat_id}: {error}")
+
+    logger.info(f"Propagating global ban of user {user_id} to {len(chat_ids)} groups.")
+    await asyncio.gather(*(_ban_in_chat(chat_id) for chat_id in chat_ids))
+    progress['finished'] = time.time()
+    logger.info(f"Global ban of user {user_id} propagated: {progress['done']} applied, {progress['failed']} failed "
+                f"in {progress['finished'] - progress['started']:.1f}s.")
+    return progress
+
+async def propagation_job(context: ContextTypes.DEFAULT_TYPE):
+    """وظیفه یک‌باره اعمال بن سراسری؛ data شامل user_id و chat_id ادمین برای گزارش نتیجه است."""
+    user_id, report_chat_id = context.job.data
+    progress = await propagate_ban(context.bot, user_id)
+    if report_chat_id is None:
+        return
+    try:
+        await context.bot.send_message(chat_id=report_chat_id, text=format_progress(user_id, progress),
+                                       parse_mode='Markdown')
+    except TelegramError as e:
+        logger.warning(f"Could not report ban propagation of user {user_id}: {e}")
+
+def schedule_propagation(application, user_id: int, report_chat_id: int = None):
+    application.job_queue.run_once(propagation_job, 0, data=(user_id, report_chat_id),
+                                   name=f"ban_propagation:{user_id}")
+
+def format_progress(user_id: int, progress: dict) -> str:
+    state = "✅ پایان یافته" if progress['finished'] else "⏳ در حال اجرا"
+    text = (
+        f"🚫 **اعمال بن سراسری کاربر** `{user_id}` - {state}\n\n"
+        f"👥 گروه‌ها: `{progress['total']}`\n"
+        f"✅ اعمال شده: `{progress['done']}`\n"
+        f"❌ ناموفق: `{progress['failed']}`"
+    )
+    if progress['errors']:
+        text += "\n\n" + "\n".join(f"• `{chat_id}`: `{error}`" for chat_id, error in progress['errors'][:5])
+    return text
+
+async def lift_restrictions(bot, user_id: int):
+    """محدودیت‌هایی را که برای کاربر مسدود اعمال شده بود (پس از رفع مسدودیت) برمی‌دارد."""
+    for chat_id in data_manager.pop_ban_restrictions(user_id):
+        try:
+            if BAN_CHAT_ACTION == "ban":
+                await bot.unban_chat_member(chat_id=chat_id, user_id=user_id, only_if_banned=True)
+            else:
+                await bot.restrict_chat_member(
+                    chat_id=chat_id,
+                    user_id=user_id,
+                    permissions={'can_send_messages': True}
+                )
+        except TelegramError as e:
+            logger.warning(f"Could not lift restriction of user {user_id} in group {chat_id}: {e}")
+
+def install(application, admin_ids=()):
+    """فیلتر کاربران مسدود شده را پس از فیلتر آپدیت‌های تکراری، ضبط و شمارش آپدیت‌ها، و پس از آن
+    ثبت گروه‌های کاربران را اضافه می‌کند. PTB در هر گروه فقط اولین هندلر منطبق را اجرا می‌کند، پس هر
+    کدام گروه جداگانه دارند (شمارنده metrics در گروه -100 است)."""
+    _admin_ids.update(admin_ids)
+    application.add_handler(TypeHandler(Update, drop_banned), group=-99)
+    application.add_handler(TypeHandler(Update, track_user_chat), group=-98)
@@ -0,0 +1,190 @@
+# benchmarks/common.py
+
+import os
+import sys
+import re
+import json
+import hashlib
+import time
+import asyncio
+import platform
+import contextvars
+from collections import Counter
+from datetime import datetime
+
+from telegram.request import BaseRequest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# نوع و شناسه آپدیتی که در حال پردازش است؛ فراخوانی‌های API به همین آپدیت نسبت داده می‌شوند
+CURRENT_KIND = contextvars.ContextVar("current_kind", default="-")
+CURRENT_UPDATE = contextvars.ContextVar("current_update", default=None)
+
+# تاریخ و ساعت داخل متن پاسخ‌ها (مثل «آخرین فعالیت») بین دو اجرا متفاوت است و در مقایسه نادیده گرفته می‌شود
+_TIMESTAMP = re.compile(r'\d{4}-\d{2}-\d{2}( \d{2}:\d{2}(:\d{2})?)?|\d{2}:\d{2}:\d{2}')
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot",
+            "can_join_groups": True, "can_read_all_group_messages": True, "supports_inline_queries": False}
+
+def prepare_environment(workdir: str):
+    """مسیر داده و لاگ ربات را به پوشه موقت منتقل می‌کند. باید قبل از ایمپورت ماژول‌های ربات صدا زده شود."""
+    os.makedirs(workdir, exist_ok=True)
+    os.environ["BOT_DATA_FILE"] = os.path.join(workdir, "bot_data.json")
+    os.environ["BOT_LOG_FILE"] = os.path.join(workdir, "bot.log")
+    os.environ.setdefault("METRICS_PORT", "0")
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+
+class RecordingRequest(BaseRequest):
+    """جایگزین HTTPXRequest که به شبکه وصل نمی‌شود و فقط فراخوانی‌های Bot API را ثبت می‌کند.
+
+    برای متدهای ارسال پیام یک Message ساختگی و برای بقیه True برمی‌گرداند. با admin_ids می‌توان
+    مشخص کرد getChatMember برای کدام کاربران وضعیت creator برگرداند.
+    """
+
+    def __init__(self, latency: float = 0.0, admin_ids: set = (), record_actions: bool = False):
+        self.latency = latency
+        self.admin_ids = set(admin_ids)
+        self.calls = Counter()
+        self.calls_by_kind = Counter()
+        # عملیات انجام شده برای هر آپدیت (برای مقایسه رفتار دو نسخه کد در بازپخش)
+        self.record_actions = record_actions
+        self.actions = {}
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def result_for(self, api_method: str, params: dict):
+        """نتیجه ساختگی یک متد Bot API (در سرور جعلی هم استفاده می‌شود)."""
+        if api_method == "getMe":
+            return BOT_USER
+        if api_method == "getChatMember":
+            user_id = int(params.get("user_id", 0))
+            user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+            if user_id in self.admin_ids:
+                return {"status": "creator", "user": user, "is_anonymous": False}
+            return {"status": "member", "user": user}
+        if api_method == "getChat":
+            return {"id": int(params.get("chat_id", 0)), "type": "supergroup", "title": "Benchmark",
+                    "accent_color_id": 0, "max_reaction_count": 11,
+                    "accepted_gift_types": {"unlimited_gifts": False, "limited_gifts": False,
+                                            "unique_gifts": False, "premium_subscription": False,
+                                            "gifts_from_channels": False}}
+        if api_method == "getChatAdministrators":
+            admin_id = min(self.admin_ids) if self.admin_ids else 1
+            return [{"status": "creator", "user": {"id": admin_id, "is_bot": False, "first_name": f"user{admin_id}"},
+                     "is_anonymous": False}]
+        if api_method == "getChatMemberCount":
+            return 100
+        if api_method.startswith(("send", "edit", "copy", "forward")):
+            self._message_id += 1
+            chat_id = params.get("chat_id", 0)
+            return {"message_id": self._message_id, "date": int(time.time()),
+                    "chat": {"id": int(chat_id) if str(chat_id).lstrip('-').isdigit() else 0, "type": "supergroup"},
+                    "from": BOT_USER, "text": params.get("text", "")}
+        if api_method == "getUpdates":
+            return []
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        self.calls_by_kind[CURRENT_KIND.get()] += 1
+        params = request_data.parameters if request_data is not None else {}
+        if self.record_actions:
+            self.actions.setdefault(CURRENT_UPDATE.get(), []).append(action_summary(api_method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return 200, json.dumps({"ok": True, "result": self.result_for(api_method, params)}).encode('utf-8')
+
+def action_summary(api_method: str, params: dict) -> list:
+    """خلاصه قابل مقایسه یک فراخوانی API: متد، چت، پیام هدف و hash متن."""
+    target = params.get("message_id")
+    reply_parameters = params.get("reply_parameters")
+    if isinstance(reply_parameters, dict):
+        target = reply_parameters.get("message_id")
+    text = params.get("text") or params.get("caption")
+    if text:
+        text = _TIMESTAMP.sub("<time>", str(text))
+    text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()[:10] if text else None
+    return [api_method, params.get("chat_id"), params.get("user_id"), target, text_hash]
+
+# --- آمار ---
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def latency_summary(values: list) -> dict:
+    """خلاصه تأخیرها به میلی‌ثانیه."""
+    values = sorted(values)
+    return {
+        "p50": percentile(values, 0.50) * 1000,
+        "p95": percentile(values, 0.95) * 1000,
+        "p99": percentile(values, 0.99) * 1000,
+        "max": (values[-1] if values else 0.0) * 1000,
+        "mean": (sum(values) / len(values) if values else 0.0) * 1000,
+    }
+
+# --- ذخیره و مقایسه نتایج ---
+
+def environment_info() -> dict:
+    import telegram
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "python_telegram_bot": telegram.__version__,
+        "cpu_count": os.cpu_count(),
+    }
+
+def save_results(results: dict, path: str):
+    results.setdefault("timestamp", datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    results.setdefault("environment", environment_info())
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results saved to {path}")
+
+def _lookup(results: dict, key: str):
+    value = results
+    for part in key.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def compare_results(current: dict, baseline_path: str, checks: list, tolerance: float) -> bool:
+    """نتایج را با فایل baseline مقایسه می‌کند.
+
+    checks لیستی از (کلید نقطه‌دار, True اگر مقدار بیشتر بهتر است) است. اگر هر مقدار بیش از
+    tolerance (نسبی) بدتر شده باشد False برمی‌گرداند.
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    ok = True
+    width = max(len(key) for key, _ in checks) if checks else 0
+    print(f"\nComparison with baseline {baseline_path} ({baseline.get('timestamp', '?')}):")
+    for key, higher_is_better in checks:
+        old, new = _lookup(baseline, key), _lookup(current, key)
+        if old is None or new is None:
+            print(f"  {key:<{width}} missing")
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        status = "REGRESSION" if worse > tolerance else "ok"
+        if status != "ok":
+            ok = False
+        print(f"  {key:<{width}} {old:>12.3f} -> {new:>12.3f} ({change:+.1%}) {status}")
+    return ok
@@ -0,0 +1,181 @@
+# benchmarks/fake_bot_api.py
+"""سرور جعلی Bot API برای تست بار بدون اتصال به تلگرام.
+
+درخواست‌های /bot<token>/<method> را با نتایج ساختگی (همان نتایج RecordingRequest) پاسخ می‌دهد و
+می‌تواند تأخیر، خطای 429 (RetryAfter) و خطاهای 400/500 را به صورت تصادفی تزریق کند.
+
+اجرای مستقل:
+    python benchmarks/fake_bot_api.py --port 8081 --latency 50 --flood-rate 0.01
+    BOT_API_BASE_URL=http://127.0.0.1:8081 python main.py
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+from collections import Counter
+from email.parser import BytesParser
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import common
+
+# متدهایی که خطای تزریقی نمی‌گیرند تا راه‌اندازی ربات مختل نشود
+SETUP_METHODS = {"getMe", "setWebhook", "deleteWebhook", "getWebhookInfo"}
+
+logger = logging.getLogger(__name__)
+
+def _decode_value(value: str):
+    # PTB مقادیر پیچیده را به صورت JSON داخل فرم ارسال می‌کند
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def parse_parameters(content_type: str, body: bytes) -> dict:
+    """پارامترهای درخواست (urlencoded، multipart یا JSON) را به دیکشنری تبدیل می‌کند."""
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode('latin-1') + b"\r\n\r\n" + body)
+        params = {}
+        for part in message.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            if name and part.get_filename() is None:
+                params[name] = _decode_value(part.get_payload(decode=True).decode('utf-8'))
+        return params
+    return {key: _decode_value(value) for key, value in parse_qsl(body.decode('utf-8'))}
+
+class FakeBotApi:
+    """سرور HTTP/1.1 ساده با پشتیبانی از keep-alive که رفتار Bot API را شبیه‌سازی می‌کند.
+
+    برای هر فراخوانی، listenerها با (نام متد, پارامترها, زمان دریافت) صدا زده می‌شوند؛ درایور
+    بار از این طریق پاسخ‌های ربات را به آپدیت‌های ارسالی مرتبط می‌کند.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, flood_rate: float = 0.0,
+                 retry_after: int = 1, error_rate: float = 0.0, admin_ids: set = (), seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.results = common.RecordingRequest(admin_ids=admin_ids)
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.injected = Counter()
+        self.listeners = []
+        self.webhook_set = asyncio.Event()
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._handle_connection, host=host, port=port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _respond(self, api_method: str, params: dict) -> tuple:
+        if api_method not in SETUP_METHODS:
+            roll = self.random.random()
+            if roll < self.flood_rate:
+                self.injected["429"] += 1
+                return 429, {"ok": False, "error_code": 429,
+                             "description": f"Too Many Requests: retry after {self.retry_after}",
+                             "parameters": {"retry_after": self.retry_after}}
+            if roll < self.flood_rate + self.error_rate:
+                self.injected["error"] += 1
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: injected error"}
+        if api_method == "setWebhook":
+            self.webhook_set.set()
+        return 200, {"ok": True, "result": self.results.result_for(api_method, params)}
+
+    async def _handle_request(self, method_line: str, headers: dict, body: bytes) -> tuple:
+        received = time.perf_counter()
+        parts = method_line.split()
+        path = parts[1].split('?', 1)[0] if len(parts) > 1 else ''
+        api_method = path.rsplit('/', 1)[-1]
+        params = parse_parameters(headers.get("content-type", ""), body)
+
+        self.calls[api_method] += 1
+        for listener in self.listeners:
+            listener(api_method, params, received)
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+        return self._respond(api_method, params)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                method_line = await reader.readline()
+                if not method_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+                status, payload = await self._handle_request(method_line.decode('latin-1'), headers, body)
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def add_injection_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.0, help="API response latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- latency jitter in ms")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after seconds in injected 429s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 400")
+
+def server_from_args(args, admin_ids: set = ()) -> FakeBotApi:
+    return FakeBotApi(latency=args.latency / 1000, jitter=args.jitter / 1000, flood_rate=args.flood_rate,
+                      retry_after=args.retry_after, error_rate=args.error_rate, admin_ids=admin_ids,
+                      seed=getattr(args, "seed", 1))
+
+async def serve(args):
+    server = server_from_args(args)
+    port = await server.start(args.host, args.port)
+    print(f"Fake Bot API listening on http://{args.host}:{port} (set BOT_API_BASE_URL to this address)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        print("Calls:", dict(server.calls.most_common()), "Injected:", dict(server.injected))
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--seed", type=int, default=1)
+    add_injection_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# benchmarks/handler_throughput.py
+"""بنچمارک توان عملیاتی هندلرهای ربات.
+
+آپدیت‌های ساختگی (پیام عادی، کلمه مسدود، لینک غیرمجاز، اسپم، دستورات، ورود و خروج اعضا)
+ساخته شده و از زنجیره واقعی هندلرهای Application عبور داده می‌شوند. به جای شبکه از
+RecordingRequest استفاده می‌شود که فراخوانی‌های Bot API را فقط می‌شمارد.
+
+اجرا:
+    python benchmarks/handler_throughput.py --updates 5000 --output results.json
+    python benchmarks/handler_throughput.py --baseline results.json
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import common
+
+BLOCKED_WORD = "badword"
+ALLOWED_DOMAIN = "example.org"
+COMMANDS = ("/start", "/help", "/points", "/topusers", "/rules", "/info", "/groupstats")
+WORDS = ("سلام", "ربات", "گروه", "پیام", "hello", "test", "python", "telegram", "امروز", "خوب")
+
+# شناسه کاربر ادمین هر گروه (برای دستوراتی که سطح دسترسی را بررسی می‌کنند)
+ADMIN_USER_ID = 1
+SPAMMER_USER_ID = 2
+FIRST_USER_ID = 1000
+
+def add_update_mix_arguments(parser: argparse.ArgumentParser):
+    """گزینه‌های ترکیب آپدیت‌های ساختگی (در بنچمارک وب‌هوک هم استفاده می‌شود)."""
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--text-length", type=int, default=60, help="average text length in characters")
+    parser.add_argument("--blocked-ratio", type=float, default=0.02)
+    parser.add_argument("--link-ratio", type=float, default=0.02)
+    parser.add_argument("--spam-ratio", type=float, default=0.05)
+    parser.add_argument("--command-ratio", type=float, default=0.10)
+    parser.add_argument("--join-ratio", type=float, default=0.02, help="ratio of join and of leave updates each")
+    parser.add_argument("--seed", type=int, default=1)
+
+def prepare_bot_data():
+    """تنظیمات DATA که مسیرهای کلمه مسدود، لینک و اسپم را فعال می‌کنند."""
+    return {
+        'blocked_words': [BLOCKED_WORD],
+        'link_check_enabled': True,
+        'allowed_domains': [ALLOWED_DOMAIN],
+        'anti_spam_enabled': True,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthetic throughput benchmark for the bot handlers")
+    parser.add_argument("--updates", type=int, default=5000, help="number of measured updates")
+    parser.add_argument("--warmup", type=int, default=200, help="updates processed before measuring")
+    add_update_mix_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=64, help="updates in flight at the same time")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency in ms")
+    parser.add_argument("--workdir", default=None, help="directory for the temporary data and log files")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="compare against a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    return parser.parse_args()
+
+class UpdateFactory:
+    """سازنده دیکشنری‌های آپدیت تلگرام با ترکیب قابل تنظیم."""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.update_id = 0
+        self.message_id = 0
+        self.kinds = [
+            ("blocked", args.blocked_ratio),
+            ("link", args.link_ratio),
+            ("spam", args.spam_ratio),
+            ("command", args.command_ratio),
+            ("join", args.join_ratio),
+            ("leave", args.join_ratio),
+        ]
+        self.kinds.append(("text", max(0.0, 1.0 - sum(weight for _, weight in self.kinds))))
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"کاربر {user_id}", "username": f"user{user_id}"}
+
+    def _text(self) -> str:
+        words = []
+        length = 0
+        target = max(1, int(self.random.gauss(self.args.text_length, self.args.text_length / 4)))
+        while length < target:
+            word = self.random.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+    def make(self):
+        """یک آپدیت تصادفی می‌سازد و (نوع, دیکشنری آپدیت) برمی‌گرداند."""
+        self.update_id += 1
+        self.message_id += 1
+        kind = self.random.choices([k for k, _ in self.kinds], [w for _, w in self.kinds])[0]
+        chat_id = -1001000000000 - self.random.randrange(self.args.chats)
+        user_id = FIRST_USER_ID + self.random.randrange(self.args.users)
+        message = {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": f"گروه {chat_id}"},
+        }
+
+        if kind == "blocked":
+            message["text"] = f"{self._text()} {BLOCKED_WORD}"
+        elif kind == "link":
+            message["text"] = f"{self._text()} https://spam.example.com/offer"
+        elif kind == "spam":
+            user_id = SPAMMER_USER_ID
+            message["text"] = self._text()
+        elif kind == "command":
+            if self.random.random() < 0.3:
+                user_id = ADMIN_USER_ID
+            command = self.random.choice(COMMANDS)
+            message["text"] = command
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        elif kind == "join":
+            message["new_chat_members"] = [self._user(FIRST_USER_ID + self.random.randrange(self.args.users))]
+        elif kind == "leave":
+            message["left_chat_member"] = self._user(FIRST_USER_ID + self.random.randrange(self.args.users))
+        else:
+            text = self._text()
+            if self.random.random() < 0.1:
+                text += f" https://{ALLOWED_DOMAIN}/page"
+            message["text"] = text
+
+        message["from"] = self._user(user_id)
+        return kind, {"update_id": self.update_id, "message": message}
+
+async def run(args) -> dict:
+    from telegram import Update
+    import data_manager
+    import main
+
+    request = common.RecordingRequest(latency=args.api_latency / 1000, admin_ids={ADMIN_USER_ID})
+    application = main.build_application("123456:BENCHMARK", request=request,
+                                         get_updates_request=common.RecordingRequest())
+
+    errors = []
+
+    async def count_error(update, context):
+        errors.append(context.error)
+    application.add_error_handler(count_error)
+
+    data_manager.DATA.update(prepare_bot_data())
+
+    await application.initialize()
+    factory = UpdateFactory(args)
+    latencies = defaultdict(list)
+    window = asyncio.Semaphore(max(1, args.concurrency))
+    pending = set()
+
+    async def process(kind: str, payload: dict, measured: bool):
+        update = Update.de_json(payload, application.bot)
+        common.CURRENT_KIND.set(kind if measured else "warmup")
+        try:
+            start = time.perf_counter()
+            await application.update_processor.process_update(update, application.process_update(update))
+            if measured:
+                latencies[kind].append(time.perf_counter() - start)
+        finally:
+            window.release()
+
+    async def feed(count: int, measured: bool):
+        for _ in range(count):
+            kind, payload = factory.make()
+            await window.acquire()
+            task = asyncio.create_task(process(kind, payload, measured))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+
+    try:
+        await feed(args.warmup, measured=False)
+        request.calls.clear()
+        errors.clear()
+
+        started = time.perf_counter()
+        await feed(args.updates, measured=True)
+        elapsed = time.perf_counter() - started
+    finally:
+        await application.shutdown()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    total_calls = sum(request.calls.values())
+    by_kind = {}
+    for kind, values in sorted(latencies.items()):
+        by_kind[kind] = {
+            "count": len(values),
+            "latency_ms": common.latency_summary(values),
+            "api_calls_per_update": request.calls_by_kind[kind] / len(values),
+        }
+
+    return {
+        "benchmark": "handler_throughput",
+        "config": vars(args),
+        "updates": len(all_latencies),
+        "elapsed_seconds": elapsed,
+        "updates_per_second": len(all_latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": common.latency_summary(all_latencies),
+        "api_calls_per_update": total_calls / max(len(all_latencies), 1),
+        "api_calls": dict(request.calls.most_common()),
+        "errors": len(errors),
+        "by_kind": by_kind,
+    }
+
+def print_results(results: dict):
+    latency = results["latency_ms"]
+    print(f"Updates:            {results['updates']} in {results['elapsed_seconds']:.2f}s")
+    print(f"Throughput:         {results['updates_per_second']:.1f} updates/s")
+    print(f"Latency (ms):       p50={latency['p50']:.2f} p95={latency['p95']:.2f} "
+          f"p99={latency['p99']:.2f} max={latency['max']:.2f}")
+    print(f"API calls/update:   {results['api_calls_per_update']:.2f}")
+    print(f"Handler errors:     {results['errors']}")
+    print("\nBy update kind:")
+    for kind, row in results["by_kind"].items():
+        print(f"  {kind:<8} n={row['count']:<6} p50={row['latency_ms']['p50']:7.2f}ms "
+              f"p95={row['latency_ms']['p95']:7.2f}ms api/update={row['api_calls_per_update']:.2f}")
+    print("\nAPI calls:", ", ".join(f"{method}={count}" for method, count in results["api_calls"].items()))
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bot-bench-")
+    common.prepare_environment(workdir)
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.output:
+        common.save_results(results, args.output)
+    if args.baseline:
+        checks = [("updates_per_second", True), ("latency_ms.p50", False), ("latency_ms.p95", False),
+                  ("latency_ms.p99", False), ("api_calls_per_update", False)]
+        if not common.compare_results(results, args.baseline, checks, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
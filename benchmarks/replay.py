@@ -0,0 +1,249 @@
+# benchmarks/replay.py
+"""بازپخش آپدیت‌های ضبط شده (UPDATE_RECORD_FILE) روی زنجیره واقعی هندلرها.
+
+آپدیت‌ها با سرعت اصلی (--speed 1)، N برابر (--speed N) یا حداکثر سرعت (--speed 0) و با یک
+RecordingRequest به جای شبکه پردازش می‌شوند. عملیات انجام شده برای هر آپدیت (متد API، چت،
+پیام هدف و hash متن) در فایل actions ذخیره می‌شود تا رفتار دو نسخه کد مقایسه شود:
+
+    git checkout v1 && python benchmarks/replay.py updates.jsonl --speed 0 --concurrency 1 --actions-out a.jsonl
+    git checkout v2 && python benchmarks/replay.py updates.jsonl --speed 0 --concurrency 1 --compare-actions a.jsonl
+
+برای مقایسه دقیق از --concurrency 1 و یک فایل داده اولیه ثابت (--data-file) استفاده کنید؛ ترتیب
+پردازش همزمان روی وضعیت مشترک (مثل شمارنده‌های ضد اسپم) اثر می‌گذارد.
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import common
+
+MAX_RECORDING_FILES = 1000
+MAX_DIVERGENCE_EXAMPLES = 10
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay recorded updates through the bot handlers")
+    parser.add_argument("recording", help="recording file (rotated .N.gz files next to it are included)")
+    parser.add_argument("--speed", type=float, default=0, help="1 = original pace, N = N times faster, 0 = max")
+    parser.add_argument("--concurrency", type=int, default=64, help="updates in flight at the same time")
+    parser.add_argument("--limit", type=int, default=0, help="replay at most this many updates")
+    parser.add_argument("--data-file", default=None, help="initial bot_data.json (copied, never modified)")
+    parser.add_argument("--admin-ids", default="", help="comma separated ids answered as chat creators")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency in ms")
+    parser.add_argument("--workdir", default=None, help="directory for the temporary data and log files")
+    parser.add_argument("--actions-out", default=None, help="write per-update actions as JSONL")
+    parser.add_argument("--compare-actions", default=None, help="actions file of another run to diff against")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="compare against a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    return parser.parse_args()
+
+def recording_files(path: str) -> list:
+    """فایل‌های ضبط (نسخه‌های چرخیده شده قدیمی‌تر اول)."""
+    files = [f"{path}.{i}.gz" for i in range(MAX_RECORDING_FILES, 0, -1)]
+    files.append(path)
+    return [name for name in files if os.path.exists(name) and os.path.getsize(name) > 0]
+
+def read_recording(path: str, limit: int = 0) -> list:
+    records = []
+    for name in recording_files(path):
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(name, 'rt', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                records.append(json.loads(line))
+                if limit and len(records) >= limit:
+                    return records
+    return records
+
+def update_kind(payload: dict) -> str:
+    """نوع آپدیت برای گزارش: دستور، متن، ورود/خروج عضو، callback و ..."""
+    message = payload.get("message") or payload.get("edited_message")
+    if message is None:
+        for key in payload:
+            if key != "update_id":
+                return key
+        return "unknown"
+    if "new_chat_members" in message:
+        return "join"
+    if "left_chat_member" in message:
+        return "leave"
+    text = message.get("text")
+    if text is not None:
+        return "command" if text.startswith("/") else "text"
+    for media in ("photo", "video", "sticker", "voice", "document"):
+        if media in message:
+            return media
+    return "other"
+
+def diff_actions(current: dict, other_path: str) -> dict:
+    """عملیات هر آپدیت را با اجرای دیگر مقایسه می‌کند."""
+    other = {}
+    with open(other_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            row = json.loads(line)
+            other[row["update_id"]] = row["actions"]
+
+    diverged = []
+    only_here, only_there = Counter(), Counter()
+    for update_id in sorted(set(current) | set(other)):
+        mine, theirs = current.get(update_id, []), other.get(update_id, [])
+        if mine == theirs:
+            continue
+        diverged.append({"update_id": update_id, "this_run": mine, "other_run": theirs})
+        mine_methods = Counter(action[0] for action in mine)
+        their_methods = Counter(action[0] for action in theirs)
+        only_here.update(mine_methods - their_methods)
+        only_there.update(their_methods - mine_methods)
+
+    return {
+        "compared_updates": len(set(current) | set(other)),
+        "diverged_updates": len(diverged),
+        "extra_calls_this_run": dict(only_here),
+        "missing_calls_this_run": dict(only_there),
+        "examples": diverged[:MAX_DIVERGENCE_EXAMPLES],
+    }
+
+async def run(args, records: list) -> tuple:
+    from telegram import Update
+    import main
+
+    admin_ids = {int(value) for value in args.admin_ids.split(',') if value.strip()}
+    request = common.RecordingRequest(latency=args.api_latency / 1000, admin_ids=admin_ids, record_actions=True)
+    application = main.build_application("123456:REPLAY", request=request,
+                                         get_updates_request=common.RecordingRequest())
+    errors = []
+
+    async def count_error(update, context):
+        errors.append(context.error)
+    application.add_error_handler(count_error)
+
+    await application.initialize()
+    latencies = defaultdict(list)
+    window = asyncio.Semaphore(max(1, args.concurrency))
+    pending = set()
+
+    async def process(kind: str, payload: dict):
+        update = Update.de_json(payload, application.bot)
+        common.CURRENT_KIND.set(kind)
+        common.CURRENT_UPDATE.set(payload["update_id"])
+        try:
+            start = time.perf_counter()
+            await application.update_processor.process_update(update, application.process_update(update))
+            latencies[kind].append(time.perf_counter() - start)
+        finally:
+            window.release()
+
+    lag = []
+    try:
+        first_time = records[0]["t"] if records else 0.0
+        started = time.perf_counter()
+        for record in records:
+            if args.speed > 0:
+                # زمان‌بندی open-loop بر اساس فاصله زمانی ضبط شده
+                due = started + (record["t"] - first_time) / args.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    lag.append(-delay)
+            payload = record["update"]
+            await window.acquire()
+            task = asyncio.create_task(process(update_kind(payload), payload))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+        elapsed = time.perf_counter() - started
+    finally:
+        await application.shutdown()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    results = {
+        "benchmark": "replay",
+        "config": vars(args),
+        "recording_span_seconds": (records[-1]["t"] - records[0]["t"]) if records else 0.0,
+        "updates": len(all_latencies),
+        "elapsed_seconds": elapsed,
+        "updates_per_second": len(all_latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": common.latency_summary(all_latencies),
+        "schedule_lag_ms": common.latency_summary(lag),
+        "api_calls_per_update": sum(request.calls.values()) / max(len(all_latencies), 1),
+        "api_calls": dict(request.calls.most_common()),
+        "errors": len(errors),
+        "by_kind": {kind: {"count": len(values), "latency_ms": common.latency_summary(values),
+                           "api_calls_per_update": request.calls_by_kind[kind] / len(values)}
+                    for kind, values in sorted(latencies.items())},
+    }
+    actions = {record["update"]["update_id"]: request.actions.get(record["update"]["update_id"], [])
+               for record in records}
+    return results, actions
+
+def print_results(results: dict):
+    latency = results["latency_ms"]
+    print(f"Replayed:           {results['updates']} updates ({results['recording_span_seconds']:.0f}s recorded) "
+          f"in {results['elapsed_seconds']:.2f}s")
+    print(f"Throughput:         {results['updates_per_second']:.1f} updates/s")
+    print(f"Latency (ms):       p50={latency['p50']:.2f} p95={latency['p95']:.2f} "
+          f"p99={latency['p99']:.2f} max={latency['max']:.2f}")
+    print(f"API calls/update:   {results['api_calls_per_update']:.2f}")
+    print(f"Handler errors:     {results['errors']}")
+    for kind, row in results["by_kind"].items():
+        print(f"  {kind:<10} n={row['count']:<7} p50={row['latency_ms']['p50']:7.2f}ms "
+              f"p99={row['latency_ms']['p99']:7.2f}ms api/update={row['api_calls_per_update']:.2f}")
+    divergence = results.get("divergence")
+    if divergence:
+        print(f"\nDivergence: {divergence['diverged_updates']} of {divergence['compared_updates']} updates differ")
+        print(f"  extra calls in this run:   {divergence['extra_calls_this_run']}")
+        print(f"  missing calls in this run: {divergence['missing_calls_this_run']}")
+        for example in divergence["examples"]:
+            print(f"  update {example['update_id']}: {example['other_run']} -> {example['this_run']}")
+
+def main():
+    args = parse_args()
+    records = read_recording(args.recording, args.limit)
+    if not records:
+        print(f"No updates found in {args.recording}")
+        sys.exit(1)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bot-replay-")
+    common.prepare_environment(workdir)
+    # فایل dedupe اجرای قبلی در همین پوشه تمام آپدیت‌های ضبط شده را تکراری نشان می‌دهد
+    dedupe_file = os.path.join(workdir, "replay.dedupe.json")
+    os.environ["DEDUPE_FILE"] = dedupe_file
+    if os.path.exists(dedupe_file):
+        os.remove(dedupe_file)
+    if args.data_file:
+        shutil.copyfile(args.data_file, os.environ["BOT_DATA_FILE"])
+
+    results, actions = asyncio.run(run(args, records))
+    if args.actions_out:
+        with open(args.actions_out, 'w', encoding='utf-8') as f:
+            for update_id, update_actions in actions.items():
+                f.write(json.dumps({"update_id": update_id, "actions": update_actions}, ensure_ascii=False) + "\n")
+    if args.compare_actions:
+        results["divergence"] = diff_actions(actions, args.compare_actions)
+
+    print_results(results)
+    if args.output:
+        common.save_results(results, args.output)
+    if args.baseline:
+        checks = [("updates_per_second", True), ("latency_ms.p50", False), ("latency_ms.p95", False),
+                  ("latency_ms.p99", False), ("api_calls_per_update", False)]
+        if not common.compare_results(results, args.baseline, checks, args.tolerance):
+            sys.exit(1)
+    if results.get("divergence", {}).get("diverged_updates"):
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
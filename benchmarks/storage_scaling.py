@@ -0,0 +1,229 @@
+# benchmarks/storage_scaling.py
+"""بنچمارک مقیاس‌پذیری ذخیره‌سازی data_manager.
+
+برای هر اندازه (پیش‌فرض ۱۰ هزار، ۱۰۰ هزار و یک میلیون کاربر) داده واقعی‌نما شامل کاربران،
+امتیازها، شمارنده‌های ضد اسپم و تاریخچه آمار گروه‌ها ساخته می‌شود و زمان load_data، save_data،
+get_active_users، get_top_users_by_points، get_group_stats و admin_user_search به همراه اوج
+تخصیص حافظه هر عملیات و اوج RSS فرآیند اندازه‌گیری می‌شود. هر اندازه در فرآیند جداگانه اجرا
+می‌شود تا اوج حافظه اندازه‌های قبلی روی نتیجه اثر نگذارد.
+
+اجرا:
+    python benchmarks/storage_scaling.py --sizes 10000,100000 --output storage.json
+    python benchmarks/storage_scaling.py --sizes 10000,100000 --baseline storage.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import common
+
+ADMIN_USER_ID = 1
+FIRST_USER_ID = 1000
+FIRST_NAMES = ("علی", "محمد", "زهرا", "فاطمه", "حسین", "مریم", "رضا", "سارا", "امیر", "نرگس",
+               "Ali", "Sara", "John", "Maria", "David", "Anna", "Reza", "Mina", "Omid", "Leila")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Storage scaling benchmark for data_manager")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated user counts")
+    parser.add_argument("--users-per-chat", type=int, default=200, help="users per group (sets the chat count)")
+    parser.add_argument("--history-days", type=int, default=90, help="days of group stats history per chat")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per operation (best is reported)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=None, help="directory for the generated data files")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="compare against a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    parser.add_argument("--single", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def generate_data(users: int, chats: int, history_days: int, seed: int) -> dict:
+    """بخش‌های DATA را با توزیع واقع‌نما می‌سازد (فعالیت کاربران در ۹۰ روز اخیر پخش شده است)."""
+    rng = random.Random(seed)
+    now = datetime.now()
+    data = {'users': {}, 'user_points': {}, 'user_message_counts': {}, 'group_stats': {},
+            'banned_users': set(), 'warnings': {}}
+
+    for i in range(users):
+        user_id = str(FIRST_USER_ID + i)
+        first_seen = now - timedelta(days=rng.uniform(0, 365))
+        last_seen = now - timedelta(days=min(rng.expovariate(1 / 10), (now - first_seen).days))
+        message_count = int(rng.paretovariate(1.2))
+        points = message_count
+        data['users'][user_id] = {
+            'first_name': f"{rng.choice(FIRST_NAMES)} {i % 997}",
+            'username': f"user{user_id}" if rng.random() < 0.7 else None,
+            'first_seen': first_seen.strftime('%Y-%m-%d %H:%M:%S'),
+            'message_count': message_count,
+            'last_seen': last_seen.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        data['user_points'][user_id] = {
+            'points': points,
+            'last_activity': last_seen.strftime('%Y-%m-%d %H:%M:%S'),
+            'level': 1 + points // 100,
+            'daily_messages': rng.randrange(20),
+            'last_reset_date': last_seen.strftime('%Y-%m-%d'),
+        }
+        # فقط کاربران فعال در دقیقه اخیر شمارنده ضد اسپم دارند
+        if rng.random() < 0.01:
+            data['user_message_counts'][user_id] = [now.strftime('%Y-%m-%d %H:%M:%S')] * rng.randrange(1, 5)
+        if rng.random() < 0.005:
+            data['banned_users'].add(int(user_id))
+        if rng.random() < 0.01:
+            data['warnings'][user_id] = rng.randrange(1, 3)
+
+    for c in range(chats):
+        chat_id = str(-1001000000000 - c)
+        history = {}
+        for day in range(history_days):
+            date_str = (now - timedelta(days=day)).strftime('%Y-%m-%d')
+            text = rng.randrange(50, 2000)
+            media = [rng.randrange(0, 100) for _ in range(4)]
+            history[date_str] = {
+                'total_messages': text + sum(media),
+                'text_messages': text,
+                'photo_messages': media[0],
+                'video_messages': media[1],
+                'sticker_messages': media[2],
+                'voice_messages': media[3],
+                'new_members': rng.randrange(0, 20),
+                'left_members': rng.randrange(0, 10),
+            }
+        data['group_stats'][chat_id] = history
+    data['stats'] = {'total_messages': sum(u['message_count'] for u in data['users'].values()),
+                     'total_users': users}
+    return data
+
+class _StubMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+def _search_update():
+    return SimpleNamespace(effective_user=SimpleNamespace(id=ADMIN_USER_ID), message=_StubMessage())
+
+def measure(func, repeat: int) -> dict:
+    """بهترین و میانگین زمان چند اجرا، و اوج تخصیص حافظه یک اجرای جداگانه زیر tracemalloc."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(timings), "mean_seconds": sum(timings) / len(timings), "peak_alloc_mb": peak / 2 ** 20}
+
+def run_single(args) -> dict:
+    """یک اندازه را در همین فرآیند اجرا می‌کند (محیط باید از قبل آماده شده باشد)."""
+    import data_manager
+    import admin_panel
+
+    users = args.single
+    chats = max(1, users // args.users_per_chat)
+    start = time.perf_counter()
+    data_manager.DATA.update(generate_data(users, chats, args.history_days, args.seed))
+    generate_seconds = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    chat_ids = [int(chat_id) for chat_id in rng.sample(sorted(data_manager.DATA['group_stats']), min(chats, 10))]
+    # جستجو با نام کاربری و نام کاربران موجود (هر دو مسیر مقایسه رشته‌ای را می‌پیماید)
+    sampled_users = [data_manager.DATA['users'][str(FIRST_USER_ID + rng.randrange(users))] for _ in range(5)]
+    search_terms = [user['username'] or user['first_name'] for user in sampled_users]
+
+    def group_stats():
+        for chat_id in chat_ids:
+            data_manager.get_group_stats(chat_id, 30)
+
+    def user_search():
+        for term in search_terms:
+            update = _search_update()
+            asyncio.run(admin_panel.admin_user_search(update, SimpleNamespace(args=term.split(), user_data={})))
+
+    operations = {}
+    operations["save_data"] = measure(data_manager.save_data, args.repeat)
+    data_file_mb = os.path.getsize(data_manager.DATA_FILE) / 2 ** 20
+    operations["load_data"] = measure(data_manager.load_data, args.repeat)
+    operations["get_active_users"] = measure(lambda: data_manager.get_active_users(7), args.repeat)
+    operations["get_top_users_by_points"] = measure(lambda: data_manager.get_top_users_by_points(10), args.repeat)
+    operations["get_group_stats"] = measure(group_stats, args.repeat)
+    operations["admin_user_search"] = measure(user_search, args.repeat)
+
+    return {
+        "users": users,
+        "chats": chats,
+        "history_days": args.history_days,
+        "generate_seconds": generate_seconds,
+        "data_file_mb": data_file_mb,
+        # ru_maxrss در لینوکس کیلوبایت است
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "operations": operations,
+    }
+
+def run_size(args, size: int, workdir: str) -> dict:
+    size_dir = os.path.join(workdir, str(size))
+    result_file = os.path.join(size_dir, "result.json")
+    os.makedirs(size_dir, exist_ok=True)
+    command = [sys.executable, os.path.abspath(__file__), "--single", str(size), "--result-file", result_file,
+               "--users-per-chat", str(args.users_per_chat), "--history-days", str(args.history_days),
+               "--repeat", str(args.repeat), "--seed", str(args.seed), "--workdir", size_dir]
+    subprocess.run(command, check=True)
+    with open(result_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def print_result(result: dict):
+    print(f"\n{result['users']} users, {result['chats']} chats x {result['history_days']} days: "
+          f"file {result['data_file_mb']:.1f} MB, peak RSS {result['peak_rss_mb']:.0f} MB "
+          f"(generated in {result['generate_seconds']:.1f}s)")
+    for name, row in result["operations"].items():
+        print(f"  {name:<26} {row['seconds'] * 1000:10.1f} ms  (mean {row['mean_seconds'] * 1000:10.1f} ms, "
+              f"peak alloc {row['peak_alloc_mb']:8.1f} MB)")
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bot-storage-")
+
+    if args.single is not None:
+        common.prepare_environment(workdir)
+        os.environ["ADMIN_IDS"] = str(ADMIN_USER_ID)
+        result = run_single(args)
+        with open(args.result_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    results = {"benchmark": "storage_scaling", "config": vars(args), "sizes": {}}
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        result = run_size(args, size, workdir)
+        results["sizes"][str(size)] = result
+        print_result(result)
+
+    if args.output:
+        common.save_results(results, args.output)
+    if args.baseline:
+        checks = []
+        for size, result in results["sizes"].items():
+            checks.append((f"sizes.{size}.peak_rss_mb", False))
+            checks.extend((f"sizes.{size}.operations.{name}.seconds", False) for name in result["operations"])
+        if not common.compare_results(results, args.baseline, checks, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
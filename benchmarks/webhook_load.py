@@ -0,0 +1,221 @@
+# benchmarks/webhook_load.py
+"""تست بار سرتاسری مسیر واقعی run_webhook.
+
+ربات (main.py) در یک فرآیند جداگانه با BOT_API_BASE_URL به سمت سرور جعلی Bot API اجرا می‌شود.
+درایور آپدیت‌های ساختگی را با نرخ ثابت (open-loop) به /webhook ارسال می‌کند و پاسخ‌های ربات را
+از طریق chat_id و message_id پیام ریپلای شده یا حذف شده به آپدیت مربوطه نسبت می‌دهد؛ بنابراین
+تأخیر سرتاسری شامل تجزیه HTTP، صف آپدیت‌ها، هندلرها و درخواست خروجی است.
+
+اجرا:
+    python benchmarks/webhook_load.py --rate 200 --duration 20 --latency 30 --flood-rate 0.01 --output webhook.json
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+from collections import Counter, defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import common
+import fake_bot_api
+from handler_throughput import ADMIN_USER_ID, UpdateFactory, add_update_mix_arguments, prepare_bot_data
+
+BOT_TOKEN = "123456:LOADTEST"
+STARTUP_TIMEOUT = 60
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end webhook load test against a fake Bot API")
+    parser.add_argument("--rate", type=float, default=200, help="updates per second sent to the webhook")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--drain", type=float, default=5, help="seconds to wait for replies after the last update")
+    parser.add_argument("--connections", type=int, default=100, help="max HTTP connections to the webhook")
+    parser.add_argument("--bot-port", type=int, default=0, help="webhook port (0 picks a free port)")
+    add_update_mix_arguments(parser)
+    fake_bot_api.add_injection_arguments(parser)
+    parser.add_argument("--workdir", default=None, help="directory for the bot data, log and output files")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="compare against a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    return parser.parse_args()
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _reply_key(api_method: str, params: dict):
+    """(chat_id, message_id) پیامی که این فراخوانی به آن پاسخ می‌دهد یا آن را حذف می‌کند."""
+    message_id = None
+    reply_parameters = params.get("reply_parameters")
+    if isinstance(reply_parameters, dict):
+        message_id = reply_parameters.get("message_id")
+    elif "reply_to_message_id" in params:
+        message_id = params["reply_to_message_id"]
+    elif api_method == "deleteMessage":
+        message_id = params.get("message_id")
+    if message_id is None or "chat_id" not in params:
+        return None
+    try:
+        return int(params["chat_id"]), int(message_id)
+    except (TypeError, ValueError):
+        return None
+
+async def _wait_for_port(port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"webhook port {port} did not open")
+
+async def run(args, workdir: str) -> dict:
+    data_file = os.path.join(workdir, "bot_data.json")
+    with open(data_file, 'w', encoding='utf-8') as f:
+        json.dump({"stats": {"total_messages": 0, "total_users": 0}, **prepare_bot_data()}, f, ensure_ascii=False)
+
+    api = fake_bot_api.server_from_args(args, admin_ids={ADMIN_USER_ID})
+    api_port = await api.start()
+    bot_port = args.bot_port or _free_port()
+
+    sent = {}
+    kinds = {}
+    end_to_end = defaultdict(list)
+    replied = set()
+
+    def on_api_call(api_method: str, params: dict, received: float):
+        key = _reply_key(api_method, params)
+        if key is not None and key in sent and key not in replied:
+            replied.add(key)
+            end_to_end[kinds[key]].append(received - sent[key])
+    api.listeners.append(on_api_call)
+
+    env = dict(os.environ,
+               BOT_TOKEN=BOT_TOKEN,
+               BOT_API_BASE_URL=f"http://127.0.0.1:{api_port}",
+               RENDER_EXTERNAL_URL=f"http://127.0.0.1:{bot_port}",
+               PORT=str(bot_port),
+               BOT_DATA_FILE=data_file,
+               BOT_LOG_FILE=os.path.join(workdir, "bot.log"),
+               METRICS_PORT="0")
+    console = open(os.path.join(workdir, "bot_console.log"), 'wb')
+    bot = await asyncio.create_subprocess_exec(sys.executable, os.path.join(common.REPO_DIR, "main.py"),
+                                               env=env, stdout=console, stderr=console)
+
+    factory = UpdateFactory(args)
+    ack_latencies = []
+    webhook_status = Counter()
+    total = int(args.rate * args.duration)
+    try:
+        await asyncio.wait_for(api.webhook_set.wait(), STARTUP_TIMEOUT)
+        await _wait_for_port(bot_port, STARTUP_TIMEOUT)
+        api.calls.clear()
+
+        limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            url = f"http://127.0.0.1:{bot_port}/webhook"
+
+            async def post(kind: str, payload: dict):
+                message = payload["message"]
+                key = (message["chat"]["id"], message["message_id"])
+                kinds[key] = kind
+                start = time.perf_counter()
+                sent[key] = start
+                try:
+                    response = await client.post(url, json=payload)
+                    webhook_status[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    webhook_status[type(e).__name__] += 1
+                    return
+                ack_latencies.append(time.perf_counter() - start)
+
+            tasks = []
+            started = time.perf_counter()
+            for i in range(total):
+                delay = started + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                kind, payload = factory.make()
+                tasks.append(asyncio.create_task(post(kind, payload)))
+            send_elapsed = time.perf_counter() - started
+            await asyncio.gather(*tasks)
+            await asyncio.sleep(args.drain)
+    finally:
+        if bot.returncode is None:
+            bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(bot.wait(), 15)
+            except asyncio.TimeoutError:
+                bot.kill()
+                await bot.wait()
+        console.close()
+        await api.stop()
+
+    all_end_to_end = [value for values in end_to_end.values() for value in values]
+    sent_by_kind = Counter(kinds.values())
+    by_kind = {}
+    for kind, count in sorted(sent_by_kind.items()):
+        by_kind[kind] = {
+            "sent": count,
+            "replied": len(end_to_end.get(kind, ())),
+            "end_to_end_ms": common.latency_summary(end_to_end.get(kind, [])),
+        }
+
+    return {
+        "benchmark": "webhook_load",
+        "config": vars(args),
+        "updates_sent": total,
+        "target_rate": args.rate,
+        "achieved_rate": total / send_elapsed if send_elapsed else 0.0,
+        "webhook_status": {str(status): count for status, count in webhook_status.items()},
+        "webhook_ack_ms": common.latency_summary(ack_latencies),
+        "replied_updates": len(all_end_to_end),
+        "end_to_end_ms": common.latency_summary(all_end_to_end),
+        "api_calls": dict(api.calls.most_common()),
+        "api_calls_per_update": sum(api.calls.values()) / max(total, 1),
+        "injected": dict(api.injected),
+        "by_kind": by_kind,
+    }
+
+def print_results(results: dict):
+    ack, e2e = results["webhook_ack_ms"], results["end_to_end_ms"]
+    print(f"Updates sent:       {results['updates_sent']} "
+          f"(target {results['target_rate']:.0f}/s, achieved {results['achieved_rate']:.1f}/s)")
+    print(f"Webhook status:     {results['webhook_status']}")
+    print(f"Webhook ack (ms):   p50={ack['p50']:.2f} p95={ack['p95']:.2f} p99={ack['p99']:.2f} max={ack['max']:.2f}")
+    print(f"End-to-end (ms):    p50={e2e['p50']:.2f} p95={e2e['p95']:.2f} p99={e2e['p99']:.2f} "
+          f"max={e2e['max']:.2f} ({results['replied_updates']} replied updates)")
+    print(f"API calls/update:   {results['api_calls_per_update']:.2f}  injected: {results['injected']}")
+    print("\nBy update kind:")
+    for kind, row in results["by_kind"].items():
+        print(f"  {kind:<8} sent={row['sent']:<6} replied={row['replied']:<6} "
+              f"p50={row['end_to_end_ms']['p50']:8.2f}ms p99={row['end_to_end_ms']['p99']:8.2f}ms")
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bot-webhook-")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"Working directory: {workdir}")
+
+    results = asyncio.run(run(args, workdir))
+    print_results(results)
+    if args.output:
+        common.save_results(results, args.output)
+    if args.baseline:
+        checks = [("achieved_rate", True), ("webhook_ack_ms.p99", False), ("end_to_end_ms.p50", False),
+                  ("end_to_end_ms.p95", False), ("end_to_end_ms.p99", False)]
+        if not common.compare_results(results, args.baseline, checks, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,32 @@
 
 import os
 import json
+import asyncio
 import logging
+import contextlib
 from datetime import datetime, timedelta
+from quantile_sketch import ResponseStats
+from leaderboard import Leaderboard
+from recency_index import RecencyIndex
+from user_search import UserSearchIndex, normalize
 
 # --- تنظیمات مسیر فایل‌ها ---
+# مسیرها را می‌توان با متغیرهای محیطی تغییر داد (مثلاً برای اجرای بنچمارک‌ها روی داده جداگانه)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_FILE = os.path.join(BASE_DIR, "bot_data.json")
-LOG_FILE = os.path.join(BASE_DIR, "bot.log")
+DATA_FILE = os.environ.get("BOT_DATA_FILE", os.path.join(BASE_DIR, "bot_data.json"))
+LOG_FILE = os.environ.get("BOT_LOG_FILE", os.path.join(BASE_DIR, "bot.log"))
 
 # --- کش داده‌های گلوبال ---
 DATA = {
     "users": {},
     "banned_users": set(),
+    # گروه‌هایی که ارسال پیام کاربر مسدود شده در آن‌ها بسته شده است (ban_filter.py)
+    "ban_restrictions": {},
+    # گروه‌هایی که هر کاربر در آن‌ها دیده شده است (برای اعمال بن سراسری در تمام گروه‌ها)
+    "user_chats": {},
     "stats": {
         "total_messages": 0,
-        "total_users": 0,
-        "avg_response_time": 0.0,
-        "max_response_time": 0.0,
-        "min_response_time": float('inf'),
-        "total_responses": 0
+        "total_users": 0
     },
     "welcome_message": "سلام {user_mention}! 🤖\n\nمن یک ربات مدیریت گروه هستم. با دستور /help از قابلیت‌های من مطلع شوید.",
     "goodbye_message": "کاربر {user_mention} گروه را ترک کرد. خداحافظ!",
@@ -47,6 +54,28 @@ DATA = {
     "max_admin_level": 5
 }
 
+# --- آمار زمان پاسخ هر هندلر (فقط در حافظه، ذخیره نمی‌شود) ---
+RESPONSE_STATS = {}
+
+# --- رتبه‌بندی امتیازها (فقط در حافظه؛ پس از بارگذاری از user_points و user_chats ساخته می‌شود) ---
+LEADERBOARD = Leaderboard()
+CHAT_LEADERBOARDS = {}
+
+# --- شاخص کاربران بر اساس آخرین فعالیت (فقط در حافظه؛ پس از بارگذاری ساخته می‌شود) ---
+LAST_SEEN_INDEX = RecencyIndex()
+
+# --- شاخص جستجوی کاربران بر اساس نام و نام کاربری (فقط در حافظه؛ پس از بارگذاری ساخته می‌شود) ---
+SEARCH_INDEX = UserSearchIndex()
+
+# بخش‌هایی از DATA که در ذخیره‌ساز مشترک دیگری نگهداری می‌شوند و در فایل JSON ذخیره نمی‌شوند
+# (حالت چند فرآیندی، sharding.py) و توابعی که پس از هر ذخیره فراخوانی می‌شوند
+EXTERNAL_SECTIONS = set()
+SAVE_HOOKS = []
+
+# --- قفل‌های تکه‌ای برای عملیات چند مرحله‌ای (شامل await) روی یک کلید ---
+LOCK_STRIPES = int(os.environ.get("DATA_LOCK_STRIPES", 64))
+_LOCKS = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+
 logger = logging.getLogger(__name__)
 
 def load_data():
@@ -61,17 +90,18 @@ def load_data():
         with open(DATA_FILE, 'r', encoding='utf-8') as f:
             loaded_data = json.load(f)
             loaded_data['banned_users'] = set(loaded_data.get('banned_users', []))
+            if 'ban_restrictions' not in loaded_data: loaded_data['ban_restrictions'] = {}
+            if 'user_chats' not in loaded_data: loaded_data['user_chats'] = {}
             
             # اطمینان از وجود کلیدهای جدید در فایل‌های قدیمی
             if 'blocked_words' not in loaded_data: loaded_data['blocked_words'] = []
             if 'scheduled_broadcasts' not in loaded_data: loaded_data['scheduled_broadcasts'] = []
             if 'maintenance_mode' not in loaded_data: loaded_data['maintenance_mode'] = False
             if 'bot_start_time' not in loaded_data: loaded_data['bot_start_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            if 'avg_response_time' not in loaded_data['stats']:
-                loaded_data['stats']['avg_response_time'] = 0.0
-                loaded_data['stats']['max_response_time'] = 0.0
-                loaded_data['stats']['min_response_time'] = float('inf')
-                loaded_data['stats']['total_responses'] = 0
+            if 'stats' not in loaded_data: loaded_data['stats'] = {'total_messages': 0, 'total_users': 0}
+            # فیلدهای قدیمی آمار زمان پاسخ با اسکچ چندک در حافظه جایگزین شده‌اند
+            for old_key in ('avg_response_time', 'max_response_time', 'min_response_time', 'total_responses'):
+                loaded_data['stats'].pop(old_key, None)
             if 'warnings' not in loaded_data: loaded_data['warnings'] = {}
             if 'group_rules' not in loaded_data: loaded_data['group_rules'] = {}
             
@@ -92,6 +122,7 @@ def load_data():
             if 'max_admin_level' not in loaded_data: loaded_data['max_admin_level'] = 5
 
             DATA.update(loaded_data)
+            rebuild_indexes()
             logger.info(f"داده‌ها با موفقیت از {DATA_FILE} بارگذاری شدند.")
 
     except json.JSONDecodeError as e:
@@ -103,7 +134,7 @@ def save_data():
     """کش گلوبال داده‌ها را در فایل JSON ذخیره می‌کند."""
     global DATA
     try:
-        data_to_save = DATA.copy()
+        data_to_save = {key: value for key, value in DATA.items() if key not in EXTERNAL_SECTIONS}
         data_to_save['banned_users'] = list(DATA['banned_users'])
         
         with open(DATA_FILE, 'w', encoding='utf-8') as f:
@@ -111,100 +142,252 @@ def save_data():
         logger.debug(f"داده‌ها با موفقیت در {DATA_FILE} ذخیره شدند.")
     except Exception as e:
         logger.error(f"خطای مهلک: امکان ذخیره داده‌ها در {DATA_FILE} وجود ندارد. خطا: {e}")
+    
+    for hook in SAVE_HOOKS:
+        try:
+            hook()
+        except Exception as e:
+            logger.error(f"خطا در اجرای تابع پس از ذخیره {hook.__name__}: {e}")
+
+def export_data() -> dict:
+    """کپی کامل و قابل تبدیل به JSON از تمام داده‌ها (شامل بخش‌های ذخیره‌ساز مشترک) برای پشتیبان‌گیری."""
+    exported = {}
+    for key, value in DATA.items():
+        exported[key] = dict(value.items()) if key in EXTERNAL_SECTIONS else value
+    exported['banned_users'] = list(DATA['banned_users'])
+    return exported
+
+# --- API تغییر داده‌ها ---
+# تمام تغییرات DATA از این توابع انجام می‌شود. هر تابع همگام (sync) است و await ندارد، پس در
+# event loop اتمیک اجرا می‌شود؛ بخش‌هایی که در ذخیره‌ساز مشترک هستند (sharding.py) عملیات را
+# به صورت اتمیک در خود ذخیره‌ساز انجام می‌دهند. مسیرها کلید بخش و سپس کلیدهای داخلی هستند،
+# مثلاً ('users', '123', 'message_count')؛ یک رشته تنها یعنی یک کلید سطح اول.
+
+def lock_for(*key) -> asyncio.Lock:
+    """قفل تکه‌ای مربوط به یک کلید (مثلاً lock_for('user', 123))."""
+    return _LOCKS[hash(key) % LOCK_STRIPES]
+
+@contextlib.asynccontextmanager
+async def locked(*keys):
+    """قفل یک یا چند کلید را برای عملیاتی که بین خواندن و نوشتن await دارد نگه می‌دارد.
+
+    هر کلید یک تاپل است (یا یک مقدار تنها)؛ قفل‌ها به ترتیب ثابت گرفته می‌شوند تا بن‌بست رخ ندهد.
+    """
+    stripes = sorted({hash(key if isinstance(key, tuple) else (key,)) % LOCK_STRIPES for key in keys})
+    acquired = []
+    try:
+        for stripe in stripes:
+            await _LOCKS[stripe].acquire()
+            acquired.append(_LOCKS[stripe])
+        yield
+    finally:
+        for lock in reversed(acquired):
+            lock.release()
+
+def _resolve(path, create: bool = False):
+    """ظرف والد و کلید آخر یک مسیر را برمی‌گرداند؛ با create دیکشنری‌های میانی ساخته می‌شوند."""
+    if isinstance(path, str):
+        path = (path,)
+    container = DATA
+    for key in path[:-1]:
+        if create and not isinstance(container, list) and key not in container:
+            container[key] = {}
+        container = container[key]
+    return container, path[-1]
+
+def _current(container, key, default):
+    if isinstance(container, list):
+        return container[key]
+    return container.get(key, default)
+
+def get_in(path, default=None):
+    """مقدار یک مسیر یا default در صورت نبود آن."""
+    try:
+        container, key = _resolve(path)
+        return container[key]
+    except (KeyError, IndexError, TypeError):
+        return default
+
+def set_in(path, value):
+    """مقدار یک مسیر را تنظیم می‌کند."""
+    container, key = _resolve(path, create=True)
+    container[key] = value
+    return value
+
+def delete_in(path, default=None):
+    """کلید یک مسیر را حذف کرده و مقدار قبلی آن را برمی‌گرداند."""
+    try:
+        container, key = _resolve(path)
+        return container.pop(key)
+    except (KeyError, IndexError, TypeError):
+        return default
+
+def incr(path, amount=1):
+    """مقدار عددی یک مسیر را (با مقدار اولیه صفر) افزایش داده و مقدار جدید را برمی‌گرداند."""
+    container, key = _resolve(path, create=True)
+    if hasattr(container, 'atomic_incr'):
+        return container.atomic_incr(key, amount)
+    value = _current(container, key, 0) + amount
+    container[key] = value
+    return value
+
+def update_in(path, func, default=None):
+    """مقدار جدید یک مسیر را با func(مقدار فعلی یا default) محاسبه، ذخیره و برمی‌گرداند."""
+    container, key = _resolve(path, create=True)
+    if hasattr(container, 'atomic_update'):
+        return container.atomic_update(key, func, default)
+    value = func(_current(container, key, default))
+    container[key] = value
+    return value
+
+def compare_and_set(path, expected, new) -> bool:
+    """فقط اگر مقدار فعلی برابر expected باشد (None یعنی کلید وجود ندارد) مقدار new را ذخیره می‌کند."""
+    container, key = _resolve(path, create=True)
+    if hasattr(container, 'atomic_compare_and_set'):
+        return container.atomic_compare_and_set(key, expected, new)
+    if _current(container, key, None) != expected:
+        return False
+    container[key] = new
+    return True
+
+def add_item(path, item) -> bool:
+    """عضو را به لیست یا مجموعه یک مسیر اضافه می‌کند؛ False اگر از قبل وجود داشته باشد."""
+    added = False
+
+    def _add(items):
+        nonlocal added
+        if item in items:
+            return items
+        added = True
+        if isinstance(items, set):
+            items.add(item)
+        else:
+            items.append(item)
+        return items
+
+    update_in(path, _add, default=[])
+    return added
+
+def remove_item(path, item) -> bool:
+    """عضو را از لیست یا مجموعه یک مسیر حذف می‌کند؛ False اگر وجود نداشته باشد."""
+    removed = False
+
+    def _remove(items):
+        nonlocal removed
+        if item not in items:
+            return items
+        removed = True
+        items.remove(item)
+        return items
+
+    update_in(path, _remove, default=[])
+    return removed
 
 def update_user_stats(user_id: int, user):
-    """آمار کاربر را پس از هر پیام به‌روز کرده و داده‌ها را ذخیره می‌کند."""
+    """آمار کاربر را پس از هر پیام به‌روز کرده و داده‌ها را ذخیره می‌کند؛ True اگر کاربر سطح جدیدی کسب کرده باشد."""
     global DATA
     now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     user_id_str = str(user_id)
     
-    if user_id_str not in DATA['users']:
-        DATA['users'][user_id_str] = {
-            'first_name': user.first_name,
-            'username': user.username,
-            'first_seen': now_str,
-            'message_count': 0
-        }
-        DATA['stats']['total_users'] += 1
+    new_user = {
+        'first_name': user.first_name,
+        'username': user.username,
+        'first_seen': now_str,
+        'message_count': 0
+    }
+    if compare_and_set(('users', user_id_str), None, new_user):
+        incr(('stats', 'total_users'))
         logger.info(f"کاربر جدید ثبت شد: {user_id} ({user.first_name})")
         
         # مقداردهی اولیه امتیاز کاربر
-        if user_id_str not in DATA['user_points']:
-            DATA['user_points'][user_id_str] = {
-                'points': 0,
-                'last_activity': now_str,
-                'level': 1,
-                'daily_messages': 0,
-                'last_reset_date': datetime.now().strftime('%Y-%m-%d')
-            }
-
-    DATA['users'][user_id_str]['last_seen'] = now_str
-    DATA['users'][user_id_str]['message_count'] += 1
-    DATA['stats']['total_messages'] += 1
+        compare_and_set(('user_points', user_id_str), None, _new_points_record(now_str))
+        if _last_seen_index_current():
+            SEARCH_INDEX.add(user_id_str, user.first_name, user.username)
+    else:
+        _update_user_names(user_id_str, user)
+
+    set_in(('users', user_id_str, 'last_seen'), now_str)
+    if _last_seen_index_current():
+        LAST_SEEN_INDEX.touch(user_id_str, now_str)
+    incr(('users', user_id_str, 'message_count'))
+    incr(('stats', 'total_messages'))
     
     # به‌روزرسانی امتیاز کاربر
-    update_user_points(user_id)
+    leveled_up = update_user_points(user_id)
     
     # به‌روزرسانی شمارنده پیام‌ها برای ضد اسپم
     update_user_message_count(user_id)
     
     save_data()
+    return leveled_up
+
+def _update_user_names(user_id_str: str, user):
+    """نام و نام کاربری تغییر یافته کاربر را ذخیره و در شاخص جستجو جایگزین می‌کند."""
+    user_info = get_in(('users', user_id_str), {})
+    if user_info.get('first_name') == user.first_name and user_info.get('username') == user.username:
+        return
+    set_in(('users', user_id_str, 'first_name'), user.first_name)
+    set_in(('users', user_id_str, 'username'), user.username)
+    if _last_seen_index_current():
+        SEARCH_INDEX.add(user_id_str, user.first_name, user.username)
+
+def _new_points_record(now_str: str) -> dict:
+    return {
+        'points': 0,
+        'last_activity': now_str,
+        'level': 1,
+        'daily_messages': 0,
+        'last_reset_date': now_str[:10]
+    }
 
 def update_user_points(user_id: int):
     """امتیاز کاربر را به‌روز می‌کند."""
-    global DATA
     user_id_str = str(user_id)
     now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    if user_id_str not in DATA['user_points']:
-        DATA['user_points'][user_id_str] = {
-            'points': 0,
-            'last_activity': now_str,
-            'level': 1,
-            'daily_messages': 0,
-            'last_reset_date': today
-        }
-    
-    # ریست شمارنده پیام‌های روزانه در صورت لزوم
-    if DATA['user_points'][user_id_str]['last_reset_date'] != today:
-        DATA['user_points'][user_id_str]['daily_messages'] = 0
-        DATA['user_points'][user_id_str]['last_reset_date'] = today
-    
-    # افزایش امتیاز
-    DATA['user_points'][user_id_str]['points'] += 1
-    DATA['user_points'][user_id_str]['daily_messages'] += 1
-    DATA['user_points'][user_id_str]['last_activity'] = now_str
-    
-    # بررسی سطح جدید
-    points = DATA['user_points'][user_id_str]['points']
-    new_level = 1 + (points // 100)  # هر 100 امتیاز یک سطح جدید
-    
-    if new_level > DATA['user_points'][user_id_str]['level']:
-        DATA['user_points'][user_id_str]['level'] = new_level
-        return True  # بازگشت True برای نشان دادن ارتقاء سطح
-    
-    return False
+    today = now_str[:10]
+    leveled_up = False
+
+    new_points = 0
+
+    def _add_point(points_data):
+        nonlocal leveled_up, new_points
+        points_data = dict(points_data or _new_points_record(now_str))
+        
+        # ریست شمارنده پیام‌های روزانه در صورت لزوم
+        if points_data['last_reset_date'] != today:
+            points_data['daily_messages'] = 0
+            points_data['last_reset_date'] = today
+        
+        # افزایش امتیاز
+        points_data['points'] += 1
+        points_data['daily_messages'] += 1
+        points_data['last_activity'] = now_str
+        
+        # بررسی سطح جدید
+        new_level = 1 + (points_data['points'] // 100)  # هر 100 امتیاز یک سطح جدید
+        if new_level > points_data['level']:
+            points_data['level'] = new_level
+            leveled_up = True
+        new_points = points_data['points']
+        return points_data
+
+    # کل رکورد در یک عملیات اتمیک به‌روز می‌شود
+    update_in(('user_points', user_id_str), _add_point)
+    _update_leaderboards(user_id, new_points)
+    return leveled_up  # True برای نشان دادن ارتقاء سطح
 
 def update_user_message_count(user_id: int):
     """شمارنده پیام‌های کاربر را برای ضد اسپم به‌روز می‌کند."""
-    global DATA
     user_id_str = str(user_id)
     now = datetime.now()
     now_str = now.strftime('%Y-%m-%d %H:%M:%S')
     
-    if user_id_str not in DATA['user_message_counts']:
-        DATA['user_message_counts'][user_id_str] = []
-    
-    # حذف پیام‌های قدیمی‌تر از بازه زمانی اسپم
+    # حذف پیام‌های قدیمی‌تر از بازه زمانی اسپم و افزودن پیام جدید
     cutoff_time = now - timedelta(seconds=DATA['spam_timeframe'])
-    DATA['user_message_counts'][user_id_str] = [
-        msg_time for msg_time in DATA['user_message_counts'][user_id_str]
+    update_in(('user_message_counts', user_id_str), lambda message_times: [
+        msg_time for msg_time in message_times
         if datetime.strptime(msg_time, '%Y-%m-%d %H:%M:%S') > cutoff_time
-    ]
-    
-    # افزودن پیام جدید
-    DATA['user_message_counts'][user_id_str].append(now_str)
+    ] + [now_str], default=[])
 
 def is_user_spamming(user_id: int) -> bool:
     """بررسی می‌کند آیا کاربر در حال اسپم کردن است یا خیر."""
@@ -217,53 +400,44 @@ def is_user_spamming(user_id: int) -> bool:
     
     return len(DATA['user_message_counts'][user_id_str]) > DATA['spam_threshold']
 
-def update_group_stats(chat_id: int, message_type: str):
-    """آمار گروه را به‌روز می‌کند."""
-    global DATA
+def update_group_stats(chat_id: int, message_type: str, count: int = 1):
+    """آمار گروه را به‌روز می‌کند (count برای ثبت نمونه‌ای با وزن بیش از یک)."""
     chat_id_str = str(chat_id)
     today = datetime.now().strftime('%Y-%m-%d')
     
-    if chat_id_str not in DATA['group_stats']:
-        DATA['group_stats'][chat_id_str] = {}
-    
-    if today not in DATA['group_stats'][chat_id_str]:
-        DATA['group_stats'][chat_id_str][today] = {
-            'total_messages': 0,
-            'text_messages': 0,
-            'photo_messages': 0,
-            'video_messages': 0,
-            'sticker_messages': 0,
-            'voice_messages': 0,
-            'new_members': 0,
-            'left_members': 0
-        }
-    
-    DATA['group_stats'][chat_id_str][today]['total_messages'] += 1
-    DATA['group_stats'][chat_id_str][today][f'{message_type}_messages'] += 1
-
-def update_response_stats(response_time: float):
-    """آمار زمان پاسخگویی را به‌روز می‌کند."""
-    global DATA
-    
-    if DATA['stats']['total_responses'] == 0:
-        DATA['stats']['min_response_time'] = response_time
-
-    DATA['stats']['total_responses'] += 1
-    
-    # محاسبه میانگین جدید
-    current_avg = DATA['stats']['avg_response_time']
-    total_responses = DATA['stats']['total_responses']
-    new_avg = ((current_avg * (total_responses - 1)) + response_time) / total_responses
-    DATA['stats']['avg_response_time'] = new_avg
-    
-    # به‌روزرسانی حداکثر و حداقل زمان پاسخگویی
-    if response_time > DATA['stats']['max_response_time']:
-        DATA['stats']['max_response_time'] = response_time
+    compare_and_set(('group_stats', chat_id_str, today), None, {
+        'total_messages': 0,
+        'text_messages': 0,
+        'photo_messages': 0,
+        'video_messages': 0,
+        'sticker_messages': 0,
+        'voice_messages': 0,
+        'new_members': 0,
+        'left_members': 0
+    })
     
-    if response_time < DATA['stats']['min_response_time']:
-        DATA['stats']['min_response_time'] = response_time
+    # ورود و خروج اعضا کلید جداگانه دارند و جزو پیام‌ها شمرده نمی‌شوند
+    if message_type in ('new_members', 'left_members'):
+        incr(('group_stats', chat_id_str, today, message_type), count)
+        return
     
-    save_data()
+    incr(('group_stats', chat_id_str, today, 'total_messages'), count)
+    incr(('group_stats', chat_id_str, today, f'{message_type}_messages'), count)
+
+def update_response_stats(handler: str, response_time: float):
+    """زمان پاسخ یک هندلر را در اسکچ‌های چندک (۵ دقیقه، یک ساعت و کل) ثبت می‌کند."""
+    stats = RESPONSE_STATS.get(handler)
+    if stats is None:
+        stats = RESPONSE_STATS[handler] = ResponseStats()
+    stats.add(response_time)
+
+def get_response_stats(window: str = "all") -> dict:
+    """اسکچ زمان پاسخ هر هندلر را برای پنجره زمانی مشخص برمی‌گرداند."""
+    return {handler: stats.snapshot(window) for handler, stats in RESPONSE_STATS.items()}
+
+def reset_response_stats():
+    """آمار زمان پاسخ تمام هندلرها را پاک می‌کند."""
+    RESPONSE_STATS.clear()
 
 def is_user_banned(user_id: int) -> bool:
     """بررسی می‌کند آیا کاربر مسدود شده است یا خیر."""
@@ -271,14 +445,53 @@ def is_user_banned(user_id: int) -> bool:
 
 def ban_user(user_id: int):
     """کاربر را مسدود کرده و ذخیره می‌کند."""
-    DATA['banned_users'].add(user_id)
+    add_item('banned_users', user_id)
     save_data()
 
 def unban_user(user_id: int):
     """مسدودیت کاربر را برداشته و ذخیره می‌کند."""
-    DATA['banned_users'].discard(user_id)
+    remove_item('banned_users', user_id)
     save_data()
 
+def record_ban_restriction(user_id: int, chat_id: int) -> bool:
+    """محدود شدن کاربر مسدود در گروه را ثبت می‌کند؛ False اگر از قبل ثبت شده باشد."""
+    if not add_item(('ban_restrictions', str(user_id)), chat_id):
+        return False
+    save_data()
+    return True
+
+def get_ban_restrictions(user_id: int) -> list:
+    return list(get_in(('ban_restrictions', str(user_id)), []))
+
+def pop_ban_restrictions(user_id: int) -> list:
+    """گروه‌های محدود شده کاربر را حذف کرده و برمی‌گرداند."""
+    chat_ids = get_in(('ban_restrictions', str(user_id)), [])
+    delete_in(('ban_restrictions', str(user_id)))
+    save_data()
+    return list(chat_ids)
+
+def add_user_chat(user_id: int, chat_id: int):
+    """حضور کاربر در گروه را ثبت می‌کند (بدون ذخیره فوری؛ همراه ذخیره بعدی نوشته می‌شود)."""
+    # خواندن قبل از نوشتن: در اکثر پیام‌ها گروه از قبل ثبت شده و نوشتنی لازم نیست
+    if chat_id not in get_in(('user_chats', str(user_id)), ()):
+        add_item(('user_chats', str(user_id)), chat_id)
+        points = get_in(('user_points', str(user_id), 'points')) if _leaderboards_current() else None
+        if points is not None:
+            CHAT_LEADERBOARDS.setdefault(chat_id, Leaderboard()).set(user_id, points)
+
+def remove_user_chat(user_id: int, chat_id: int):
+    """خروج کاربر از گروه را ثبت می‌کند."""
+    if remove_item(('user_chats', str(user_id)), chat_id) and not get_in(('user_chats', str(user_id))):
+        delete_in(('user_chats', str(user_id)))
+    board = CHAT_LEADERBOARDS.get(chat_id)
+    if board is not None:
+        board.remove(user_id)
+        if not len(board):
+            del CHAT_LEADERBOARDS[chat_id]
+
+def get_user_chats(user_id: int) -> list:
+    return list(get_in(('user_chats', str(user_id)), []))
+
 def contains_blocked_words(text: str) -> bool:
     """بررسی می‌کند آیا متن حاوی کلمات مسدود شده است یا خیر."""
     if not DATA['blocked_words']:
@@ -312,10 +525,89 @@ def check_link_safety(text: str) -> bool:
     
     return True
 
-def get_active_users(days: int) -> list:
-    """لیست کاربران فعال در بازه زمانی مشخص را برمی‌گرداند."""
+def rebuild_last_seen_index():
+    """شاخص آخرین فعالیت را از بخش users می‌سازد."""
+    global LAST_SEEN_INDEX
+    users = DATA['users'] if _last_seen_index_current() else {}
+    LAST_SEEN_INDEX = RecencyIndex((user_id_str, user_info.get('last_seen'))
+                                   for user_id_str, user_info in users.items())
+
+def check_last_seen_index() -> bool:
+    """شاخص آخرین فعالیت را با بخش users مقایسه و در صورت ناسازگاری بازسازی می‌کند."""
+    if not _last_seen_index_current():
+        return True
+    problems = LAST_SEEN_INDEX.check({user_id_str: user_info.get('last_seen')
+                                      for user_id_str, user_info in DATA['users'].items()})
+    if not problems:
+        return True
+    logger.error(f"شاخص آخرین فعالیت ناسازگار است ({'; '.join(problems)})؛ بازسازی می‌شود.")
+    rebuild_last_seen_index()
+    return False
+
+def _last_seen_index_current() -> bool:
+    # در حالت چند فرآیندی کاربران در workerهای دیگر هم فعال می‌شوند و شاخص این فرآیند کامل نیست؛
+    # شاخص‌های آخرین فعالیت و جستجو در این حالت نگهداری نمی‌شوند و پرس‌وجوها کل users را پیمایش می‌کنند
+    return 'users' not in EXTERNAL_SECTIONS
+
+def count_active_users(days: float) -> int:
+    """تعداد کاربران فعال در بازه زمانی مشخص."""
+    if not _last_seen_index_current():
+        return len(get_active_users(days))
+    cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    return LAST_SEEN_INDEX.count_since(cutoff)
+
+def get_recent_users(offset: int = 0, limit: int = 10) -> list:
+    """(شناسه، اطلاعات) کاربران به ترتیب جدیدترین فعالیت، از جایگاه offset."""
+    users = DATA['users']
+    if not _last_seen_index_current():
+        ordered = sorted(users.items(), key=lambda item: item[1].get('last_seen', ''), reverse=True)
+        return ordered[offset:offset + limit]
+    return [(user_id_str, users.get(user_id_str, {})) for user_id_str, _ in LAST_SEEN_INDEX.recent(offset, limit)]
+
+def get_recent_user_ids() -> list:
+    """شناسه تمام کاربران به ترتیب جدیدترین فعالیت (برای صفحه‌بندی روی یک نسخه ثابت)."""
+    if not _last_seen_index_current():
+        return [user_id_str for user_id_str, _ in get_recent_users(0, len(DATA['users']))]
+    return LAST_SEEN_INDEX.snapshot()
+
+def rebuild_search_index():
+    """شاخص جستجوی کاربران را از بخش users می‌سازد."""
+    global SEARCH_INDEX
+    users = DATA['users'] if _last_seen_index_current() else {}
+    SEARCH_INDEX = UserSearchIndex((user_id_str, user_info.get('first_name'), user_info.get('username'))
+                                   for user_id_str, user_info in users.items())
+
+def search_users(query: str, limit: int = 1000) -> list:
+    """شناسه کاربران منطبق با نام، نام کاربری یا آیدی عددی به ترتیب اولویت (حداکثر limit نتیجه)."""
+    if _last_seen_index_current():
+        return SEARCH_INDEX.search(query, limit)
+    
+    # حالت چند فرآیندی: کاربران workerهای دیگر در شاخص این فرآیند نیستند
+    query = normalize(query).lstrip('@')
+    if not query:
+        return []
+    ranked = []
+    for user_id_str, user_info in DATA['users'].items():
+        name = normalize(user_info.get('first_name'))
+        username = normalize(user_info.get('username')).lstrip('@')
+        if query == user_id_str:
+            ranked.append((0, user_id_str))
+        elif username.startswith(query):
+            ranked.append((1, user_id_str))
+        elif any(token.startswith(query) for token in name.split()):
+            ranked.append((2, user_id_str))
+        elif query in name or query in username:
+            ranked.append((3, user_id_str))
+    ranked.sort(key=lambda item: item[0])
+    return [user_id_str for _, user_id_str in ranked[:limit]]
+
+def get_active_users(days: float) -> list:
+    """لیست کاربران فعال در بازه زمانی مشخص را برمی‌گرداند (جدیدترین اول)."""
     now = datetime.now()
     cutoff_date = now - timedelta(days=days)
+    if _last_seen_index_current():
+        return [int(user_id_str) for user_id_str in
+                LAST_SEEN_INDEX.since(cutoff_date.strftime('%Y-%m-%d %H:%M:%S'))]
     
     active_users = []
     for user_id, user_info in DATA['users'].items():
@@ -349,25 +641,84 @@ def get_user_points(user_id: int) -> dict:
         'last_reset_date': datetime.now().strftime('%Y-%m-%d')
     })
 
-def get_top_users_by_points(limit: int = 10) -> list:
-    """لیست کاربران برتر بر اساس امتیاز را برمی‌گرداند."""
-    users_points = []
-    
+def rebuild_indexes():
+    """تمام شاخص‌های حافظه (رتبه‌بندی‌ها، آخرین فعالیت و جستجو) را از نو می‌سازد."""
+    rebuild_leaderboards()
+    rebuild_last_seen_index()
+    rebuild_search_index()
+
+def rebuild_leaderboards():
+    """رتبه‌بندی سراسری و رتبه‌بندی هر گروه را از user_points و user_chats می‌سازد."""
+    global LEADERBOARD
+    CHAT_LEADERBOARDS.clear()
+    if not _leaderboards_current():
+        LEADERBOARD = Leaderboard()
+        return
+    points = {int(user_id_str): points_data.get('points', 0)
+              for user_id_str, points_data in DATA.get('user_points', {}).items()}
+    LEADERBOARD = Leaderboard(points.items())
+    
+    members = {}
+    for user_id_str, chat_ids in DATA.get('user_chats', {}).items():
+        user_points = points.get(int(user_id_str))
+        if user_points is None:
+            continue
+        for chat_id in chat_ids:
+            members.setdefault(chat_id, []).append((int(user_id_str), user_points))
+    for chat_id, items in members.items():
+        CHAT_LEADERBOARDS[chat_id] = Leaderboard(items)
+
+def _update_leaderboards(user_id: int, points: int):
+    if not _leaderboards_current():
+        return
+    LEADERBOARD.set(user_id, points)
+    for chat_id in get_in(('user_chats', str(user_id)), ()):
+        CHAT_LEADERBOARDS.setdefault(chat_id, Leaderboard()).set(user_id, points)
+
+def _leaderboards_current() -> bool:
+    # در حالت چند فرآیندی امتیازها در workerهای دیگر هم تغییر می‌کنند و رتبه‌بندی حافظه این فرآیند کامل نیست؛
+    # رتبه‌بندی‌ها در این حالت نگهداری نمی‌شوند و پرس‌وجوها کل user_points را پیمایش می‌کنند
+    return 'user_points' not in EXTERNAL_SECTIONS
+
+def _scan_points(chat_id: int = None) -> list:
+    """(user_id، امتیاز) تمام کاربران (یا اعضای یک گروه) با پیمایش کامل user_points."""
+    items = []
     for user_id_str, points_data in DATA.get('user_points', {}).items():
-        user_id = int(user_id_str)
-        user_info = DATA.get('users', {}).get(user_id_str, {})
-        
+        if chat_id is not None and chat_id not in get_in(('user_chats', user_id_str), ()):
+            continue
+        items.append((int(user_id_str), points_data.get('points', 0)))
+    return items
+
+def get_top_users_by_points(limit: int = 10, chat_id: int = None) -> list:
+    """لیست کاربران برتر بر اساس امتیاز را (در کل ربات یا در یک گروه) برمی‌گرداند."""
+    if _leaderboards_current():
+        board = LEADERBOARD if chat_id is None else CHAT_LEADERBOARDS.get(chat_id, Leaderboard())
+        top = board.top(limit)
+    else:
+        top = sorted(_scan_points(chat_id), key=lambda item: item[1], reverse=True)[:limit]
+    
+    users_points = []
+    for user_id, points in top:
+        user_info = DATA.get('users', {}).get(str(user_id), {})
         users_points.append({
             'user_id': user_id,
-            'points': points_data.get('points', 0),
-            'level': points_data.get('level', 1),
+            'points': points,
+            'level': get_in(('user_points', str(user_id), 'level'), 1),
             'name': user_info.get('first_name', 'Unknown')
         })
-    
-    # مرتب‌سازی بر اساس امتیاز
-    users_points.sort(key=lambda x: x['points'], reverse=True)
-    
-    return users_points[:limit]
+    return users_points
+
+def get_user_rank(user_id: int, chat_id: int = None):
+    """(رتبه، تعداد کل) کاربر در رتبه‌بندی سراسری یا گروه؛ None اگر کاربر امتیازی نداشته باشد."""
+    if _leaderboards_current():
+        board = LEADERBOARD if chat_id is None else CHAT_LEADERBOARDS.get(chat_id, Leaderboard())
+        rank = board.rank(user_id)
+        return (rank, len(board)) if rank is not None else None
+    items = _scan_points(chat_id)
+    points = dict(items).get(user_id)
+    if points is None:
+        return None
+    return (1 + sum(1 for _, other in items if other > points), len(items))
 
 def get_custom_command(command: str) -> str:
     """متن دستور سفارشی را برمی‌گرداند."""
@@ -375,16 +726,12 @@ def get_custom_command(command: str) -> str:
 
 def set_custom_command(command: str, response: str):
     """دستور سفارشی جدید را تنظیم می‌کند."""
-    if 'custom_commands' not in DATA:
-        DATA['custom_commands'] = {}
-    
-    DATA['custom_commands'][command.lower()] = response
+    set_in(('custom_commands', command.lower()), response)
     save_data()
 
 def delete_custom_command(command: str):
     """دستور سفارشی را حذف می‌کند."""
-    if 'custom_commands' in DATA and command.lower() in DATA['custom_commands']:
-        del DATA['custom_commands'][command.lower()]
+    if delete_in(('custom_commands', command.lower())) is not None:
         save_data()
 
 def get_group_stats(chat_id: int, days: int = 7) -> dict:
@@ -442,10 +789,7 @@ def set_admin_level(user_id: int, level: int):
     elif level > max_level:
         level = max_level
     
-    if 'admin_levels' not in DATA:
-        DATA['admin_levels'] = {}
-    
-    DATA['admin_levels'][user_id_str] = level
+    set_in(('admin_levels', user_id_str), level)
     save_data()
 
 def get_admins_by_level(min_level: int = 1) -> list:
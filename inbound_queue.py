@@ -0,0 +1,175 @@
+# inbound_queue.py
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from telegram import Update
+
+import metrics
+
+# --- تنظیمات ---
+# حداکثر آپدیت‌های منتظر در صف ورودی (تمام مسیرها با هم)
+INBOUND_QUEUE_SIZE = int(os.environ.get("INBOUND_QUEUE_SIZE", 10000))
+# رفتار صف پر: drop (حذف کم‌اولویت‌ترین آپدیت و پاسخ فوری به وب‌هوک)
+# یا defer (پاسخ وب‌هوک تا خالی شدن جا به تأخیر می‌افتد تا تلگرام سرعت ارسال را کم کند)
+INBOUND_QUEUE_POLICY = os.environ.get("INBOUND_QUEUE_POLICY", "drop")
+
+# مسیرها به ترتیب اولویت
+LANES = ("admin", "moderation", "chatter")
+ADMIN_LANE, MODERATION_LANE, CHATTER_LANE = range(len(LANES))
+
+# دستورات مدیریت گروه (main.py) که از گفتگوی عادی جلوتر پردازش می‌شوند
+MODERATION_COMMANDS = {"ban", "unban", "mute", "unmute", "warn", "del", "purge", "pin", "unpin", "setrules"}
+
+logger = logging.getLogger(__name__)
+
+# صف فعال برای متریک‌ها
+_queue = None
+
+def _lane_depths():
+    if _queue is None:
+        return {}
+    return {(name,): len(_queue.lanes[lane]) for lane, name in enumerate(LANES)}
+
+INBOUND_QUEUE_DEPTH = metrics.Gauge("bot_inbound_queue_depth", "Updates waiting in the inbound queue",
+                                    ("lane",), callback=_lane_depths)
+INBOUND_DROPPED = metrics.Counter("bot_inbound_dropped_total", "Updates dropped because the inbound queue was full",
+                                  ("lane",))
+INBOUND_WAIT = metrics.Histogram("bot_inbound_queue_wait_seconds", "Time updates waited in the inbound queue",
+                                 ("lane",))
+
+def _command_name(text: str) -> str:
+    return text[1:].split(maxsplit=1)[0].split('@', 1)[0].lower() if text else ""
+
+def classify(update: object, admin_ids=()) -> int:
+    """مسیر آپدیت: ادمین‌های ربات، رویدادهای مدیریتی گروه یا گفتگوی عادی."""
+    if not isinstance(update, Update):
+        # سیگنال توقف Application باید پس از تمام آپدیت‌های منتظر برداشته شود
+        return CHATTER_LANE
+    user = update.effective_user
+    if user is not None and user.id in admin_ids:
+        return ADMIN_LANE
+    if update.callback_query or update.chat_member or update.my_chat_member or update.chat_join_request:
+        return MODERATION_LANE
+    message = update.message
+    if message is not None:
+        if message.new_chat_members or message.left_chat_member:
+            return MODERATION_LANE
+        if message.text and message.text.startswith('/') and _command_name(message.text) in MODERATION_COMMANDS:
+            return MODERATION_LANE
+    return CHATTER_LANE
+
+class PriorityUpdateQueue(asyncio.Queue):
+    """صف محدود update_queue با مسیرهای اولویت‌دار.
+
+    وب‌هوک PTB بلافاصله پس از قرار دادن آپدیت در این صف پاسخ 200 می‌دهد. برداشتن از صف تا زمانی
+    که پردازشگر ظرفیت خالی داشته باشد به تأخیر می‌افتد و جای هر آپدیت برداشته شده همان لحظه در
+    پردازشگر رزرو می‌شود (PTB بدون وقفه task می‌سازد)، پس آپدیت‌های عقب‌افتاده در این صف می‌مانند
+    (نه در taskهای منتظر) و آپدیت‌های پراولویت‌تر می‌توانند از آن‌ها جلو بزنند.
+
+    اولویت فقط بین چت‌ها اعمال می‌شود: آپدیتی که آپدیت قبلی همان چت هنوز در مسیر کم‌اولویت‌تری منتظر
+    است، در همان مسیر قرار می‌گیرد تا ترتیب پردازش هر چت (update_processor) حفظ شود.
+    """
+
+    def __init__(self, maxsize: int = INBOUND_QUEUE_SIZE, policy: str = INBOUND_QUEUE_POLICY,
+                 processor=None, admin_ids=()):
+        if policy not in ("drop", "defer"):
+            raise ValueError(f"Unknown inbound queue policy: {policy}")
+        super().__init__(maxsize)
+        self.policy = policy
+        self.processor = processor
+        self.admin_ids = set(admin_ids)
+        global _queue
+        _queue = self
+
+    def _init(self, maxsize):
+        self.lanes = [deque() for _ in LANES]
+        # تعداد آپدیت‌های منتظر هر کلید ترتیب (چت) در هر مسیر
+        self._keys = {}
+
+    def _format(self):
+        depths = ", ".join(f"{name}={len(self.lanes[lane])}" for lane, name in enumerate(LANES))
+        return f"maxsize={self._maxsize!r} lanes=({depths})"
+
+    def qsize(self) -> int:
+        return sum(len(lane) for lane in self.lanes)
+
+    def empty(self) -> bool:
+        return not any(self.lanes)
+
+    def _ordering_key(self, item):
+        return self.processor.ordering_key(item) if self.processor is not None else None
+
+    def _lane_for(self, item, key) -> int:
+        """مسیر آپدیت؛ پایین‌تر از مسیر آپدیت‌های منتظر همان چت نیست."""
+        lane = classify(item, self.admin_ids)
+        counts = self._keys.get(key) if key is not None else None
+        if counts:
+            lane = max(lane, max(index for index, count in enumerate(counts) if count))
+        return lane
+
+    def _forget(self, key, lane: int):
+        if key is None:
+            return
+        counts = self._keys[key]
+        counts[lane] -= 1
+        if not any(counts):
+            del self._keys[key]
+
+    def _put(self, item):
+        key = self._ordering_key(item)
+        lane = self._lane_for(item, key)
+        if key is not None:
+            self._keys.setdefault(key, [0] * len(LANES))[lane] += 1
+        self.lanes[lane].append((time.perf_counter(), item, key))
+
+    def _get(self):
+        for lane, items in enumerate(self.lanes):
+            if items:
+                queued_at, item, key = items.popleft()
+                self._forget(key, lane)
+                if isinstance(item, Update):
+                    INBOUND_WAIT.observe(time.perf_counter() - queued_at, LANES[lane])
+                return item
+        raise asyncio.QueueEmpty
+
+    def _shed(self, lane: int) -> bool:
+        """در صف پر، قدیمی‌ترین آپدیت کم‌اولویت‌تر از lane را حذف می‌کند؛ False اگر چنین آپدیتی نباشد."""
+        for victim in range(len(LANES) - 1, lane, -1):
+            for i, (_, item, key) in enumerate(self.lanes[victim]):
+                if isinstance(item, Update):
+                    del self.lanes[victim][i]
+                    self._forget(key, victim)
+                    self.task_done()
+                    INBOUND_DROPPED.inc(1, LANES[victim])
+                    logger.warning(f"Inbound queue full; dropped {LANES[victim]} update {item.update_id}.")
+                    return True
+        return False
+
+    async def put(self, item):
+        if self.policy == "drop" and self.full() and isinstance(item, Update):
+            lane = self._lane_for(item, self._ordering_key(item))
+            if not self._shed(lane):
+                INBOUND_DROPPED.inc(1, LANES[lane])
+                logger.warning(f"Inbound queue full; dropped {LANES[lane]} update {item.update_id}.")
+                return
+        await super().put(item)
+
+    async def get(self):
+        if self.processor is None:
+            return await super().get()
+        await self.processor.wait_for_capacity()
+        item = await super().get()
+        if isinstance(item, Update):
+            self.processor.admit()
+        return item
+
+    def backlog(self) -> int:
+        """آپدیت‌های منتظر در این صف به همراه آپدیت‌های پذیرفته شده‌ای که پردازششان تمام نشده است."""
+        return self.qsize() + (self.processor.pending if self.processor is not None else 0)
+
+def backlog() -> int:
+    """عمق کل صف ورودی فعال (برای تشخیص اضافه‌بار)."""
+    return _queue.backlog() if _queue is not None else 0
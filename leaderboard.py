@@ -0,0 +1,138 @@
+# leaderboard.py
+
+from bisect import bisect_left, insort
+from itertools import count
+
+# حداکثر اندازه هر بلوک نصف این مقدار پس از تقسیم است
+_BLOCK_SIZE = 512
+
+class Leaderboard:
+    """رتبه‌بندی افزایشی اعضا بر اساس امتیاز.
+
+    اعضا به صورت کلیدهای (منفی امتیاز، ترتیب رسیدن، عضو) در فهرستی مرتب نگهداری می‌شوند که به
+    بلوک‌های کوچک تقسیم شده است؛ بزرگ‌ترین کلید هر بلوک بلوک مناسب را با bisect پیدا می‌کند و یک
+    درخت Fenwick روی اندازه بلوک‌ها تعداد اعضای پیش از هر بلوک را در O(log n) می‌دهد. حافظه فقط به
+    تعداد اعضا بستگی دارد (نه به بیشترین امتیاز)، تغییر امتیاز و رتبه O(log n + اندازه بلوک) است و
+    K نفر اول بدون مرتب‌سازی خوانده می‌شوند.
+    """
+
+    __slots__ = ("_scores", "_blocks", "_maxes", "_index", "_sequence")
+
+    def __init__(self, items=()):
+        self._sequence = count()
+        self._scores = {}
+        for member, score in items:
+            self._scores[member] = (score, next(self._sequence))
+        keys = sorted((-score, sequence, member) for member, (score, sequence) in self._scores.items())
+        self._blocks = [keys[i:i + _BLOCK_SIZE] for i in range(0, len(keys), _BLOCK_SIZE)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._build_index()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, member):
+        return member in self._scores
+
+    # --- درخت Fenwick روی اندازه بلوک‌ها ---
+
+    def _build_index(self):
+        # با تقسیم یا حذف بلوک جایگاه بلوک‌ها جابه‌جا می‌شود و درخت از نو ساخته می‌شود (O(تعداد بلوک‌ها))
+        index = [0] + [len(block) for block in self._blocks]
+        for i in range(1, len(index)):
+            parent = i + (i & -i)
+            if parent < len(index):
+                index[parent] += index[i]
+        self._index = index
+
+    def _index_add(self, block: int, delta: int):
+        i = block + 1
+        while i < len(self._index):
+            self._index[i] += delta
+            i += i & -i
+
+    def _count_before(self, block: int) -> int:
+        total = 0
+        while block > 0:
+            total += self._index[block]
+            block -= block & -block
+        return total
+
+    # --- فهرست مرتب بلوکی ---
+
+    def _insert(self, key: tuple):
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._build_index()
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._blocks[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._blocks[i], key)
+        block = self._blocks[i]
+        if len(block) > 2 * _BLOCK_SIZE:
+            self._blocks[i:i + 1] = [block[:_BLOCK_SIZE], block[_BLOCK_SIZE:]]
+            self._maxes[i:i + 1] = [block[_BLOCK_SIZE - 1], block[-1]]
+            self._build_index()
+        else:
+            self._index_add(i, 1)
+
+    def _delete(self, key: tuple):
+        i = bisect_left(self._maxes, key)
+        block = self._blocks[i]
+        del block[bisect_left(block, key)]
+        if block:
+            self._maxes[i] = block[-1]
+            self._index_add(i, -1)
+        else:
+            del self._blocks[i]
+            del self._maxes[i]
+            self._build_index()
+
+    # --- API ---
+
+    def score(self, member, default=None):
+        entry = self._scores.get(member)
+        return entry[0] if entry is not None else default
+
+    def set(self, member, score: int):
+        old = self._scores.get(member)
+        if old is not None:
+            if old[0] == score:
+                return
+            self._delete((-old[0], old[1], member))
+        sequence = next(self._sequence)
+        self._scores[member] = (score, sequence)
+        self._insert((-score, sequence, member))
+
+    def remove(self, member):
+        old = self._scores.pop(member, None)
+        if old is not None:
+            self._delete((-old[0], old[1], member))
+
+    def rank(self, member):
+        """رتبه عضو (اعضای هم‌امتیاز رتبه یکسان دارند) یا None اگر عضو نباشد."""
+        entry = self._scores.get(member)
+        if entry is None:
+            return None
+        # تعداد اعضای با امتیاز بیشتر: کلیدهای کوچک‌تر از (منفی امتیاز،)
+        key = (-entry[0],)
+        i = bisect_left(self._maxes, key)
+        higher = self._count_before(i)
+        if i < len(self._blocks):
+            higher += bisect_left(self._blocks[i], key)
+        return higher + 1
+
+    def top(self, limit: int) -> list:
+        """حداکثر limit عضو اول به صورت (عضو، امتیاز)؛ هم‌امتیازها به ترتیب رسیدن به آن امتیاز."""
+        result = []
+        for block in self._blocks:
+            for negative_score, _, member in block:
+                if len(result) >= limit:
+                    return result
+                result.append((member, -negative_score))
+        return result
@@ -0,0 +1,371 @@
+# log_utils.py
+
+import os
+import re
+import gzip
+import io
+import shutil
+import queue
+import atexit
+import threading
+import bisect
+import logging
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# --- تنظیمات ---
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# چرخش فایل لاگ بر اساس حجم
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 5 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+
+# محدودیت تعداد لاگ برای هر محل فراخوانی در هر بازه زمانی (ثانیه)
+LOG_RATE_LIMIT = int(os.environ.get("LOG_RATE_LIMIT", 20))
+LOG_RATE_WINDOW = float(os.environ.get("LOG_RATE_WINDOW", 10))
+
+# ایندکس پراکنده (زمان ← موقعیت بایت) در کنار هر فایل لاگ
+INDEX_SUFFIX = ".idx"
+INDEX_INTERVAL = int(os.environ.get("LOG_INDEX_INTERVAL", 64 * 1024))
+
+# هر رکورد لاگ با زمان شروع می‌شود؛ خطوط بدون زمان (مثل traceback) ادامه رکورد قبلی هستند
+_RECORD_START = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+_RECORD_LEVEL = re.compile(r' - (DEBUG|INFO|WARNING|ERROR|CRITICAL) - ')
+
+logger = logging.getLogger(__name__)
+
+_listener = None
+
+# --- راه‌اندازی لاگینگ غیرهمزمان ---
+
+def _gzip_rotator(source: str, dest: str):
+    """فایل لاگ چرخیده شده را فشرده کرده و فایل اصلی را حذف می‌کند."""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst, TAIL_BLOCK_SIZE)
+    os.remove(source)
+    # ایندکس بر اساس موقعیت در محتوای غیرفشرده است و همراه فایل منتقل می‌شود
+    if os.path.exists(source + INDEX_SUFFIX):
+        os.replace(source + INDEX_SUFFIX, dest + INDEX_SUFFIX)
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """هندلر فایل با چرخش بر اساس حجم که نسخه‌های قدیمی را با gzip فشرده می‌کند.
+
+    هنگام نوشتن، هر INDEX_INTERVAL بایت یک ورودی (زمان، موقعیت) در فایل ایندکس ثبت می‌شود؛ با
+    index=False (فایل‌هایی که خطوطشان با زمان شروع نمی‌شود) ایندکسی نوشته نمی‌شود.
+    """
+
+    def __init__(self, filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8',
+                 index: bool = True):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding)
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+        self.index = index
+        entries = _read_index(self.baseFilename + INDEX_SUFFIX) if index else []
+        self._last_indexed = entries[-1][1] if entries else -1
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            if self.index:
+                offset = self.stream.tell()
+                if self._last_indexed < 0 or offset - self._last_indexed >= INDEX_INTERVAL:
+                    with open(self.baseFilename + INDEX_SUFFIX, 'a', encoding='utf-8') as f:
+                        f.write(f"{record.created:.3f} {offset}\n")
+                    self._last_indexed = offset
+            logging.FileHandler.emit(self, record)
+        except Exception:
+            self.handleError(record)
+
+    def doRollover(self):
+        # جابجایی ایندکس نسخه‌های قدیمی هم‌گام با خود فایل‌ها
+        for i in range(self.backupCount - 1, 0, -1):
+            source = self.rotation_filename(f"{self.baseFilename}.{i}") + INDEX_SUFFIX
+            dest = self.rotation_filename(f"{self.baseFilename}.{i + 1}") + INDEX_SUFFIX
+            if os.path.exists(source):
+                os.replace(source, dest)
+        super().doRollover()
+        if self.backupCount <= 0 and os.path.exists(self.baseFilename + INDEX_SUFFIX):
+            os.remove(self.baseFilename + INDEX_SUFFIX)
+        self._last_indexed = -1
+
+class RateLimitFilter(logging.Filter):
+    """تعداد لاگ‌های هر محل فراخوانی (فایل و شماره خط) را در هر بازه زمانی محدود می‌کند.
+
+    لاگ‌های اضافی حذف می‌شوند و تعدادشان در اولین لاگ بازه بعدی گزارش می‌شود.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            state = self._sites.get(key)
+            if state is None or record.created - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._sites[key] = [record.created, 1, 0]
+            elif state[1] < self.limit:
+                state[1] += 1
+                return True
+            else:
+                state[2] += 1
+                return False
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+            record.args = None
+        return True
+
+def setup_logging(log_file: str, level: int = logging.INFO):
+    """لاگینگ را طوری تنظیم می‌کند که نوشتن در فایل در یک thread پس‌زمینه انجام شود."""
+    global _listener
+    if _listener is not None:
+        return
+
+    try:
+        file_handler = CompressedRotatingFileHandler(log_file)
+    except Exception as e:
+        print(f"FATAL: Could not write to log file at {log_file}. Error: {e}")
+        file_handler = logging.StreamHandler()
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    # لاگ هر درخواست HTTP کتابخانه httpx در سطح INFO حجم زیادی تولید می‌کند
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """لاگ‌های باقی‌مانده در صف را نوشته و thread لاگینگ را متوقف می‌کند."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _reverse_lines(path: str, block_size: int = TAIL_BLOCK_SIZE):
+    """خطوط فایل را از انتها به ابتدا با خواندن بلوکی برمی‌گرداند."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b'\n')
+            # اولین تکه ممکن است ناقص باشد و در بلوک بعدی کامل شود
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode('utf-8', errors='replace')
+        if remainder:
+            yield remainder.decode('utf-8', errors='replace')
+
+def record_level(line: str):
+    """سطح لاگ یک خط را برمی‌گرداند (یا None برای خطوط ادامه‌دار)."""
+    match = _RECORD_LEVEL.search(line)
+    return match.group(1) if match else None
+
+def is_record_start(line: str) -> bool:
+    """بررسی می‌کند آیا خط، شروع یک رکورد لاگ است یا خیر."""
+    return bool(_RECORD_START.match(line))
+
+def _record_matches(lines: list, min_level: str = None, contains: str = None) -> bool:
+    if min_level:
+        level = record_level(lines[0])
+        if level is None or LOG_LEVELS.index(level) < LOG_LEVELS.index(min_level):
+            return False
+    if contains:
+        needle = contains.lower()
+        if not any(needle in line.lower() for line in lines):
+            return False
+    return True
+
+def tail_log(path: str, count: int = 30, min_level: str = None, contains: str = None) -> list:
+    """آخرین رکوردهای لاگ را بدون خواندن کل فایل برمی‌گرداند.
+
+    خروجی لیستی از خطوط به ترتیب زمانی است. رکوردهای چندخطی (مثل traceback)
+    به صورت یکجا فیلتر و شمارش می‌شوند.
+    """
+    records = []
+    continuation = []
+    for line in _reverse_lines(path):
+        if not line and not continuation and not records:
+            # خط خالی انتهای فایل
+            continue
+        if not is_record_start(line):
+            continuation.append(line)
+            continue
+        record = [line] + list(reversed(continuation))
+        continuation = []
+        if _record_matches(record, min_level, contains):
+            records.append(record)
+            if len(records) >= count:
+                break
+
+    result = []
+    for record in reversed(records):
+        result.extend(record)
+    return result
+
+def gzip_file(path: str) -> io.BytesIO:
+    """فایل را به صورت جریانی فشرده کرده و بافر gzip را برمی‌گرداند."""
+    buffer = io.BytesIO()
+    with open(path, 'rb') as src, gzip.GzipFile(
+        filename=os.path.basename(path), mode='wb', fileobj=buffer, compresslevel=6
+    ) as dst:
+        shutil.copyfileobj(src, dst, TAIL_BLOCK_SIZE)
+    buffer.seek(0)
+    return buffer
+
+# --- جستجوی زمانی در لاگ‌ها ---
+
+def _open_log(path: str):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+def _line_timestamp(line: bytes):
+    """زمان ابتدای یک خط لاگ را به صورت epoch برمی‌گرداند (یا None)."""
+    try:
+        return datetime.strptime(line[:23].decode('ascii'), '%Y-%m-%d %H:%M:%S,%f').timestamp()
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+def _read_index(index_path: str) -> list:
+    entries = []
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    entries.append((float(parts[0]), int(parts[1])))
+    except (FileNotFoundError, ValueError):
+        return []
+    return entries
+
+def build_index(path: str) -> list:
+    """ایندکس پراکنده یک فایل لاگ را با یک بار پیمایش کامل می‌سازد و ذخیره می‌کند."""
+    entries = []
+    last_indexed = -INDEX_INTERVAL
+    offset = 0
+    with _open_log(path) as f:
+        for line in f:
+            if offset - last_indexed >= INDEX_INTERVAL:
+                timestamp = _line_timestamp(line)
+                if timestamp is not None:
+                    entries.append((timestamp, offset))
+                    last_indexed = offset
+            offset += len(line)
+
+    temp_path = path + INDEX_SUFFIX + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{timestamp:.3f} {position}\n" for timestamp, position in entries)
+    os.replace(temp_path, path + INDEX_SUFFIX)
+    return entries
+
+def load_index(path: str) -> list:
+    """ایندکس فایل لاگ را بارگذاری می‌کند و در صورت نبود یا ناقص بودن، آن را می‌سازد."""
+    entries = _read_index(path + INDEX_SUFFIX)
+    # ایندکسی که از ابتدای فایل شروع نشود (مثلاً لاگ قدیمی بدون ایندکس) ناقص است
+    if not entries or entries[0][1] != 0:
+        entries = build_index(path)
+    return entries
+
+def log_files(log_file: str, backup_count: int = LOG_BACKUP_COUNT) -> list:
+    """فایل‌های لاگ موجود (شامل نسخه‌های چرخیده شده) را از قدیمی به جدید برمی‌گرداند."""
+    files = [f"{log_file}.{i}.gz" for i in range(backup_count, 0, -1)]
+    files.append(log_file)
+    return [path for path in files if os.path.exists(path) and os.path.getsize(path) > 0]
+
+def _scan_log(path: str, offset: int, start_ts: float, end_ts: float, min_level: str = None):
+    """رکوردهای بازه را از موقعیت offset یک فایل برمی‌گرداند؛ مقدار بازگشتی True یعنی به انتهای بازه رسیده است."""
+    record = None
+    with _open_log(path) as f:
+        if offset:
+            f.seek(offset)
+        for raw_line in f:
+            timestamp = _line_timestamp(raw_line)
+            if timestamp is None:
+                if record is not None:
+                    record.append(raw_line.decode('utf-8', errors='replace').rstrip('\r\n'))
+                continue
+            if record is not None:
+                yield record
+                record = None
+            if timestamp > end_ts:
+                return True
+            if timestamp >= start_ts:
+                line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+                if _record_matches([line], min_level):
+                    record = [line]
+    if record is not None:
+        yield record
+    return False
+
+def iter_log_range(log_file: str, start: datetime, end: datetime, min_level: str = None):
+    """رکوردهای لاگ بین دو زمان را برمی‌گرداند.
+
+    ایندکس فایل‌های خارج از بازه را کنار می‌گذارد و در فایل فعلی (فشرده نشده) با جستجوی دودویی به ابتدای
+    بازه می‌رود. seek در gzip از ابتدای فایل از حالت فشرده خارج می‌کند، پس فایل‌های چرخیده شده و فایل‌های
+    بدون ایندکس از ابتدا خوانده می‌شوند.
+    """
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+    files = log_files(log_file)
+    indexes = [load_index(path) for path in files]
+
+    for position, (path, entries) in enumerate(zip(files, indexes)):
+        if entries and entries[0][0] > end_ts:
+            break
+        # اگر فایل بعدی قبل از شروع بازه آغاز شده باشد، کل این فایل خارج از بازه است
+        next_entries = indexes[position + 1] if position + 1 < len(indexes) else None
+        if next_entries and next_entries[0][0] <= start_ts:
+            continue
+
+        offset = 0
+        if entries and not path.endswith('.gz'):
+            timestamps = [timestamp for timestamp, _ in entries]
+            offset = entries[max(0, bisect.bisect_right(timestamps, start_ts) - 1)][1]
+        if (yield from _scan_log(path, offset, start_ts, end_ts, min_level)):
+            return
+
+def export_log_range(log_file: str, start: datetime, end: datetime, min_level: str = None,
+                     preview_limit: int = 3500):
+    """بازه زمانی لاگ را به صورت جریانی فشرده می‌کند.
+
+    خروجی (متن کوتاه یا None، بافر gzip، تعداد رکوردها) است؛ اگر کل نتیجه کوتاه‌تر از
+    preview_limit باشد، متن آن نیز برگردانده می‌شود.
+    """
+    buffer = io.BytesIO()
+    preview = []
+    preview_size = 0
+    count = 0
+    with gzip.GzipFile(filename="logs.log", mode='wb', fileobj=buffer) as dst:
+        for record in iter_log_range(log_file, start, end, min_level):
+            text = "\n".join(record) + "\n"
+            dst.write(text.encode('utf-8'))
+            count += 1
+            if preview is not None:
+                preview_size += len(text)
+                if preview_size > preview_limit:
+                    preview = None
+                else:
+                    preview.append(text)
+    buffer.seek(0)
+    return ("".join(preview) if preview is not None else None), buffer, count
@@ -11,23 +11,22 @@ from telegram.error import TelegramError
 # وارد کردن مدیر داده‌ها و پنل ادمین
 import data_manager
 import admin_panel
+import log_utils
+import metrics
+import monitoring
+import update_recorder
+import update_dedupe
+import update_processor
+import inbound_queue
+import ban_filter
+import overload
+import sharding
 
 # --- بهبود لاگینگ ---
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", 
-    level=logging.INFO,
-    filename=data_manager.LOG_FILE, 
-    filemode='a'
-)
+# نوشتن در فایل در thread پس‌زمینه، با چرخش فایل و محدودیت نرخ لاگ
+log_utils.setup_logging(data_manager.LOG_FILE)
 logger = logging.getLogger(__name__)
 
-try:
-    with open(data_manager.LOG_FILE, 'a') as f:
-        f.write("")
-except Exception as e:
-    print(f"FATAL: Could not write to log file at {data_manager.LOG_FILE}. Error: {e}")
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-
 # --- دیکشنری برای مدیریت وظایف پس‌زمینه هر کاربر ---
 user_tasks = {}
 
@@ -103,20 +102,32 @@ async def points_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         f"🕒 **آخرین فعالیت:** {user_points['last_activity']}"
     )
     
+    rank = data_manager.get_user_rank(user_id)
+    if rank:
+        points_text += f"\n🏅 **رتبه:** {rank[0]} از {rank[1]}"
+    if update.effective_chat.type in ('group', 'supergroup'):
+        chat_rank = data_manager.get_user_rank(user_id, update.effective_chat.id)
+        if chat_rank:
+            points_text += f"\n👥 **رتبه در این گروه:** {chat_rank[0]} از {chat_rank[1]}"
+    
     try:
         await update.message.reply_text(points_text, parse_mode='Markdown')
     except TelegramError as e:
         logger.error(f"Failed to send points message: {e}")
 
 async def top_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """نمایش کاربران برتر بر اساس امتیاز."""
-    top_users = data_manager.get_top_users_by_points(10)
+    """نمایش کاربران برتر بر اساس امتیاز (در گروه: اعضای همان گروه)."""
+    chat_id = update.effective_chat.id if update.effective_chat.type in ('group', 'supergroup') else None
+    top_users = data_manager.get_top_users_by_points(10, chat_id)
     
     if not top_users:
         await update.message.reply_text("هیچ کاربری با امتیاز یافت نشد.")
         return
     
-    top_users_text = "🏆 **کاربران برتر بر اساس امتیاز:**\n\n"
+    if chat_id is None:
+        top_users_text = "🏆 **کاربران برتر بر اساس امتیاز:**\n\n"
+    else:
+        top_users_text = "🏆 **کاربران برتر این گروه بر اساس امتیاز:**\n\n"
     
     for i, user in enumerate(top_users, 1):
         medal = ""
@@ -129,6 +140,10 @@ async def top_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         top_users_text += f"{i}. {medal} {user['name']} - {user['points']} امتیاز (سطح {user['level']})\n"
     
+    rank = data_manager.get_user_rank(update.effective_user.id, chat_id)
+    if rank:
+        top_users_text += f"\n🏅 رتبه شما: {rank[0]} از {rank[1]}"
+    
     try:
         await update.message.reply_text(top_users_text, parse_mode='Markdown')
     except TelegramError as e:
@@ -186,14 +201,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     chat_id = update.effective_chat.id
     message = update.message
     
-    # بررسی مسدود بودن کاربر (برای بن‌های سراسری از پنل ادمین)
-    if data_manager.is_user_banned(user_id):
-        logger.info(f"Globally banned user {user_id} tried to send a message in group {chat_id}.")
-        try:
-            await message.delete()
-        except Exception as e:
-            logger.error(f"Failed to delete message from globally banned user: {e}")
-        return
+    # پیام کاربران مسدود شده (بن سراسری از پنل ادمین) قبل از این هندلر در ban_filter حذف می‌شود
     
     # بررسی حالت نگهداری (فقط برای کاربران عادی)
     if data_manager.DATA.get('maintenance_mode', False) and user_id not in admin_panel.ADMIN_IDS:
@@ -256,13 +264,16 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     elif message.voice:
         message_type = 'voice'
     
-    data_manager.update_group_stats(chat_id, message_type)
+    # در حالت اضافه‌بار آمار گروه به صورت نمونه‌ای (هر N پیام یک بار با وزن N) ثبت می‌شود
+    stats_weight = overload.stats_weight()
+    if stats_weight:
+        data_manager.update_group_stats(chat_id, message_type, stats_weight)
     
     # به‌روزرسانی آمار کاربر
     level_up = data_manager.update_user_stats(user_id, update.effective_user)
     
-    # اگر کاربر سطح جدیدی کسب کرده، به او اطلاع دهید
-    if level_up:
+    # اگر کاربر سطح جدیدی کسب کرده، به او اطلاع دهید (در حالت اضافه‌بار حذف می‌شود)
+    if level_up and not overload.shed('level_up'):
         user_points = data_manager.get_user_points(user_id)
         try:
             await update.message.reply_text(
@@ -304,6 +315,10 @@ async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
             user_id = new_member.id
             data_manager.update_user_stats(user_id, new_member)
             
+            # در حالت اضافه‌بار پیام خوشامد ارسال نمی‌شود
+            if overload.shed('welcome'):
+                continue
+            
             welcome_msg = data_manager.DATA.get('welcome_message', 
                 "سلام {user_mention}! 🤖\n\nمن یک ربات مدیریت گروه هستم. با دستور /help از قابلیت‌های من مطلع شوید.")
             
@@ -326,8 +341,8 @@ async def handle_left_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if data_manager.DATA.get('auto_goodbye', True):
         left_member = update.message.left_chat_member
         
-        # نادیده گرفتن خود ربات
-        if left_member.is_bot:
+        # نادیده گرفتن خود ربات (و حذف پیام خداحافظی در حالت اضافه‌بار)
+        if left_member.is_bot or overload.shed('goodbye'):
             return
         
         goodbye_msg = data_manager.DATA.get('goodbye_message', 
@@ -344,6 +359,10 @@ async def handle_left_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # --- هندلرهای مدیریت گروه ---
 async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """مسدود کردن ارسال پیام کاربر (بدون اخراج از گروه)."""
+    # در چت خصوصی، /ban [آیدی] بن سراسری پنل ادمین است
+    if update.effective_chat.type == 'private':
+        await admin_panel.admin_ban(update, context)
+        return
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     
@@ -414,6 +433,10 @@ async def ban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 async def unban_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """رفع مسدودیت ارسال پیام کاربر."""
+    # در چت خصوصی، /unban [آیدی] رفع بن سراسری پنل ادمین است
+    if update.effective_chat.type == 'private':
+        await admin_panel.admin_unban(update, context)
+        return
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     
@@ -583,13 +606,8 @@ async def warn_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     target_user = update.message.reply_to_message.from_user
     target_user_id = target_user.id
     
-    # دریافت یا ایجاد شمارنده اخطار برای کاربر
-    if 'warnings' not in data_manager.DATA:
-        data_manager.DATA['warnings'] = {}
-    
-    user_warnings = data_manager.DATA['warnings'].get(str(target_user_id), 0)
-    user_warnings += 1
-    data_manager.DATA['warnings'][str(target_user_id)] = user_warnings
+    # افزایش اتمیک شمارنده اخطار کاربر
+    user_warnings = data_manager.incr(('warnings', str(target_user_id)))
     data_manager.save_data()
     
     # تعیین متن اخطار بر اساس تعداد اخطارها
@@ -797,10 +815,7 @@ async def setrules_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     new_rules = " ".join(context.args)
     
     # ذخیره قوانین جدید در دیتابیس
-    if 'group_rules' not in data_manager.DATA:
-        data_manager.DATA['group_rules'] = {}
-    
-    data_manager.DATA['group_rules'][str(chat_id)] = new_rules
+    data_manager.set_in(('group_rules', str(chat_id)), new_rules)
     data_manager.save_data()
     
     try:
@@ -856,19 +871,27 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     """Log Errors caused by Updates."""
     logger.error('Exception while handling an update: %s', context.error)
 
-def main() -> None:
-    token = os.environ.get("BOT_TOKEN")
-    if not token:
-        logger.error("BOT_TOKEN not set in environment variables!")
-        return
-
-    application = (
-        Application.builder()
-        .token(token)
-        .concurrent_updates(True)
-        .build()
-    )
-
+# --- راه‌اندازی و توقف سرویس‌های جانبی ---
+async def post_init(application: Application) -> None:
+    """سرویس‌های جانبی (مثل /metrics) را پس از راه‌اندازی ربات اجرا می‌کند."""
+    metrics.install_webhook_endpoint(application)
+    try:
+        application.bot_data['metrics_server'] = await metrics.start_metrics_server()
+    except OSError as e:
+        logger.error(f"Could not start metrics server: {e}")
+    monitoring.start_loop_monitor()
+
+async def post_shutdown(application: Application) -> None:
+    """سرویس‌های جانبی را هنگام توقف ربات می‌بندد."""
+    monitoring.stop_loop_monitor()
+    update_dedupe.save_dedupe()
+    server = application.bot_data.get('metrics_server')
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+def register_handlers(application: Application) -> None:
+    """تمام هندلرهای ربات و پنل ادمین را روی application ثبت می‌کند."""
     # ثبت مدیریت خطای عمومی
     application.add_error_handler(error_handler)
 
@@ -906,8 +929,59 @@ def main() -> None:
     # راه‌اندازی و ثبت هندلرهای پنل ادمین
     admin_panel.setup_admin_handlers(application)
 
+    # حذف آپدیت‌های تکراری (ارسال مجدد وب‌هوک) قبل از تمام هندلرها
+    update_dedupe.install(application)
+
+    # رد آپدیت‌های کاربران مسدود شده قبل از تمام هندلرهای عادی
+    ban_filter.install(application, admin_panel.ADMIN_IDS)
+
+    # ضبط آپدیت‌های ورودی برای بازپخش (فقط با UPDATE_RECORD_FILE)
+    update_recorder.install(application)
+
+    # اندازه‌گیری زمان اجرای تمام هندلرها
+    metrics.instrument_application(application)
+
+def build_application(token: str, request=None, get_updates_request=None) -> Application:
+    """Application کامل ربات را می‌سازد؛ بنچمارک‌ها می‌توانند یک request جایگزین بدهند."""
+    # آپدیت‌های هر چت به ترتیب، و چت‌های مختلف همزمان پردازش می‌شوند
+    processor = update_processor.ChatOrderedUpdateProcessor()
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(processor)
+        # صف ورودی محدود با اولویت برای ادمین‌ها و رویدادهای مدیریتی
+        .update_queue(inbound_queue.PriorityUpdateQueue(processor=processor, admin_ids=admin_panel.ADMIN_IDS))
+        .request(request or metrics.InstrumentedRequest())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    # آدرس جایگزین Bot API (مثلاً سرور جعلی benchmarks/fake_bot_api.py برای تست بار)
+    base_url = os.environ.get("BOT_API_BASE_URL")
+    if base_url:
+        base_url = base_url.rstrip('/')
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
+    register_handlers(application)
+    return application
+
+def main() -> None:
+    token = os.environ.get("BOT_TOKEN")
+    if not token:
+        logger.error("BOT_TOKEN not set in environment variables!")
+        return
+
     port = int(os.environ.get("PORT", 8443))
     webhook_url = os.environ.get("RENDER_EXTERNAL_URL") + "/webhook"
+
+    # حالت چند فرآیندی: این فرآیند فقط آپدیت‌ها را بین workerها پخش می‌کند
+    if sharding.WORKER_PROCESSES > 0:
+        bot = build_application(token).bot
+        sharding.run_front(bot, sharding.WORKER_PROCESSES, "0.0.0.0", port, webhook_url, "webhook")
+        return
+
+    application = build_application(token)
     
     application.run_webhook(
         listen="0.0.0.0",
@@ -0,0 +1,140 @@
+# memory_stats.py
+
+import os
+import sys
+import time
+import linecache
+import tracemalloc
+import logging
+
+import data_manager
+
+# --- تنظیمات ---
+# تعداد فریم‌های ذخیره شده برای هر تخصیص در حالت tracemalloc
+TRACE_FRAMES = int(os.environ.get("MEMORY_TRACE_FRAMES", 10))
+TOP_ALLOCATIONS = 10
+
+logger = logging.getLogger(__name__)
+
+# snapshot پایه برای مقایسه در حالت tracemalloc
+_baseline = None
+_baseline_time = None
+
+def deep_sizeof(obj) -> int:
+    """اندازه کامل یک شیء به همراه تمام اشیای داخلی آن (هر شیء فقط یک بار شمرده می‌شود).
+
+    پیمایش بدون بازگشت انجام می‌شود تا ساختارهای بزرگ باعث RecursionError نشوند. محتوای
+    dict و list با یک فراخوانی list() کپی می‌شود که در CPython اتمیک است؛ بنابراین اجرا
+    در thread جداگانه با وجود تغییر همزمان DATA خطای «changed size during iteration» نمی‌دهد.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            for key, value in list(current.items()):
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(list(current))
+        elif hasattr(current, '__dict__'):
+            stack.append(current.__dict__)
+    return total
+
+def section_sizes() -> list:
+    """اندازه عمیق و تعداد ورودی‌های هر بخش DATA، به ترتیب نزولی اندازه.
+
+    بخش‌های تک مقداری (تنظیمات، پیام‌ها و ...) در یک ردیف «other» جمع می‌شوند. بخش‌هایی که در
+    حالت چند فرآیندی در ذخیره‌ساز مشترک هستند (SharedSection) در حافظه فرآیند نیستند و اینجا
+    شمرده نمی‌شوند؛ اندازه آن‌ها را shared_section_sizes برمی‌گرداند.
+    """
+    rows = []
+    other_size = 0
+    for name, value in list(data_manager.DATA.items()):
+        if hasattr(value, 'storage_size'):
+            continue
+        size = deep_sizeof(value)
+        if isinstance(value, (dict, list, set)):
+            rows.append((name, len(value), size))
+        else:
+            other_size += size
+    rows.sort(key=lambda row: row[2], reverse=True)
+    if other_size:
+        rows.append(("other", None, other_size))
+    return rows
+
+def shared_section_sizes() -> list:
+    """تعداد ورودی‌ها و بایت‌های ذخیره شده در SQLite برای بخش‌های مشترک، به ترتیب نزولی اندازه."""
+    rows = [(name, *value.storage_size()) for name, value in list(data_manager.DATA.items())
+            if hasattr(value, 'storage_size')]
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows
+
+# --- حالت tracemalloc ---
+
+def is_tracing() -> bool:
+    return tracemalloc.is_tracing()
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+def start_tracing():
+    """tracemalloc را فعال کرده و snapshot پایه را می‌گیرد."""
+    global _baseline, _baseline_time
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+        logger.info(f"tracemalloc started with {TRACE_FRAMES} frames.")
+    _baseline = _take_snapshot()
+    _baseline_time = time.monotonic()
+
+def stop_tracing():
+    global _baseline, _baseline_time
+    _baseline = _baseline_time = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        logger.info("tracemalloc stopped.")
+
+def diff_since_baseline(limit: int = TOP_ALLOCATIONS) -> tuple:
+    """محل‌های تخصیصی که از آخرین snapshot بیشترین رشد را داشته‌اند.
+
+    snapshot جدید جایگزین snapshot پایه می‌شود تا فراخوانی بعدی فقط رشد دوره بعد را نشان دهد.
+    خروجی: (فاصله زمانی به ثانیه, لیست (محل, خط کد, رشد بایت, رشد تعداد, اندازه کل), کل حافظه ردیابی شده)
+    """
+    global _baseline, _baseline_time
+    if _baseline is None:
+        raise RuntimeError("tracemalloc is not running")
+
+    snapshot = _take_snapshot()
+    now = time.monotonic()
+    elapsed = now - _baseline_time
+    rows = []
+    for stat in snapshot.compare_to(_baseline, 'lineno'):
+        if stat.size_diff <= 0:
+            continue
+        frame = stat.traceback[0]
+        location = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+        source = linecache.getline(frame.filename, frame.lineno).strip()
+        rows.append((location, source, stat.size_diff, stat.count_diff, stat.size))
+        if len(rows) >= limit:
+            break
+
+    traced_current, _ = tracemalloc.get_traced_memory()
+    _baseline, _baseline_time = snapshot, now
+    return elapsed, rows, traced_current
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
@@ -0,0 +1,334 @@
+# metrics.py
+
+import os
+import hmac
+import time
+import bisect
+import asyncio
+import functools
+import logging
+import tornado.web
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler, ApplicationHandlerStop
+from telegram.request import HTTPXRequest
+
+import data_manager
+
+# --- تنظیمات ---
+# /metrics روی همان سرور وب‌هوک (پورت PORT که Render مسیردهی می‌کند) و فقط با تنظیم METRICS_TOKEN
+# ارائه می‌شود؛ درخواست‌ها باید هدر Authorization: Bearer <token> داشته باشند
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_PATH = "/metrics"
+# سرور جداگانه اختیاری (0 یعنی غیرفعال)، مثلاً برای حالت چند فرآیندی که پورت وب‌هوک متعلق به front است و
+# هر worker روی METRICS_PORT+1+index گوش می‌دهد؛ این پورت‌ها در Render در دسترس نیستند
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+# مرزهای بازه‌های هیستوگرام زمان پاسخ (ثانیه)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = []
+
+# هندلر در حال اجرا برای هر task (برای شناسایی هندلرهایی که حلقه رویداد را مسدود می‌کنند)
+ACTIVE_HANDLERS = {}
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+# --- انواع متریک ---
+
+class Counter:
+    """شمارنده افزایشی با برچسب‌های اختیاری."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, *label_values):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def reset(self):
+        self._values.clear()
+
+    def render(self) -> list:
+        if not self.label_names and not self._values:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+                for labels, value in self._values.items()]
+
+class Gauge(Counter):
+    """مقدار لحظه‌ای؛ می‌تواند با تابع callback هنگام خروجی گرفتن محاسبه شود."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), callback=None):
+        super().__init__(name, help_text, label_names)
+        self.callback = callback
+
+    def set(self, value: float, *label_values):
+        self._values[label_values] = value
+
+    def render(self) -> list:
+        if self.callback is not None:
+            try:
+                self._values = dict(self.callback())
+            except Exception as e:
+                logger.warning(f"Gauge callback for {self.name} failed: {e}")
+        return super().render()
+
+class Histogram:
+    """هیستوگرام با بازه‌های ثابت؛ ثبت هر مقدار فقط یک جستجوی دودویی است."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # برای هر ترکیب برچسب: [شمارش هر بازه (+Inf در انتها), مجموع, تعداد]
+        self._series = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def quantile(self, q: float, *label_values) -> float:
+        """تخمین چندک با درون‌یابی خطی داخل بازه مربوطه."""
+        series = self._series.get(label_values)
+        if not series or not series[2]:
+            return 0.0
+        rank = q * series[2]
+        cumulative = 0
+        for i, bucket_count in enumerate(series[0]):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def label_sets(self) -> list:
+        return list(self._series.keys())
+
+    def reset(self):
+        self._series.clear()
+
+    def render(self) -> list:
+        lines = []
+        for labels, (bucket_counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+# --- متریک‌های ربات ---
+
+UPDATES = Counter("bot_updates_total", "Updates received from Telegram")
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Handler execution time", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handler calls that raised an exception", ("handler",))
+API_CALLS = Counter("bot_api_calls_total", "Bot API requests", ("method",))
+API_ERRORS = Counter("bot_api_errors_total", "Bot API requests that failed", ("method",))
+API_FLOOD_WAITS = Counter("bot_api_flood_waits_total", "Bot API requests rejected with 429 RetryAfter", ("method",))
+API_LATENCY = Histogram("bot_api_duration_seconds", "Bot API request time", ("method",))
+API_IN_FLIGHT = Gauge("bot_api_requests_in_flight", "Bot API requests waiting for a response")
+API_IN_FLIGHT.set(0)
+
+def _handler_quantiles():
+    for window in ("5m", "1h", "all"):
+        for handler, sketch in data_manager.get_response_stats(window).items():
+            if sketch.count:
+                for q in QUANTILES:
+                    yield (handler, window, str(q)), sketch.quantile(q)
+
+HANDLER_QUANTILES = Gauge("bot_handler_duration_quantile_seconds", "Handler latency quantiles from streaming sketches",
+                          ("handler", "window", "quantile"), callback=_handler_quantiles)
+
+def render() -> str:
+    """تمام متریک‌ها را در قالب متنی Prometheus برمی‌گرداند."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- اندازه‌گیری هندلرها ---
+
+def timed(callback, name: str = None):
+    """هندلر را طوری می‌پوشاند که زمان اجرا و خطاهایش ثبت شود."""
+    name = name or getattr(callback, '__name__', 'handler')
+
+    @functools.wraps(callback)
+    async def wrapped(update, context):
+        task = asyncio.current_task()
+        ACTIVE_HANDLERS[task] = name
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(1, name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            ACTIVE_HANDLERS.pop(task, None)
+            HANDLER_LATENCY.observe(elapsed, name)
+            data_manager.update_response_stats(name, elapsed)
+    return wrapped
+
+async def _count_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    UPDATES.inc()
+
+def instrument_application(application):
+    """تمام هندلرهای ثبت شده را برای اندازه‌گیری زمان می‌پوشاند و شمارنده آپدیت‌ها را اضافه می‌کند."""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = timed(handler.callback)
+    application.add_handler(TypeHandler(Update, _count_update), group=-100)
+
+class InstrumentedRequest(HTTPXRequest):
+    """درخواست HTTP به Bot API که تعداد، خطاها، flood-wait و زمان هر متد را ثبت می‌کند."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        API_CALLS.inc(1, api_method)
+        API_IN_FLIGHT.inc(1)
+        start = time.perf_counter()
+        try:
+            status_code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            API_ERRORS.inc(1, api_method)
+            raise
+        finally:
+            API_IN_FLIGHT.inc(-1)
+            API_LATENCY.observe(time.perf_counter() - start, api_method)
+        if status_code == 429:
+            API_FLOOD_WAITS.inc(1, api_method)
+        if status_code >= 400:
+            API_ERRORS.inc(1, api_method)
+        return status_code, payload
+
+# --- سرور HTTP برای /metrics ---
+
+def _authorized(authorization: str) -> bool:
+    return not METRICS_TOKEN or hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode())
+
+class _MetricsHandler(tornado.web.RequestHandler):
+    """مسیر /metrics روی برنامه tornado سرور وب‌هوک PTB."""
+
+    def get(self):
+        if not _authorized(self.request.headers.get("Authorization", "")):
+            self.set_status(401)
+            self.write("unauthorized\n")
+            return
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render())
+
+def mount_on_webhook(application) -> bool:
+    """/metrics را به سرور وب‌هوک در حال اجرای run_webhook اضافه می‌کند.
+
+    PTB راه عمومی برای افزودن مسیر به سرور وب‌هوک ندارد؛ برنامه tornado پس از شروع سرور از updater
+    خوانده می‌شود. بدون METRICS_TOKEN مسیر اضافه نمی‌شود، چون این پورت عمومی است.
+    """
+    if not METRICS_TOKEN:
+        logger.info("METRICS_TOKEN is not set; /metrics is not served on the webhook port.")
+        return False
+    # workerهای حالت چند فرآیندی سرور وب‌هوک ندارند
+    if application.updater is None or not application.updater.running:
+        logger.debug("No webhook server is running; /metrics was not mounted.")
+        return False
+    server = getattr(application.updater, "_httpd", None)
+    if server is None:
+        logger.warning("Updater is running without a webhook server; /metrics was not mounted.")
+        return False
+    server._http_server.request_callback.add_handlers(r".*", [(METRICS_PATH, _MetricsHandler)])
+    logger.info(f"Metrics endpoint mounted on the webhook server at {METRICS_PATH}.")
+    return True
+
+async def _mount_job(context: ContextTypes.DEFAULT_TYPE):
+    mount_on_webhook(context.application)
+
+def install_webhook_endpoint(application):
+    """اتصال /metrics پس از شروع سرور وب‌هوک؛ run_webhook صف وظایف را پس از سرور شروع می‌کند."""
+    if application.job_queue is not None:
+        application.job_queue.run_once(_mount_job, 0, name="mount_metrics")
+
+async def _handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # از هدرها فقط Authorization خوانده می‌شود
+        authorization = ""
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'authorization':
+                authorization = value.strip()
+
+        parts = request_line.decode('latin-1').split()
+        path = parts[1].split('?', 1)[0] if len(parts) > 1 else ''
+        if not _authorized(authorization):
+            body = b"unauthorized\n"
+            status = "401 Unauthorized"
+        elif path == METRICS_PATH:
+            body = render().encode('utf-8')
+            status = "200 OK"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """سرور /metrics را روی پورت مشخص در همان event loop ربات اجرا می‌کند."""
+    if not port:
+        return None
+    if not METRICS_TOKEN and host not in ("127.0.0.1", "localhost", "::1"):
+        logger.warning(f"Metrics endpoint on {host}:{port} is public without METRICS_TOKEN.")
+    server = await asyncio.start_server(_handle_metrics_request, host=host, port=port)
+    logger.info(f"Metrics endpoint listening on {host}:{port}.")
+    return server
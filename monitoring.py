@@ -0,0 +1,243 @@
+# monitoring.py
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import logging
+from collections import deque
+from datetime import datetime
+
+import psutil
+from telegram.ext import ContextTypes
+
+import data_manager
+import metrics
+
+# --- تنظیمات ---
+# فاصله اندازه‌گیری تأخیر حلقه رویداد و آستانه تشخیص callback کند (ثانیه)
+LOOP_MONITOR_INTERVAL = float(os.environ.get("LOOP_MONITOR_INTERVAL", 0.5))
+SLOW_CALLBACK_THRESHOLD = float(os.environ.get("SLOW_CALLBACK_THRESHOLD", 0.1))
+# حالت debug خود asyncio هزینه زیادی دارد و فقط در صورت نیاز فعال می‌شود
+LOOP_DEBUG = os.environ.get("LOOP_DEBUG", "0") == "1"
+MAX_INCIDENTS = 20
+INCIDENT_STACK_DEPTH = 25
+
+# نمونه‌برداری منابع فرآیند و نگهداری تاریخچه یک ساعت اخیر
+RESOURCE_SAMPLE_INTERVAL = float(os.environ.get("RESOURCE_SAMPLE_INTERVAL", 5))
+RESOURCE_HISTORY_SECONDS = 3600
+DATA_SECTIONS = ("users", "user_points", "user_message_counts", "group_stats", "scheduled_broadcasts",
+                 "banned_users", "warnings")
+
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG = metrics.Histogram("bot_event_loop_lag_seconds", "Event loop scheduling lag", buckets=LOOP_LAG_BUCKETS)
+SLOW_CALLBACKS = metrics.Counter("bot_slow_callbacks_total", "Event loop blocks longer than the threshold", ("handler",))
+
+logger = logging.getLogger(__name__)
+
+# آخرین موارد مسدود شدن حلقه رویداد برای نمایش در /system_info
+INCIDENTS = deque(maxlen=MAX_INCIDENTS)
+
+class LoopMonitor:
+    """تأخیر حلقه رویداد را از یک thread جداگانه اندازه می‌گیرد.
+
+    هر نصف آستانه یک callback با call_soon_threadsafe در حلقه زمان‌بندی می‌شود. اگر اجرای آن
+    بیش از آستانه طول بکشد، پشته thread حلقه در همان لحظه ثبت می‌شود تا کد مسدود کننده
+    و هندلر مربوطه مشخص شوند. بیشترین تأخیر هر دوره (interval) در متریک‌ها ثبت می‌شود.
+    باید از داخل thread حلقه رویداد ساخته شود.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = LOOP_MONITOR_INTERVAL,
+                 threshold: float = SLOW_CALLBACK_THRESHOLD):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.last_lag = 0.0
+        self._loop_thread_id = threading.get_ident()
+        self._acked = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loop-monitor", daemon=True)
+
+    def start(self):
+        self.loop.slow_callback_duration = self.threshold
+        if LOOP_DEBUG:
+            self.loop.set_debug(True)
+        self._thread.start()
+        logger.info(f"Event loop monitor started (interval={self.interval}s, threshold={self.threshold}s).")
+
+    def stop(self):
+        self._stopped.set()
+
+    def _ack(self):
+        self._acked.set()
+
+    def _run(self):
+        period_start = time.monotonic()
+        period_max_lag = 0.0
+        while not self._stopped.is_set():
+            self._acked.clear()
+            sent = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(self._ack)
+            except RuntimeError:
+                # حلقه بسته شده است
+                return
+
+            if not self._acked.wait(self.threshold):
+                incident = self._capture()
+                while not self._acked.wait(self.interval):
+                    if self._stopped.is_set():
+                        return
+                incident['duration'] = time.monotonic() - sent
+                self._record(incident)
+
+            now = time.monotonic()
+            period_max_lag = max(period_max_lag, now - sent)
+            if now - period_start >= self.interval:
+                self.last_lag = period_max_lag
+                LOOP_LAG.observe(period_max_lag)
+                period_start, period_max_lag = now, 0.0
+            self._stopped.wait(self.threshold / 2)
+
+    def _capture(self) -> dict:
+        """پشته thread حلقه رویداد و هندلر در حال اجرا را در لحظه مسدود بودن ثبت می‌کند."""
+        task = asyncio.current_task(self.loop)
+        handler = metrics.ACTIVE_HANDLERS.get(task, "-") if task is not None else "-"
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame, limit=INCIDENT_STACK_DEPTH) if frame is not None else []
+        frame = None
+        return {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'handler': handler,
+            'stack': stack,
+            'duration': 0.0,
+        }
+
+    def _record(self, incident: dict):
+        INCIDENTS.append(incident)
+        SLOW_CALLBACKS.inc(1, incident['handler'])
+        location = incident['stack'][-1].strip().splitlines()[0] if incident['stack'] else "-"
+        logger.warning(
+            f"Event loop blocked for {incident['duration']*1000:.0f}ms in handler {incident['handler']} "
+            f"at {location}\n{''.join(incident['stack'])}"
+        )
+
+_loop_monitor = None
+
+def start_loop_monitor(loop: asyncio.AbstractEventLoop = None) -> LoopMonitor:
+    """مانیتور تأخیر حلقه رویداد را برای حلقه فعلی راه‌اندازی می‌کند."""
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = LoopMonitor(loop or asyncio.get_running_loop())
+        _loop_monitor.start()
+    return _loop_monitor
+
+def stop_loop_monitor():
+    global _loop_monitor
+    if _loop_monitor is not None:
+        _loop_monitor.stop()
+        _loop_monitor = None
+
+def current_loop_lag() -> float:
+    """آخرین تأخیر اندازه‌گیری شده حلقه رویداد (ثانیه)."""
+    return _loop_monitor.last_lag if _loop_monitor is not None else 0.0
+
+def recent_incidents(limit: int = 5) -> list:
+    return list(INCIDENTS)[-limit:]
+
+# --- نمونه‌برداری منابع فرآیند ---
+
+class ResourceHistory:
+    """تاریخچه مقادیر هر منبع در بافرهای حلقوی با اندازه ثابت."""
+
+    def __init__(self, interval: float = RESOURCE_SAMPLE_INTERVAL, seconds: float = RESOURCE_HISTORY_SECONDS):
+        self.maxlen = max(2, int(seconds / interval))
+        self.timestamps = deque(maxlen=self.maxlen)
+        self.series = {}
+
+    def add(self, timestamp: float, values: dict):
+        self.timestamps.append(timestamp)
+        for name, value in values.items():
+            series = self.series.get(name)
+            if series is None:
+                series = self.series[name] = deque(maxlen=self.maxlen)
+            series.append(value)
+
+    def current(self, name: str):
+        series = self.series.get(name)
+        return series[-1] if series else None
+
+    def summary(self, name: str) -> dict:
+        """مقدار فعلی، کمینه، بیشینه و روند (تغییر بر ساعت با رگرسیون خطی) را برمی‌گرداند."""
+        values = list(self.series.get(name, ()))
+        if not values:
+            return None
+        timestamps = list(self.timestamps)[-len(values):]
+        trend = 0.0
+        if len(values) > 1:
+            mean_t = sum(timestamps) / len(timestamps)
+            mean_v = sum(values) / len(values)
+            variance = sum((t - mean_t) ** 2 for t in timestamps)
+            if variance:
+                slope = sum((t - mean_t) * (v - mean_v) for t, v in zip(timestamps, values)) / variance
+                trend = slope * 3600
+        return {'current': values[-1], 'min': min(values), 'max': max(values), 'trend': trend}
+
+RESOURCE_HISTORY = ResourceHistory()
+
+_process = psutil.Process()
+_process.cpu_percent(None)
+
+def _open_fds() -> int:
+    try:
+        return _process.num_fds()
+    except AttributeError:
+        # ویندوز
+        return _process.num_handles()
+
+def collect_resources() -> dict:
+    """مقادیر فعلی منابع فرآیند، تعداد taskها، اندازه بخش‌های DATA و صف درخواست‌های خروجی."""
+    values = {
+        'rss_mb': _process.memory_info().rss / (1024 ** 2),
+        'cpu_percent': _process.cpu_percent(None),
+        'open_fds': _open_fds(),
+        'asyncio_tasks': len(asyncio.all_tasks()),
+        'outbound_in_flight': metrics.API_IN_FLIGHT.value(),
+    }
+    for section in DATA_SECTIONS:
+        values[f'data_{section}'] = len(data_manager.DATA.get(section, ()))
+    return values
+
+async def sample_resources(context: ContextTypes.DEFAULT_TYPE):
+    """وظیفه دوره‌ای نمونه‌برداری منابع که توسط job_queue اجرا می‌شود."""
+    try:
+        RESOURCE_HISTORY.add(time.time(), collect_resources())
+    except Exception as e:
+        logger.warning(f"Resource sampling failed: {e}")
+
+def _resource_gauge():
+    for name, series in RESOURCE_HISTORY.series.items():
+        if series:
+            yield (name,), series[-1]
+
+RESOURCES = metrics.Gauge("bot_process_resource", "Latest sampled process resource values", ("resource",),
+                          callback=_resource_gauge)
+
+def render_resource_chart(path: str, names: tuple = ('rss_mb', 'cpu_percent', 'asyncio_tasks', 'outbound_in_flight')):
+    """نمودار تاریخچه منابع را در فایل PNG ذخیره می‌کند (بدون استفاده از حالت سراسری pyplot)."""
+    from matplotlib.figure import Figure
+
+    timestamps = list(RESOURCE_HISTORY.timestamps)
+    start = timestamps[0] if timestamps else 0
+    figure = Figure(figsize=(10, 2.2 * len(names)))
+    axes = figure.subplots(len(names), 1, sharex=True, squeeze=False)
+    for axis, name in zip(axes[:, 0], names):
+        values = list(RESOURCE_HISTORY.series.get(name, ()))
+        minutes = [(t - start) / 60 for t in timestamps[-len(values):]] if values else []
+        axis.plot(minutes, values)
+        axis.set_ylabel(name)
+        axis.grid(True, alpha=0.3)
+    axes[-1, 0].set_xlabel('minutes')
+    figure.savefig(path, bbox_inches='tight')
@@ -0,0 +1,131 @@
+# overload.py
+
+import os
+import time
+import logging
+from telegram.ext import ContextTypes
+
+import metrics
+import monitoring
+import inbound_queue
+
+# --- تنظیمات ---
+# ورود به حالت اضافه‌بار وقتی آپدیت‌های عقب‌افتاده (منتظر در صف ورودی یا پذیرفته شده و در حال پردازش)
+# یا تأخیر حلقه رویداد از آستانه بالا بگذرد؛
+# بازگشت به حالت عادی فقط وقتی هر دو برای مدت OVERLOAD_RECOVERY_SECONDS زیر آستانه پایین بمانند
+OVERLOAD_QUEUE_HIGH = int(os.environ.get("OVERLOAD_QUEUE_HIGH", 500))
+OVERLOAD_QUEUE_LOW = int(os.environ.get("OVERLOAD_QUEUE_LOW", 100))
+OVERLOAD_LAG_HIGH = float(os.environ.get("OVERLOAD_LAG_HIGH", 0.5))
+OVERLOAD_LAG_LOW = float(os.environ.get("OVERLOAD_LAG_LOW", 0.1))
+OVERLOAD_RECOVERY_SECONDS = float(os.environ.get("OVERLOAD_RECOVERY_SECONDS", 30))
+OVERLOAD_CHECK_INTERVAL = float(os.environ.get("OVERLOAD_CHECK_INTERVAL", 1))
+# در حالت اضافه‌بار از هر N پیام فقط یکی (با وزن N) در آمار گروه ثبت می‌شود
+OVERLOAD_STATS_SAMPLE = int(os.environ.get("OVERLOAD_STATS_SAMPLE", 10))
+
+NORMAL, OVERLOADED = "normal", "overloaded"
+
+logger = logging.getLogger(__name__)
+
+def _mode_value():
+    return {(): 1 if CONTROLLER.overloaded else 0}
+
+OVERLOAD_MODE = metrics.Gauge("bot_overload_mode", "1 while non-essential work is being shed", callback=_mode_value)
+OVERLOAD_TRANSITIONS = metrics.Counter("bot_overload_transitions_total", "Overload mode changes", ("mode",))
+SHED_WORK = metrics.Counter("bot_shed_work_total", "Non-essential work skipped in overload mode", ("kind",))
+
+class OverloadController:
+    """حالت اضافه‌بار را با هیسترزیس (دو آستانه و حداقل زمان آرامش) از روی سیگنال‌های بار تعیین می‌کند."""
+
+    def __init__(self, queue_high: int = OVERLOAD_QUEUE_HIGH, queue_low: int = OVERLOAD_QUEUE_LOW,
+                 lag_high: float = OVERLOAD_LAG_HIGH, lag_low: float = OVERLOAD_LAG_LOW,
+                 recovery_seconds: float = OVERLOAD_RECOVERY_SECONDS, stats_sample: int = OVERLOAD_STATS_SAMPLE):
+        self.queue_high = queue_high
+        self.queue_low = min(queue_low, queue_high)
+        self.lag_high = lag_high
+        self.lag_low = min(lag_low, lag_high)
+        self.recovery_seconds = recovery_seconds
+        self.stats_sample = max(1, stats_sample)
+        self.mode = NORMAL
+        self.since = time.time()
+        self.reason = ""
+        self.queue_depth = 0
+        self.loop_lag = 0.0
+        self._calm_since = None
+        self._stats_counter = 0
+
+    @property
+    def overloaded(self) -> bool:
+        return self.mode == OVERLOADED
+
+    def _set_mode(self, mode: str, reason: str, now: float):
+        duration = now - self.since
+        previous, self.mode, self.since, self.reason = self.mode, mode, now, reason
+        OVERLOAD_TRANSITIONS.inc(1, mode)
+        if mode == OVERLOADED:
+            logger.warning(f"Entering overload mode after {duration:.0f}s in {previous} mode: {reason}.")
+        else:
+            logger.warning(f"Leaving overload mode after {duration:.0f}s: {reason}.")
+
+    def evaluate(self, queue_depth: int, loop_lag: float, now: float = None) -> str:
+        """سیگنال‌های جدید را اعمال کرده و حالت فعلی را برمی‌گرداند."""
+        now = time.time() if now is None else now
+        self.queue_depth, self.loop_lag = queue_depth, loop_lag
+        if not self.overloaded:
+            if queue_depth >= self.queue_high or loop_lag >= self.lag_high:
+                self._set_mode(OVERLOADED, f"queue depth {queue_depth}, loop lag {loop_lag * 1000:.0f}ms", now)
+                self._calm_since = None
+        elif queue_depth <= self.queue_low and loop_lag <= self.lag_low:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.recovery_seconds:
+                self._set_mode(NORMAL, f"queue depth {queue_depth}, loop lag {loop_lag * 1000:.0f}ms "
+                                       f"for {now - self._calm_since:.0f}s", now)
+        else:
+            self._calm_since = None
+        return self.mode
+
+    def shed(self, kind: str) -> bool:
+        """True اگر کار غیرضروری از نوع kind باید در حالت فعلی حذف شود."""
+        if self.overloaded:
+            SHED_WORK.inc(1, kind)
+            return True
+        return False
+
+    def stats_weight(self) -> int:
+        """وزن ثبت آمار گروه برای این پیام؛ صفر یعنی این پیام در نمونه نیست."""
+        if not self.overloaded:
+            return 1
+        self._stats_counter += 1
+        if self._stats_counter % self.stats_sample:
+            SHED_WORK.inc(1, "group_stats")
+            return 0
+        return self.stats_sample
+
+CONTROLLER = OverloadController()
+
+def is_overloaded() -> bool:
+    return CONTROLLER.overloaded
+
+def shed(kind: str) -> bool:
+    return CONTROLLER.shed(kind)
+
+def stats_weight() -> int:
+    return CONTROLLER.stats_weight()
+
+def status() -> dict:
+    """وضعیت فعلی برای نمایش در /system_info."""
+    return {
+        'mode': CONTROLLER.mode,
+        'duration': time.time() - CONTROLLER.since,
+        'reason': CONTROLLER.reason,
+        'queue_depth': CONTROLLER.queue_depth,
+        'loop_lag': CONTROLLER.loop_lag,
+    }
+
+async def check_overload(context: ContextTypes.DEFAULT_TYPE):
+    """وظیفه دوره‌ای ارزیابی بار."""
+    CONTROLLER.evaluate(inbound_queue.backlog(), monitoring.current_loop_lag())
+
+def install(application):
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(check_overload, interval=OVERLOAD_CHECK_INTERVAL, first=OVERLOAD_CHECK_INTERVAL)
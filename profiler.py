@@ -0,0 +1,142 @@
+# profiler.py
+
+import os
+import io
+import sys
+import time
+import asyncio
+import cProfile
+import pstats
+import threading
+import logging
+from collections import Counter
+
+# --- تنظیمات ---
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+MAX_PROFILE_SECONDS = 120
+# محدودیت حافظه: حداکثر تعداد پشته‌های متمایز و عمق هر پشته
+MAX_STACKS = 20000
+MAX_STACK_DEPTH = 64
+TRUNCATED_STACK = ("[other stacks]",)
+
+logger = logging.getLogger(__name__)
+
+# در هر لحظه فقط یک جلسه پروفایل؛ بررسی و شروع جلسه زیر یک قفل انجام می‌شود
+_session_lock = threading.Lock()
+_session_active = False
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class ProfileReport:
+    """نتیجه پروفایل: شمارش نمونه‌ها به تفکیک تابع و پشته."""
+
+    def __init__(self, mode: str, samples: int, duration: float):
+        self.mode = mode
+        self.samples = samples
+        self.duration = duration
+        self.self_counts = Counter()
+        self.cumulative_counts = Counter()
+        self.stacks = Counter()
+        self.text_dump = None
+
+    def top(self, counts: Counter, limit: int = 15) -> list:
+        total = max(self.samples, 1)
+        return [(label, count, count * 100 / total) for label, count in counts.most_common(limit)]
+
+    def collapsed(self) -> bytes:
+        """پشته‌ها را در قالب collapsed (قابل استفاده در flamegraph.pl و speedscope) برمی‌گرداند."""
+        if self.text_dump is not None:
+            return self.text_dump.encode('utf-8')
+        lines = [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+class SamplingProfiler:
+    """با یک thread جداگانه، پشته thread هدف را در فواصل ثابت نمونه‌برداری می‌کند."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+
+    def run(self, duration: float) -> ProfileReport:
+        report = ProfileReport("sampling", 0, duration)
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            frame = None
+            stack.reverse()
+
+            report.samples += 1
+            report.self_counts[stack[-1]] += 1
+            for label in set(stack):
+                report.cumulative_counts[label] += 1
+
+            key = tuple(stack)
+            if key in report.stacks or len(report.stacks) < MAX_STACKS:
+                report.stacks[key] += 1
+            else:
+                report.stacks[TRUNCATED_STACK] += 1
+
+            time.sleep(self.interval)
+        return report
+
+async def _profile_with_cprofile(seconds: float) -> ProfileReport:
+    """جایگزین برای مفسرهایی که sys._current_frames ندارند: cProfile روی thread حلقه رویداد."""
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile.disable()
+
+    stats = pstats.Stats(profile)
+    report = ProfileReport("cprofile", 0, seconds)
+    for (filename, lineno, name), (_, _, self_time, cumulative_time, _) in stats.stats.items():
+        label = f"{name} ({os.path.basename(filename)}:{lineno})"
+        # زمان‌ها به میلی‌ثانیه تبدیل می‌شوند تا با شمارش نمونه‌ها قابل مقایسه باشند
+        report.self_counts[label] = int(self_time * 1000)
+        report.cumulative_counts[label] = int(cumulative_time * 1000)
+    report.samples = max(report.self_counts.total(), 1)
+
+    dump = io.StringIO()
+    pstats.Stats(profile, stream=dump).sort_stats('cumulative').print_stats(200)
+    report.text_dump = dump.getvalue()
+    return report
+
+def is_running() -> bool:
+    return _session_active
+
+def try_start() -> bool:
+    """جلسه پروفایل را رزرو می‌کند؛ False اگر جلسه دیگری فعال باشد. پس از True باید finish() صدا زده شود."""
+    global _session_active
+    with _session_lock:
+        if _session_active:
+            return False
+        _session_active = True
+        return True
+
+def finish():
+    """جلسه رزرو شده با try_start را پایان می‌دهد."""
+    global _session_active
+    with _session_lock:
+        _session_active = False
+
+async def profile(seconds: float) -> ProfileReport:
+    """فرآیند ربات را به مدت مشخص پروفایل می‌کند؛ جلسه باید پیش‌تر با try_start رزرو شده باشد."""
+    seconds = max(1.0, min(float(seconds), MAX_PROFILE_SECONDS))
+    logger.info(f"Starting {seconds:.0f}s profile.")
+    if hasattr(sys, '_current_frames'):
+        sampler = SamplingProfiler(threading.get_ident())
+        report = await asyncio.to_thread(sampler.run, seconds)
+    else:
+        report = await _profile_with_cprofile(seconds)
+    logger.info(f"Profile finished with {report.samples} samples.")
+    return report
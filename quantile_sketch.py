@@ -0,0 +1,118 @@
+# quantile_sketch.py
+
+import math
+import time
+
+# --- تنظیمات ---
+# دقت نسبی چندک‌ها (۲٪) و محدوده مقادیر قابل ثبت (ثانیه)
+RELATIVE_ACCURACY = 0.02
+MIN_VALUE = 1e-6
+MAX_VALUE = 1e3
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_MIN_INDEX = math.floor(math.log(MIN_VALUE) / _LOG_GAMMA)
+_MAX_INDEX = math.ceil(math.log(MAX_VALUE) / _LOG_GAMMA)
+
+class LatencySketch:
+    """اسکچ چندک با بازه‌های لگاریتمی (شبیه HDR/DDSketch).
+
+    حافظه ثابت است (حداکثر چند صد بازه) و دو اسکچ را می‌توان با جمع شمارش‌ها ادغام کرد.
+    """
+
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, value: float):
+        clamped = min(max(value, MIN_VALUE), MAX_VALUE)
+        index = math.ceil(math.log(clamped) / _LOG_GAMMA)
+        index = min(max(index, _MIN_INDEX), _MAX_INDEX)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "LatencySketch"):
+        for index, bucket_count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + bucket_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """مقدار چندک q (بین 0 و 1) را با خطای نسبی حداکثر RELATIVE_ACCURACY برمی‌گرداند."""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        cumulative = 0
+        for index in sorted(self.buckets):
+            cumulative += self.buckets[index]
+            if cumulative > rank:
+                value = 2 * _GAMMA ** index / (_GAMMA + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+class WindowedSketch:
+    """اسکچ پنجره لغزان زمانی که از چند زیربازه حلقوی تشکیل شده است."""
+
+    def __init__(self, window_seconds: float, slots: int):
+        self.slot_seconds = window_seconds / slots
+        self.slots = slots
+        self._ring = [(None, LatencySketch()) for _ in range(slots)]
+
+    def add(self, value: float, now: float = None):
+        slot_id = int((now if now is not None else time.time()) // self.slot_seconds)
+        position = slot_id % self.slots
+        current_id, sketch = self._ring[position]
+        if current_id != slot_id:
+            sketch = LatencySketch()
+            self._ring[position] = (slot_id, sketch)
+        sketch.add(value)
+
+    def snapshot(self, now: float = None) -> LatencySketch:
+        """اسکچ ادغام شده زیربازه‌های داخل پنجره فعلی را برمی‌گرداند."""
+        current_id = int((now if now is not None else time.time()) // self.slot_seconds)
+        merged = LatencySketch()
+        for slot_id, sketch in self._ring:
+            if slot_id is not None and current_id - slot_id < self.slots:
+                merged.merge(sketch)
+        return merged
+
+class ResponseStats:
+    """آمار زمان پاسخ یک هندلر در پنجره‌های ۵ دقیقه، یک ساعت و کل زمان."""
+
+    WINDOWS = ("5m", "1h", "all")
+
+    def __init__(self):
+        self.last_5m = WindowedSketch(300, 5)
+        self.last_1h = WindowedSketch(3600, 12)
+        self.all_time = LatencySketch()
+
+    def add(self, value: float, now: float = None):
+        now = now if now is not None else time.time()
+        self.last_5m.add(value, now)
+        self.last_1h.add(value, now)
+        self.all_time.add(value)
+
+    def snapshot(self, window: str = "all", now: float = None) -> LatencySketch:
+        if window == "5m":
+            return self.last_5m.snapshot(now)
+        if window == "1h":
+            return self.last_1h.snapshot(now)
+        merged = LatencySketch()
+        merged.merge(self.all_time)
+        return merged
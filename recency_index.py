@@ -0,0 +1,101 @@
+# recency_index.py
+
+from bisect import bisect_left, bisect_right
+
+class RecencyIndex:
+    """شاخص کاربران مرتب بر اساس زمان آخرین فعالیت.
+
+    زمان‌ها رشته‌های '%Y-%m-%d %H:%M:%S' هستند که ترتیب متنی آن‌ها همان ترتیب زمانی است، پس
+    بدون strptime مقایسه می‌شوند. دو آرایه موازی (زمان‌ها به ترتیب صعودی و شناسه‌ها) با bisect
+    جستجو می‌شوند و نگاشت شناسه به زمان، جایگاه هر کاربر را در O(log n) پیدا می‌کند. کاربر بدون
+    زمان فعالیت با رشته خالی (قدیمی‌ترین) ثبت می‌شود.
+    """
+
+    __slots__ = ("_times", "_ids", "_position")
+
+    def __init__(self, items=()):
+        ordered = sorted((last_seen or '', user_id) for user_id, last_seen in items)
+        self._times = [last_seen for last_seen, _ in ordered]
+        self._ids = [user_id for _, user_id in ordered]
+        self._position = {user_id: last_seen for last_seen, user_id in ordered}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, user_id):
+        return user_id in self._position
+
+    def _index(self, user_id, last_seen: str) -> int:
+        index = bisect_left(self._times, last_seen)
+        # کاربران هم‌زمان (همان ثانیه) کنار هم هستند و تعدادشان کم است
+        while self._ids[index] != user_id:
+            index += 1
+        return index
+
+    def touch(self, user_id, last_seen: str):
+        """زمان آخرین فعالیت کاربر را ثبت یا جابه‌جا می‌کند."""
+        last_seen = last_seen or ''
+        old = self._position.get(user_id)
+        if old == last_seen:
+            return
+        if old is not None:
+            index = self._index(user_id, old)
+            del self._times[index]
+            del self._ids[index]
+        # فعالیت جدید معمولاً جدیدترین زمان است و به انتهای آرایه اضافه می‌شود
+        index = bisect_right(self._times, last_seen)
+        self._times.insert(index, last_seen)
+        self._ids.insert(index, user_id)
+        self._position[user_id] = last_seen
+
+    def remove(self, user_id):
+        old = self._position.pop(user_id, None)
+        if old is not None:
+            index = self._index(user_id, old)
+            del self._times[index]
+            del self._ids[index]
+
+    def count_since(self, cutoff: str) -> int:
+        """تعداد کاربران با آخرین فعالیت در cutoff یا پس از آن."""
+        return len(self._times) - bisect_left(self._times, cutoff)
+
+    def since(self, cutoff: str) -> list:
+        """شناسه کاربران با آخرین فعالیت در cutoff یا پس از آن (جدیدترین اول)."""
+        start = bisect_left(self._times, cutoff)
+        return self._ids[:start - 1:-1] if start else self._ids[::-1]
+
+    def recent(self, offset: int = 0, limit: int = 10) -> list:
+        """(شناسه، زمان) کاربران به ترتیب جدیدترین فعالیت، از جایگاه offset."""
+        end = len(self._ids) - offset
+        start = max(end - limit, 0)
+        if end <= 0:
+            return []
+        return list(zip(reversed(self._ids[start:end]), reversed(self._times[start:end])))
+
+    def snapshot(self) -> list:
+        """کپی شناسه تمام کاربران به ترتیب جدیدترین فعالیت."""
+        return self._ids[::-1]
+
+    def check(self, expected: dict) -> list:
+        """ناسازگاری‌های شاخص با نگاشت مرجع {شناسه: زمان}؛ لیست خالی یعنی شاخص سالم است."""
+        problems = []
+        if any(self._times[i] > self._times[i + 1] for i in range(len(self._times) - 1)):
+            problems.append("times are not sorted")
+        if len(self._ids) != len(self._position) or len(self._times) != len(self._ids):
+            problems.append(f"size mismatch: {len(self._ids)} ids, {len(self._times)} times, "
+                            f"{len(self._position)} positions")
+        for user_id, last_seen in zip(self._ids, self._times):
+            if self._position.get(user_id) != last_seen:
+                problems.append(f"position of {user_id} does not match")
+                break
+        missing = expected.keys() - self._position.keys()
+        extra = self._position.keys() - expected.keys()
+        if missing:
+            problems.append(f"{len(missing)} users missing from the index")
+        if extra:
+            problems.append(f"{len(extra)} unknown users in the index")
+        stale = sum(1 for user_id, last_seen in expected.items()
+                    if user_id in self._position and self._position[user_id] != (last_seen or ''))
+        if stale:
+            problems.append(f"{stale} users with a stale last_seen")
+        return problems
@@ -0,0 +1,594 @@
+# sharding.py
+
+import os
+import json
+import zlib
+import time
+import contextlib
+import queue
+import signal
+import sqlite3
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections.abc import MutableMapping
+
+import data_manager
+
+# --- تنظیمات ---
+# تعداد فرآیندهای worker (0 یعنی حالت تک فرآیندی معمولی)
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", 0))
+# پیش‌فرض: کنار فایل داده اصلی
+SHARED_DB_FILE = os.environ.get("BOT_SHARED_DB", os.path.join(os.path.dirname(data_manager.DATA_FILE), "bot_shared.db"))
+
+# داده‌های سراسری که در تمام workerها تکرار می‌شوند
+GLOBAL_KEYS = ("banned_users", "blocked_words", "custom_commands", "allowed_domains", "welcome_message",
+               "goodbye_message", "maintenance_mode", "auto_welcome", "auto_goodbye", "link_check_enabled",
+               "anti_spam_enabled", "spam_threshold", "spam_timeframe", "admin_levels", "default_admin_level",
+               "max_admin_level", "scheduled_broadcasts")
+# داده‌های هر کاربر که در ذخیره‌ساز مشترک SQLite نگهداری می‌شوند. شاخص‌های حافظه data_manager
+# (رتبه‌بندی امتیازها، آخرین فعالیت و جستجوی کاربران) در این حالت ساخته نمی‌شوند، چون هر worker فقط
+# تغییرات خودش را می‌بیند؛ /leaderboard، /stats، /users_list و /user_search هر بار کل بخش مشترک را
+# پیمایش می‌کنند (O(n) روی SQLite) و برای تعداد بسیار زیاد کاربران کند هستند
+SHARED_SECTIONS = ("users", "user_points", "user_message_counts", "warnings", "stats", "user_chats",
+                   "ban_restrictions")
+# داده‌های هر گروه که فقط در worker مالک آن گروه نگهداری می‌شوند
+CHAT_SECTIONS = ("group_stats", "group_rules")
+
+UPDATE_CHAT_KEYS = ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member",
+                    "chat_member", "chat_join_request", "message_reaction", "chat_boost")
+WORKER_RESTART_DELAY = 5
+WORKER_START_TIMEOUT = 120
+WORKER_STOP_TIMEOUT = 20
+
+logger = logging.getLogger(__name__)
+
+# اتصال worker به فرآیند front و آخرین مقادیر منتشر شده داده‌های سراسری
+_front_connection = None
+_published_globals = {}
+
+# --- مسیریابی ---
+
+def routing_key(payload: dict) -> int:
+    """شناسه چت آپدیت (یا در نبود چت، شناسه کاربر) که مالک آن را مشخص می‌کند."""
+    for key in UPDATE_CHAT_KEYS:
+        item = payload.get(key)
+        if isinstance(item, dict) and isinstance(item.get("chat"), dict):
+            return item["chat"]["id"]
+    callback_query = payload.get("callback_query")
+    if isinstance(callback_query, dict):
+        message = callback_query.get("message")
+        if isinstance(message, dict) and isinstance(message.get("chat"), dict):
+            return message["chat"]["id"]
+    for item in payload.values():
+        if isinstance(item, dict) and isinstance(item.get("from"), dict):
+            return item["from"]["id"]
+    return payload.get("update_id", 0)
+
+def worker_for(chat_id, workers: int) -> int:
+    """worker مالک یک چت؛ crc32 بین فرآیندها و اجراهای مختلف ثابت است (برخلاف hash پایتون)."""
+    return zlib.crc32(str(chat_id).encode('ascii')) % workers
+
+# --- ذخیره‌ساز مشترک ---
+
+class SharedStore:
+    """ذخیره‌ساز کلید-مقدار روی SQLite با حالت WAL که بین تمام workerها مشترک است."""
+
+    def __init__(self, path: str = SHARED_DB_FILE):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS shared (section TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (section, key)) WITHOUT ROWID"
+        )
+        # هندلرهای ادمین ممکن است داده‌ها را از thread دیگری (asyncio.to_thread) بخوانند
+        self._lock = threading.RLock()
+
+    def execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """تراکنش با قفل نوشتن (BEGIN IMMEDIATE) برای خواندن-تغییر-نوشتن اتمیک بین فرآیندها."""
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def executemany(self, sql: str, rows):
+        with self.transaction():
+            self.connection.executemany(sql, rows)
+
+    def is_empty(self) -> bool:
+        return not self.execute("SELECT 1 FROM shared LIMIT 1")
+
+    def import_sections(self, data: dict):
+        """بخش‌های مشترک را از داده‌های حالت تک فرآیندی به ذخیره‌ساز منتقل می‌کند."""
+        rows = ((section, str(key), json.dumps(value, ensure_ascii=False))
+                for section in SHARED_SECTIONS for key, value in data.get(section, {}).items())
+        self.executemany("INSERT OR REPLACE INTO shared (section, key, value) VALUES (?, ?, ?)", rows)
+
+    def close(self):
+        self.connection.close()
+
+class SharedRecord(dict):
+    """رکورد یک کاربر؛ تغییر هر فیلد مستقیماً (با json_set) در ذخیره‌ساز مشترک ثبت می‌شود."""
+
+    def __init__(self, section: "SharedSection", key: str, value: dict):
+        super().__init__(value)
+        self._section = section
+        self._key = key
+
+    def __setitem__(self, field, value):
+        super().__setitem__(field, value)
+        # فقط همان فیلد نوشته می‌شود تا تغییرات همزمان فیلدهای دیگر در workerهای دیگر از بین نرود
+        self._section.store.execute(
+            "UPDATE shared SET value = json_set(value, ?, json(?)) WHERE section = ? AND key = ?",
+            (f'$."{field}"', json.dumps(value, ensure_ascii=False), self._section.name, self._key)
+        )
+
+    def _write_all(self):
+        self._section[self._key] = dict(self)
+
+    # --- عملیات اتمیک مورد استفاده data_manager.incr / update_in / compare_and_set ---
+
+    def atomic_incr(self, field, amount=1):
+        rows = self._section.store.execute(
+            "UPDATE shared SET value = json_set(value, ?1, coalesce(json_extract(value, ?1), 0) + ?2) "
+            "WHERE section = ?3 AND key = ?4 RETURNING json_extract(value, ?1)",
+            (f'$."{field}"', amount, self._section.name, self._key)
+        )
+        if not rows:
+            raise KeyError(self._key)
+        super().__setitem__(field, rows[0][0])
+        return rows[0][0]
+
+    def atomic_update(self, field, func, default=None):
+        store = self._section.store
+        with store.transaction():
+            rows = store.execute("SELECT value FROM shared WHERE section = ? AND key = ?", (self._section.name, self._key))
+            if not rows:
+                raise KeyError(self._key)
+            value = func(json.loads(rows[0][0]).get(field, default))
+            self[field] = value
+        return value
+
+    def atomic_compare_and_set(self, field, expected, new) -> bool:
+        store = self._section.store
+        with store.transaction():
+            rows = store.execute("SELECT value FROM shared WHERE section = ? AND key = ?", (self._section.name, self._key))
+            if not rows or json.loads(rows[0][0]).get(field) != expected:
+                return False
+            self[field] = new
+        return True
+
+    def __delitem__(self, field):
+        super().__delitem__(field)
+        self._write_all()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._write_all()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._write_all()
+        return value
+
+    def setdefault(self, field, default=None):
+        if field not in self:
+            self[field] = default
+        return self[field]
+
+class SharedSection(MutableMapping):
+    """یک بخش DATA (مثل users) که به جای dict در حافظه، در ذخیره‌ساز مشترک نگهداری می‌شود.
+
+    مقادیر dict به صورت SharedRecord برگردانده می‌شوند تا تغییر فیلدها ذخیره شود؛ مقادیر دیگر
+    (مثل لیست‌ها) باید پس از تغییر دوباره مقداردهی شوند.
+    """
+
+    def __init__(self, store: SharedStore, name: str):
+        self.store = store
+        self.name = name
+
+    def _wrap(self, key: str, raw: str):
+        value = json.loads(raw)
+        return SharedRecord(self, key, value) if isinstance(value, dict) else value
+
+    def __getitem__(self, key):
+        rows = self.store.execute("SELECT value FROM shared WHERE section = ? AND key = ?", (self.name, str(key)))
+        if not rows:
+            raise KeyError(key)
+        return self._wrap(str(key), rows[0][0])
+
+    def __setitem__(self, key, value):
+        self.store.execute(
+            "INSERT INTO shared (section, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (section, key) DO UPDATE SET value = excluded.value",
+            (self.name, str(key), json.dumps(value, ensure_ascii=False))
+        )
+
+    def __delitem__(self, key):
+        if not self.store.execute("DELETE FROM shared WHERE section = ? AND key = ? RETURNING key",
+                                  (self.name, str(key))):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return bool(self.store.execute("SELECT 1 FROM shared WHERE section = ? AND key = ?", (self.name, str(key))))
+
+    def __iter__(self):
+        return iter([row[0] for row in self.store.execute("SELECT key FROM shared WHERE section = ?", (self.name,))])
+
+    def __len__(self):
+        return self.store.execute("SELECT COUNT(*) FROM shared WHERE section = ?", (self.name,))[0][0]
+
+    def items(self):
+        # یک پرس‌وجو به جای یک پرس‌وجو برای هر کلید
+        rows = self.store.execute("SELECT key, value FROM shared WHERE section = ?", (self.name,))
+        return [(key, self._wrap(key, raw)) for key, raw in rows]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def clear(self):
+        self.store.execute("DELETE FROM shared WHERE section = ?", (self.name,))
+
+    def __repr__(self):
+        return f"<SharedSection {self.name} ({len(self)} entries)>"
+
+    def storage_size(self) -> tuple:
+        """(تعداد ورودی‌ها, مجموع بایت‌های کلید و مقدار JSON) این بخش در پایگاه داده SQLite."""
+        rows = self.store.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(key AS BLOB)) + LENGTH(CAST(value AS BLOB))), 0) "
+            "FROM shared WHERE section = ?", (self.name,)
+        )
+        return rows[0][0], rows[0][1]
+
+    # --- عملیات اتمیک مورد استفاده data_manager.incr / update_in / compare_and_set ---
+
+    def atomic_incr(self, key, amount=1):
+        rows = self.store.execute(
+            "INSERT INTO shared (section, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (section, key) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (self.name, str(key), amount)
+        )
+        return json.loads(str(rows[0][0]))
+
+    def atomic_update(self, key, func, default=None):
+        with self.store.transaction():
+            rows = self.store.execute("SELECT value FROM shared WHERE section = ? AND key = ?", (self.name, str(key)))
+            value = func(json.loads(rows[0][0]) if rows else default)
+            self[key] = value
+        return value
+
+    def atomic_compare_and_set(self, key, expected, new) -> bool:
+        with self.store.transaction():
+            rows = self.store.execute("SELECT value FROM shared WHERE section = ? AND key = ?", (self.name, str(key)))
+            if (json.loads(rows[0][0]) if rows else None) != expected:
+                return False
+            self[key] = new
+        return True
+
+def attach_shared_store(store: SharedStore):
+    """بخش‌های مشترک DATA را با نمای ذخیره‌ساز مشترک جایگزین می‌کند."""
+    for section in SHARED_SECTIONS:
+        data_manager.DATA[section] = SharedSection(store, section)
+    data_manager.EXTERNAL_SECTIONS.update(SHARED_SECTIONS)
+    # شاخص‌های ساخته شده از فایل محلی worker ناقص هستند و حافظه را بیهوده اشغال می‌کنند
+    data_manager.rebuild_indexes()
+
+# --- تکرار داده‌های سراسری ---
+
+def _global_snapshot() -> dict:
+    snapshot = {}
+    for key in GLOBAL_KEYS:
+        value = data_manager.DATA.get(key)
+        if key == "banned_users":
+            value = sorted(value or ())
+        snapshot[key] = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return snapshot
+
+def publish_global_changes():
+    """پس از هر ذخیره، داده‌های سراسری تغییر کرده را برای front (و از آنجا سایر workerها) می‌فرستد."""
+    global _published_globals
+    if _front_connection is None:
+        return
+    snapshot = _global_snapshot()
+    changed = {key: json.loads(value) for key, value in snapshot.items() if _published_globals.get(key) != value}
+    _published_globals = snapshot
+    if changed:
+        _front_connection.send(("globals", changed))
+
+def apply_global_changes(changes: dict):
+    """تغییرات داده‌های سراسری دریافت شده از worker دیگر را اعمال و ذخیره می‌کند."""
+    global _published_globals
+    for key, value in changes.items():
+        data_manager.set_in(key, set(value) if key == "banned_users" else value)
+    _published_globals = _global_snapshot()
+    data_manager.save_data()
+
+# --- فرآیند worker ---
+
+def _worker_main(index: int, workers: int, connection, token: str):
+    """نقطه شروع فرآیند worker؛ مسیر فایل داده و لاگ از قبل در متغیرهای محیطی تنظیم شده است."""
+    global _front_connection, _published_globals
+    import main
+
+    store = SharedStore(SHARED_DB_FILE)
+    attach_shared_store(store)
+    _front_connection = connection
+    _published_globals = _global_snapshot()
+    data_manager.SAVE_HOOKS.append(publish_global_changes)
+    try:
+        asyncio.run(_run_worker(main, index, connection, token))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+async def _run_worker(main, index: int, connection, token: str):
+    from telegram import Update
+
+    application = main.build_application(token)
+    # ارسال‌های برنامه‌ریزی شده فقط در یک worker اجرا می‌شوند تا تکراری نشوند
+    if index != 0:
+        for job in application.job_queue.get_jobs_by_name("process_scheduled_broadcasts"):
+            job.schedule_removal()
+
+    # توقف با پیام stop از طرف front انجام می‌شود
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: None)
+
+    inbox = asyncio.Queue()
+
+    def drain():
+        try:
+            while connection.poll():
+                inbox.put_nowait(connection.recv())
+        except (EOFError, OSError):
+            inbox.put_nowait(("stop", None))
+            loop.remove_reader(connection.fileno())
+
+    await application.initialize()
+    await main.post_init(application)
+    await application.start()
+    loop.add_reader(connection.fileno(), drain)
+    connection.send(("ready", None))
+    logger.info(f"Worker {index} started (pid {os.getpid()}).")
+
+    try:
+        while True:
+            kind, payload = await inbox.get()
+            if kind == "update":
+                await application.update_queue.put(Update.de_json(payload, application.bot))
+            elif kind == "globals":
+                apply_global_changes(payload)
+            elif kind == "stop":
+                break
+    finally:
+        try:
+            loop.remove_reader(connection.fileno())
+        except (ValueError, OSError):
+            pass
+        await application.stop()
+        await main.post_shutdown(application)
+        await application.shutdown()
+        logger.info(f"Worker {index} stopped.")
+
+# --- فرآیند front ---
+
+def _worker_file(path: str, index: int) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{index}{ext}"
+
+def prepare_worker_data(workers: int):
+    """در اولین اجرای حالت چند فرآیندی، داده‌های فعلی را بین ذخیره‌ساز مشترک و فایل هر worker تقسیم می‌کند."""
+    store = SharedStore(SHARED_DB_FILE)
+    try:
+        if store.is_empty():
+            store.import_sections(data_manager.DATA)
+            logger.info(f"Imported shared sections into {SHARED_DB_FILE}.")
+    finally:
+        store.close()
+
+    base = {key: value for key, value in data_manager.DATA.items() if key not in SHARED_SECTIONS}
+    base['banned_users'] = list(data_manager.DATA['banned_users'])
+    for index in range(workers):
+        path = _worker_file(data_manager.DATA_FILE, index)
+        if os.path.exists(path):
+            continue
+        worker_data = dict(base)
+        for section in CHAT_SECTIONS:
+            worker_data[section] = {chat_id: value for chat_id, value in data_manager.DATA.get(section, {}).items()
+                                    if worker_for(chat_id, workers) == index}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(worker_data, f, indent=4, ensure_ascii=False)
+
+class Front:
+    """فرآیند front: وب‌هوک را دریافت کرده و هر آپدیت را بر اساس چت به worker مالک می‌فرستد."""
+
+    def __init__(self, token: str, workers: int):
+        self.token = token
+        self.workers = workers
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = [None] * workers
+        self.connections = [None] * workers
+        self.outboxes = [None] * workers
+        self.stopping = False
+        self.routed = [0] * workers
+        self.ready = [asyncio.Event() for _ in range(workers)]
+
+    def start_worker(self, index: int):
+        parent, child = self.context.Pipe()
+        metrics_port = int(os.environ.get("METRICS_PORT", 0))
+        overrides = {
+            "BOT_DATA_FILE": _worker_file(data_manager.DATA_FILE, index),
+            "BOT_LOG_FILE": _worker_file(data_manager.LOG_FILE, index),
+            "METRICS_PORT": str(metrics_port + 1 + index if metrics_port else 0),
+        }
+        # فرآیند spawn محیط را هنگام شروع کپی می‌کند
+        previous = {key: os.environ.get(key) for key in overrides}
+        os.environ.update(overrides)
+        try:
+            process = self.context.Process(target=_worker_main, args=(index, self.workers, child, self.token),
+                                           name=f"bot-worker-{index}")
+            process.start()
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        child.close()
+        self.processes[index] = process
+        self.connections[index] = parent
+        self.ready[index].clear()
+        # ارسال در thread جداگانه انجام می‌شود تا پر شدن pipe یک worker کند، پاسخ وب‌هوک را متوقف نکند
+        self.outboxes[index] = queue.SimpleQueue()
+        threading.Thread(target=self._send_loop, args=(parent, self.outboxes[index]),
+                         name=f"bot-worker-{index}-sender", daemon=True).start()
+        asyncio.get_running_loop().add_reader(parent.fileno(), self._drain_worker, index)
+        logger.info(f"Started worker {index} (pid {process.pid}).")
+
+    @staticmethod
+    def _send_loop(connection, outbox: queue.SimpleQueue):
+        while True:
+            item = outbox.get()
+            if item is None:
+                break
+            try:
+                connection.send(item)
+            except (BrokenPipeError, OSError):
+                break
+
+    def send(self, index: int, item: tuple):
+        if self.outboxes[index] is not None:
+            self.outboxes[index].put(item)
+
+    def _drain_worker(self, index: int):
+        connection = self.connections[index]
+        try:
+            while connection.poll():
+                kind, payload = connection.recv()
+                if kind == "ready":
+                    self.ready[index].set()
+                elif kind == "globals":
+                    for other in range(self.workers):
+                        if other != index:
+                            self.send(other, ("globals", payload))
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(connection.fileno())
+            self.connections[index] = None
+
+    def route(self, payload: dict):
+        index = worker_for(routing_key(payload), self.workers)
+        if self.connections[index] is None:
+            logger.warning(f"Worker {index} is down; dropping update {payload.get('update_id')}.")
+            return
+        self.send(index, ("update", payload))
+        self.routed[index] += 1
+
+    async def watch_workers(self):
+        """workerهایی که به صورت غیرمنتظره متوقف شده‌اند را دوباره راه‌اندازی می‌کند."""
+        while not self.stopping:
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+            for index, process in enumerate(self.processes):
+                if not self.stopping and process is not None and not process.is_alive():
+                    logger.error(f"Worker {index} exited with code {process.exitcode}; restarting.")
+                    if self.connections[index] is not None:
+                        try:
+                            asyncio.get_running_loop().remove_reader(self.connections[index].fileno())
+                        except (ValueError, OSError):
+                            pass
+                        self.connections[index].close()
+                    self.send(index, None)
+                    self.start_worker(index)
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, url_path: str):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) > 1 and parts[0] == "POST" and parts[1].split('?', 1)[0] == f"/{url_path}":
+                    try:
+                        self.route(json.loads(body))
+                        status = "200 OK"
+                    except (ValueError, TypeError) as e:
+                        logger.warning(f"Invalid webhook payload: {e}")
+                        status = "400 Bad Request"
+                else:
+                    status = "404 Not Found"
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: keep-alive\r\n\r\n".encode('latin-1'))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def stop_workers(self):
+        self.stopping = True
+        for index in range(self.workers):
+            self.send(index, ("stop", None))
+            self.send(index, None)
+        deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop in time; terminating.")
+                process.terminate()
+                await asyncio.to_thread(process.join, 5)
+
+async def _run_front(bot, workers: int, listen: str, port: int, webhook_url: str, url_path: str):
+    front = Front(bot.token, workers)
+    prepare_worker_data(workers)
+    for index in range(workers):
+        front.start_worker(index)
+    # وب‌هوک فقط پس از آماده شدن تمام workerها ثبت می‌شود تا آپدیت‌ها پشت فرآیندهای در حال شروع جمع نشوند
+    await asyncio.wait_for(asyncio.gather(*(event.wait() for event in front.ready)), WORKER_START_TIMEOUT)
+
+    server = await asyncio.start_server(lambda r, w: front.handle_http(r, w, url_path), host=listen, port=port)
+    await bot.initialize()
+    await bot.set_webhook(url=webhook_url)
+    logger.info(f"Front listening on {listen}:{port}/{url_path} with {workers} workers.")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    watcher = asyncio.create_task(front.watch_workers())
+
+    await stop.wait()
+    logger.info(f"Stopping front; updates routed per worker: {front.routed}")
+    watcher.cancel()
+    server.close()
+    await server.wait_closed()
+    await front.stop_workers()
+    await bot.shutdown()
+
+def run_front(bot, workers: int, listen: str, port: int, webhook_url: str, url_path: str = "webhook"):
+    """حالت چند فرآیندی: front وب‌هوک را دریافت و آپدیت هر چت را همیشه به یک worker ثابت ارسال می‌کند."""
+    asyncio.run(_run_front(bot, workers, listen, port, webhook_url, url_path))
@@ -0,0 +1,98 @@
+# update_dedupe.py
+
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler, ApplicationHandlerStop
+
+import data_manager
+import metrics
+
+# --- تنظیمات ---
+# تعداد و مدت نگهداری شناسه آپدیت‌های پردازش شده
+DEDUPE_MAX_ENTRIES = int(os.environ.get("DEDUPE_MAX_ENTRIES", 20000))
+DEDUPE_TTL = int(os.environ.get("DEDUPE_TTL", 3600))
+# فایل نگهداری شناسه‌ها بین راه‌اندازی‌های مجدد (کنار فایل داده؛ در حالت چند فرآیندی برای هر worker جدا)
+DEDUPE_FILE = os.environ.get("DEDUPE_FILE", os.path.splitext(data_manager.DATA_FILE)[0] + ".dedupe.json")
+DEDUPE_SAVE_INTERVAL = int(os.environ.get("DEDUPE_SAVE_INTERVAL", 30))
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_UPDATES = metrics.Counter("bot_duplicate_updates_total", "Redelivered updates dropped before any handler")
+
+class UpdateDedupe:
+    """مجموعه شناسه آپدیت‌های اخیر با محدودیت تعداد (LRU) و زمان (TTL)."""
+
+    def __init__(self, max_entries: int = DEDUPE_MAX_ENTRIES, ttl: float = DEDUPE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # update_id -> زمان دریافت؛ ترتیب درج همان ترتیب زمانی است
+        self._seen = OrderedDict()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def _expire(self, now: float):
+        cutoff = now - self.ttl
+        while self._seen and next(iter(self._seen.values())) < cutoff:
+            self._seen.popitem(last=False)
+
+    def check_and_add(self, update_id: int, now: float = None) -> bool:
+        """True اگر آپدیت قبلاً دیده شده باشد؛ در غیر این صورت آن را ثبت می‌کند."""
+        now = time.time() if now is None else now
+        self._expire(now)
+        if update_id in self._seen:
+            return True
+        self._seen[update_id] = now
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return False
+
+    def load(self, path: str):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read dedupe file {path}: {e}")
+            return
+        for update_id, seen_at in entries:
+            self._seen[update_id] = seen_at
+        self._expire(time.time())
+        logger.info(f"Loaded {len(self._seen)} recent update ids from {path}.")
+
+    def save(self, path: str):
+        self._expire(time.time())
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self._seen.items()), f)
+        os.replace(temp_path, path)
+
+DEDUPE = UpdateDedupe()
+
+async def drop_duplicate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """آپدیت تکراری (ارسال مجدد وب‌هوک توسط تلگرام) را قبل از تمام هندلرها متوقف می‌کند."""
+    if DEDUPE.check_and_add(update.update_id):
+        DUPLICATE_UPDATES.inc()
+        logger.info(f"Dropped duplicate update {update.update_id}.")
+        raise ApplicationHandlerStop
+
+def save_dedupe():
+    try:
+        DEDUPE.save(DEDUPE_FILE)
+    except OSError as e:
+        logger.error(f"Could not save dedupe file {DEDUPE_FILE}: {e}")
+
+async def _save_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    save_dedupe()
+
+def install(application):
+    """فیلتر آپدیت‌های تکراری را در اولین گروه هندلرها ثبت و شناسه‌های ذخیره شده را بارگذاری می‌کند."""
+    DEDUPE.load(DEDUPE_FILE)
+    application.add_handler(TypeHandler(Update, drop_duplicate), group=-102)
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(_save_job, interval=DEDUPE_SAVE_INTERVAL, first=DEDUPE_SAVE_INTERVAL)
@@ -0,0 +1,144 @@
+# update_processor.py
+
+import os
+import time
+import heapq
+import asyncio
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+# --- تنظیمات ---
+# حداکثر آپدیت‌های در حال پردازش همزمان (مانند پیش‌فرض concurrent_updates(True))
+MAX_CONCURRENT_UPDATES = int(os.environ.get("MAX_CONCURRENT_UPDATES", 256))
+# کلید ترتیب: chat (پیش‌فرض)، user یا chat_user (هر کاربر در هر چت)
+UPDATE_ORDERING = os.environ.get("UPDATE_ORDERING", "chat")
+# تعداد چت‌های با بیشترین صف که در /metrics نمایش داده می‌شوند
+QUEUE_DEPTH_TOP_CHATS = int(os.environ.get("QUEUE_DEPTH_TOP_CHATS", 10))
+# حداکثر آپدیت‌های پذیرفته شده (در حال اجرا یا منتظر در صف چت‌ها) قبل از توقف دریافت از صف ورودی
+MAX_PENDING_UPDATES = int(os.environ.get("MAX_PENDING_UPDATES", 4 * MAX_CONCURRENT_UPDATES))
+
+# پردازشگر فعال برای متریک‌ها
+_processor = None
+
+def _deepest_chats():
+    if _processor is None:
+        return {}
+    deepest = heapq.nlargest(QUEUE_DEPTH_TOP_CHATS, _processor.lanes.items(), key=lambda item: item[1].depth)
+    return {(str(key),): lane.depth for key, lane in deepest}
+
+def _lane_totals():
+    if _processor is None:
+        return {}
+    return {(): len(_processor.lanes)}
+
+def _queued_updates():
+    if _processor is None:
+        return {}
+    return {(): sum(lane.depth for lane in _processor.lanes.values())}
+
+CHAT_QUEUE_DEPTH = metrics.Gauge("bot_chat_queue_depth", "Updates queued or running for the deepest chats",
+                                 ("chat",), callback=_deepest_chats)
+CHAT_LANES = metrics.Gauge("bot_chat_lanes", "Chats with queued or running updates", callback=_lane_totals)
+QUEUED_UPDATES = metrics.Gauge("bot_ordered_updates", "Updates queued or running in per-chat lanes",
+                               callback=_queued_updates)
+CHAT_QUEUE_WAIT = metrics.Histogram("bot_chat_queue_wait_seconds",
+                                    "Time an update waited behind earlier updates of the same chat")
+
+class _Lane:
+    """صف یک چت؛ asyncio.Lock منتظرها را به ترتیب ورود (FIFO) بیدار می‌کند."""
+
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """آپدیت‌های هر چت را به ترتیب و یکی یکی، و آپدیت‌های چت‌های مختلف را همزمان پردازش می‌کند.
+
+    قفل چت قبل از سمافور همزمانی گرفته می‌شود تا آپدیت‌های منتظر یک چت شلوغ، ظرفیت پردازش
+    چت‌های دیگر را اشغال نکنند.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES, ordering: str = UPDATE_ORDERING,
+                 max_pending_updates: int = MAX_PENDING_UPDATES):
+        super().__init__(max_concurrent_updates)
+        if ordering not in ("chat", "user", "chat_user"):
+            raise ValueError(f"Unknown update ordering: {ordering}")
+        self.ordering = ordering
+        self.max_pending_updates = max(max_pending_updates, max_concurrent_updates)
+        self.lanes = {}
+        # آپدیت‌های برداشته شده از صف ورودی که پردازششان تمام نشده (در حال اجرا یا منتظر قفل چت)
+        self.pending = 0
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+
+    def has_capacity(self) -> bool:
+        return self.pending < self.max_pending_updates
+
+    def admit(self) -> None:
+        """جای آپدیت را هنگام برداشتن از صف ورودی رزرو می‌کند؛ PTB قبل از شروع task به صف برمی‌گردد و
+        شمارش در process_update برای محدود کردن برداشت از صف دیر است."""
+        self.pending += 1
+
+    async def wait_for_capacity(self) -> None:
+        """تا زمانی که جای خالی برای اجرای آپدیت جدید باشد صبر می‌کند (برای صف ورودی)."""
+        while not self.has_capacity():
+            self._capacity.clear()
+            await self._capacity.wait()
+
+    def ordering_key(self, update: object):
+        """کلید صف آپدیت؛ None یعنی آپدیت بدون ترتیب پردازش می‌شود."""
+        if not isinstance(update, Update):
+            return None
+        chat, user = update.effective_chat, update.effective_user
+        if self.ordering == "user":
+            return user.id if user else (chat.id if chat else None)
+        if self.ordering == "chat_user" and chat and user:
+            return (chat.id, user.id)
+        return chat.id if chat else (user.id if user else None)
+
+    async def process_update(self, update: object, coroutine) -> None:
+        try:
+            await self._process_in_order(update, coroutine)
+        finally:
+            # فقط آپدیت‌ها هنگام برداشتن از صف ورودی (PriorityUpdateQueue.get) پذیرفته می‌شوند
+            if isinstance(update, Update):
+                self.pending -= 1
+                if self.has_capacity():
+                    self._capacity.set()
+
+    async def _process_in_order(self, update: object, coroutine) -> None:
+        key = self.ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = _Lane()
+        lane.depth += 1
+        start = time.perf_counter()
+        try:
+            async with lane.lock:
+                CHAT_QUEUE_WAIT.observe(time.perf_counter() - start)
+                await super().process_update(update, coroutine)
+        finally:
+            lane.depth -= 1
+            # صف خالی حذف می‌شود تا تعداد قفل‌ها با تعداد چت‌ها رشد نکند
+            if not lane.depth:
+                del self.lanes[key]
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        global _processor
+        _processor = self
+
+    async def shutdown(self) -> None:
+        global _processor
+        if _processor is self:
+            _processor = None
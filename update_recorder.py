@@ -0,0 +1,135 @@
+# update_recorder.py
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler
+
+import log_utils
+
+# --- تنظیمات ---
+# ضبط آپدیت‌ها فقط در صورت تنظیم مسیر فایل فعال است
+RECORD_FILE = os.environ.get("UPDATE_RECORD_FILE", "")
+# شناسه‌ها: keep یا hash — متن‌ها: keep، hash (حفظ طول و تکرار کلمات) یا redact
+RECORD_IDS = os.environ.get("UPDATE_RECORD_IDS", "hash")
+RECORD_TEXT = os.environ.get("UPDATE_RECORD_TEXT", "hash")
+RECORD_SALT = os.environ.get("UPDATE_RECORD_SALT", "")
+RECORD_MAX_BYTES = int(os.environ.get("UPDATE_RECORD_MAX_BYTES", 50 * 1024 * 1024))
+RECORD_BACKUP_COUNT = int(os.environ.get("UPDATE_RECORD_BACKUP_COUNT", 10))
+
+# فیلدهای متنی که محتوای کاربر را دارند
+TEXT_KEYS = {"text", "caption", "first_name", "last_name", "username", "title", "description", "bio", "quote"}
+# اشیایی که فیلد id آن‌ها شناسه کاربر یا گروه است
+ID_OWNER_KEYS = {"from", "chat", "user", "sender_chat", "new_chat_members", "left_chat_member",
+                 "forward_from", "forward_from_chat", "via_bot"}
+ID_KEYS = {"user_id", "chat_id"}
+
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+
+logger = logging.getLogger(__name__)
+
+_record_logger = logging.getLogger("update_recorder.records")
+_record_logger.propagate = False
+_listener = None
+
+# --- ناشناس‌سازی ---
+
+def _digest(value: str) -> bytes:
+    return hashlib.sha256((RECORD_SALT + value).encode('utf-8')).digest()
+
+def hash_id(value: int) -> int:
+    """شناسه را به یک عدد ثابت و غیرقابل برگشت با همان علامت تبدیل می‌کند."""
+    hashed = int.from_bytes(_digest(str(abs(value)))[:5], 'big') + 1
+    return -hashed if value < 0 else hashed
+
+def _utf16_length(token: str) -> int:
+    # آفست entityهای تلگرام بر اساس UTF-16 است؛ طول توکن جایگزین باید برابر بماند
+    return len(token.encode('utf-16-le')) // 2
+
+def _hash_token(token: str) -> str:
+    length = _utf16_length(token)
+    digest = _digest(token)
+    while len(digest) < length:
+        digest += hashlib.sha256(digest).digest()
+    return "".join(_ALPHABET[b % len(_ALPHABET)] for b in digest[:length])
+
+def anonymize_text(text: str, mode: str = RECORD_TEXT) -> str:
+    """کلمات متن را hash یا حذف می‌کند؛ دستورات ربات و پیشوند لینک‌ها حفظ می‌شوند تا مسیر هندلرها تغییر نکند."""
+    if mode == "keep" or not text:
+        return text
+    tokens = text.split(" ")
+    for i, token in enumerate(tokens):
+        if not token or token.startswith("/"):
+            continue
+        prefix = ""
+        for scheme in ("https://", "http://"):
+            if token.startswith(scheme):
+                prefix, token = scheme, token[len(scheme):]
+                break
+        replaced = _hash_token(token) if mode == "hash" else "x" * _utf16_length(token)
+        tokens[i] = prefix + replaced
+    return " ".join(tokens)
+
+def anonymize(value, ids: str = RECORD_IDS, text: str = RECORD_TEXT, id_owner: bool = False):
+    """دیکشنری آپدیت را به صورت بازگشتی ناشناس می‌کند."""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if ids == "hash" and isinstance(item, int) and not isinstance(item, bool) and (
+                    (key == "id" and id_owner) or key in ID_KEYS):
+                result[key] = hash_id(item)
+            elif key in TEXT_KEYS and isinstance(item, str):
+                result[key] = anonymize_text(item, text)
+            else:
+                result[key] = anonymize(item, ids, text, key in ID_OWNER_KEYS)
+        return result
+    if isinstance(value, list):
+        return [anonymize(item, ids, text, id_owner) for item in value]
+    return value
+
+# --- ضبط ---
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """آپدیت خام را (پس از ناشناس‌سازی) در فایل JSONL ضبط می‌کند؛ نوشتن در thread لاگینگ انجام می‌شود."""
+    try:
+        data = update.to_dict()
+        if RECORD_IDS != "keep" or RECORD_TEXT != "keep":
+            data = anonymize(data)
+        _record_logger.info(json.dumps({"t": round(time.time(), 3), "update": data}, ensure_ascii=False))
+    except Exception as e:
+        logger.warning(f"Failed to record update {update.update_id}: {e}")
+
+def start_recording(path: str = RECORD_FILE):
+    """فایل ضبط را با چرخش و فشرده‌سازی، مشابه فایل لاگ ربات، آماده می‌کند (بدون ایندکس زمانی لاگ‌ها)."""
+    global _listener
+    if _listener is not None:
+        return
+    file_handler = log_utils.CompressedRotatingFileHandler(path, maxBytes=RECORD_MAX_BYTES,
+                                                           backupCount=RECORD_BACKUP_COUNT, index=False)
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    record_queue = queue.SimpleQueue()
+    _record_logger.addHandler(QueueHandler(record_queue))
+    _record_logger.setLevel(logging.INFO)
+    _listener = QueueListener(record_queue, file_handler)
+    _listener.start()
+    atexit.register(stop_recording)
+    logger.info(f"Recording updates to {path} (ids={RECORD_IDS}, text={RECORD_TEXT}).")
+
+def stop_recording():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def install(application):
+    """در صورت فعال بودن، ضبط کننده را قبل از تمام هندلرها ثبت می‌کند."""
+    if not RECORD_FILE:
+        return
+    start_recording(RECORD_FILE)
+    application.add_handler(TypeHandler(Update, record_update), group=-101)
@@ -0,0 +1,181 @@
+# user_search.py
+
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+
+# حروف عربی معادل فارسی، ارقام فارسی/عربی و نیم‌فاصله
+_CHAR_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا', 'ؤ': 'و',
+    **{chr(0x06F0 + d): str(d) for d in range(10)},
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    '\u200c': ' ', '\u200d': '', '\u0640': '', '\x00': '',
+})
+# اعراب (فتحه، کسره، تنوین، تشدید، سکون و ...)
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+_SPACES = re.compile(r'\s+')
+_PREFIX_END = '\U0010ffff'
+# کلیدها پس از normalize هیچ‌گاه این نویسه را ندارند
+_SEPARATOR = '\x00'
+
+def normalize(text: str) -> str:
+    """متن برای جستجو: حروف کوچک، یکسان‌سازی ی/ک عربی و فارسی، حذف اعراب و کشیده، ارقام لاتین."""
+    if not text:
+        return ''
+    if text.isascii():
+        normalized = ' '.join(text.replace(_SEPARATOR, '').lower().split())
+    else:
+        normalized = unicodedata.normalize('NFKC', text).translate(_CHAR_MAP)
+        normalized = _SPACES.sub(' ', _DIACRITICS.sub('', normalized).casefold()).strip()
+    # متن بدون تغییر همان شیء اصلی (مشترک با DATA) را برمی‌گرداند تا حافظه دو برابر نشود
+    return text if normalized == text else normalized
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class _SortedKeys:
+    """آرایه مرتب «کلید + جداکننده + شناسه» برای جستجوی پیشوندی با bisect؛ جایگزین کم‌حافظه درخت
+    پیشوندی (trie). شناسه در خود کلید است تا جایگاه هر ورودی (حتی با کلیدهای تکراری) مستقیم پیدا شود."""
+
+    __slots__ = ("keys",)
+
+    def __init__(self, pairs=()):
+        self.keys = sorted(f"{key}{_SEPARATOR}{user_id}" for key, user_id in pairs)
+
+    def add(self, key: str, user_id):
+        insort(self.keys, f"{key}{_SEPARATOR}{user_id}")
+
+    def remove(self, key: str, user_id):
+        entry = f"{key}{_SEPARATOR}{user_id}"
+        index = bisect_left(self.keys, entry)
+        if index < len(self.keys) and self.keys[index] == entry:
+            del self.keys[index]
+
+    def prefix(self, prefix: str):
+        """شناسه‌های کلیدهای با این پیشوند به ترتیب کلید (به تدریج، تا خواندن نتایج محدود متوقف شود)."""
+        keys = self.keys
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + _PREFIX_END, start)
+        for index in range(start, end):
+            entry = keys[index]
+            yield entry[entry.rindex(_SEPARATOR) + 1:]
+
+class UserSearchIndex:
+    """شاخص جستجوی کاربران: پیشوند نام کاربری، پیشوند کلمات نام و trigram برای جستجوی بخشی از متن.
+
+    نتایج به ترتیب اولویت: شناسه عددی، پیشوند نام کاربری، کلمه‌ای از نام که با عبارت شروع می‌شود، و
+    وجود عبارت در هر جای نام یا نام کاربری (برای عبارت‌های حداقل سه حرفی). فهرست trigramها آرایه‌ای از
+    شماره‌های فشرده کاربران است و فقط اضافه می‌شود؛ ورودی‌های کهنه (پس از تغییر نام) هنگام جستجو با
+    بررسی مستقیم متن رد می‌شوند و با زیاد شدنشان فهرست از نو ساخته می‌شود.
+    """
+
+    def __init__(self, users=()):
+        self._entries = {}
+        self._slots = {}
+        self._slot_ids = []
+        self._trigrams = {}
+        self._stale = 0
+        usernames, tokens = [], []
+        for user_id, first_name, username in users:
+            name, username = self._entries[user_id] = (normalize(first_name), normalize(username).lstrip('@'))
+            if username:
+                usernames.append((username, user_id))
+            tokens.extend((token, user_id) for token in set(name.split()))
+            self._index_trigrams(user_id, name, username)
+        self._usernames = _SortedKeys(usernames)
+        self._tokens = _SortedKeys(tokens)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def _index_trigrams(self, user_id, name: str, username: str):
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._slots[user_id] = len(self._slot_ids)
+            self._slot_ids.append(user_id)
+        trigrams = self._trigrams
+        for trigram in _trigrams(name) | _trigrams(username):
+            postings = trigrams.get(trigram)
+            if postings is None:
+                postings = trigrams[trigram] = array('i')
+            postings.append(slot)
+
+    def _compact(self):
+        """فهرست trigramها را فقط از روی کاربران فعلی از نو می‌سازد."""
+        self._slots, self._slot_ids, self._trigrams, self._stale = {}, [], {}, 0
+        for user_id, (name, username) in self._entries.items():
+            self._index_trigrams(user_id, name, username)
+
+    def add(self, user_id, first_name: str, username: str):
+        """کاربر جدید را اضافه یا نام‌های کاربر موجود را جایگزین می‌کند."""
+        entry = (normalize(first_name), normalize(username).lstrip('@'))
+        if self._entries.get(user_id) == entry:
+            return
+        self.remove(user_id)
+        self._entries[user_id] = entry
+        name, username = entry
+        if username:
+            self._usernames.add(username, user_id)
+        for token in set(name.split()):
+            self._tokens.add(token, user_id)
+        self._index_trigrams(user_id, name, username)
+
+    def remove(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        name, username = entry
+        if username:
+            self._usernames.remove(username, user_id)
+        for token in set(name.split()):
+            self._tokens.remove(token, user_id)
+        self._stale += len(_trigrams(name) | _trigrams(username))
+        if self._stale > 1000 and self._stale > len(self._entries):
+            self._compact()
+
+    def search(self, query: str, limit: int = 1000) -> list:
+        """شناسه کاربران منطبق به ترتیب اولویت (حداکثر limit نتیجه)؛ عبارت عددی شناسه کاربر هم هست."""
+        query = normalize(query).lstrip('@')
+        results, seen = [], set()
+
+        def collect(user_ids, matches=None) -> bool:
+            for user_id in user_ids:
+                if user_id in seen or (matches is not None and not matches(user_id)):
+                    continue
+                seen.add(user_id)
+                results.append(user_id)
+                if len(results) >= limit:
+                    return True
+            return False
+
+        if not query:
+            return results
+        if query.isdigit() and query in self._entries:
+            collect([query])
+        # عبارت چند کلمه‌ای فقط از مسیر trigram (کم‌تکرارترین trigram) پیدا می‌شود
+        if ' ' not in query:
+            if collect(self._usernames.prefix(query)) or collect(self._tokens.prefix(query)):
+                return results
+        if len(query) < 3:
+            return results
+
+        # کم‌تکرارترین trigram کاندیداها را می‌دهد و بقیه با بررسی مستقیم متن تأیید می‌شوند
+        postings = [self._trigrams.get(trigram) for trigram in _trigrams(query)]
+        if not all(postings):
+            return results
+        entries, slot_ids = self._entries, self._slot_ids
+
+        def matches(user_id) -> bool:
+            entry = entries.get(user_id)
+            return entry is not None and (query in entry[0] or query in entry[1])
+
+        start = len(results)
+        collect((slot_ids[slot] for slot in min(postings, key=len)), matches)
+        # نام‌هایی که با عبارت شروع می‌شوند جلوتر هستند
+        results[start:] = sorted(results[start:], key=lambda user_id: (not entries[user_id][0].startswith(query),
+                                                                        entries[user_id]))
+        return results